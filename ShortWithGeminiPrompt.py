@@ -3,50 +3,45 @@ from tkinter import ttk, messagebox, filedialog
 import json
 import os
 import webbrowser
-import time
-import pandas as pd
+import threading
+import math
 #import yt_dlp
 #from datetime import datetime, UTC, timedelta
-from datetime import datetime, timedelta, timezone
-from googleapiclient.discovery import build
+from datetime import timezone
 #from google import genai  # 新增：Gemini SDK
 import pyperclip
 import sys
-import requests
-import re
+from yt_search import parse_keywords
+from quota import QuotaLedger, plan_queries
+import trends
+import version_check
+import media_prep
+import video_analysis
+import analysis_pipeline
+import job_manager
+import perf_metrics
+import resilience
+import trend_service
 
-def get_display_version():
-    """從 GitHub 抓取最新版本號"""
-    try:
-        response = requests.get("https://raw.githubusercontent.com/foreverjacky79/ShortsAI/refs/heads/main/version.txt", timeout=5)
-        response.raise_for_status()  # 檢查 HTTP 錯誤
-        return response.text.strip()
-    except Exception:
-        return "1.0.3"  # 離線時用預設版本
-
-DISPLAY_VERSION = get_display_version()
 LOCAL_VERSION = "1.0.7"
-UPDATE_URL = "https://raw.githubusercontent.com/foreverjacky79/ShortsAI/refs/heads/main/version.txt"
+# 啟動時只讀本機快取的版本號，不等網路（背景抓到後再更新標題）
+DISPLAY_VERSION = version_check.cached_version(LOCAL_VERSION)
+version_check.latest_version_async()
+UPDATE_URL = version_check.VERSION_URL
 CODE_URL = "https://raw.githubusercontent.com/foreverjacky79/ShortsAI/refs/heads/main/ShortWithGeminiPrompt.py"
 
-def parse_duration_to_seconds(duration_str):
-    """ 將 YouTube 的 PT1M5S 格式轉換為總秒數 """
-    hours = re.search(r'(\d+)H', duration_str)
-    minutes = re.search(r'(\d+)M', duration_str)
-    seconds = re.search(r'(\d+)S', duration_str)
-    
-    h = int(hours.group(1)) if hours else 0
-    m = int(minutes.group(1)) if minutes else 0
-    s = int(seconds.group(1)) if seconds else 0
-    
-    return h * 3600 + m * 60 + s
-
-def check_for_updates():
+def check_for_updates(future=None):
+    """ 在背景抓版本號，抓完後回到主執行緒更新標題並詢問是否更新（與標題共用同一次抓取） """
+    future = future or version_check.latest_version_async()
+    if not future.done():
+        root.after(200, lambda: check_for_updates(future))
+        return
+    latest_version = future.result()
+    if not latest_version:
+        return
+    root.title(f"YouTube Shorts 趨勢與 AI 影片分析工具 v{latest_version}")
     try:
-        response = requests.get(UPDATE_URL, timeout=5)
-        latest_version = response.text.strip()
-
-        if latest_version > LOCAL_VERSION:
+        if version_check.is_newer(latest_version, LOCAL_VERSION):
             answer = messagebox.askyesno("發現更新", 
                 f"偵測到新版本 {latest_version}！\n\n"
                 f"請前往 GitHub 下載最新版：\n"
@@ -75,130 +70,33 @@ except ImportError:
 # ========================
 # Core Logic: YouTube Fetcher
 # ========================
-def fetch_trending_shorts(api_key, keyword, days, min_views, min_subs, max_results, min_viral_score, max_duration):
-    youtube = build("youtube", "v3", developerKey=api_key)
-    published_after = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
-
-    search_response = youtube.search().list(
-        q=keyword, part="id", type="video", order="viewCount",
-        maxResults=max_results, publishedAfter=published_after
-    ).execute()
-
-    video_ids = [item["id"]["videoId"] for item in search_response["items"]]
-    if not video_ids: return []
-
-    video_response = youtube.videos().list(
-        part="snippet,statistics,contentDetails", id=",".join(video_ids)
-    ).execute()
-
-    results = []
-    for item in video_response["items"]:
-        # 1. 先抓取內容時長並過濾
-        duration_raw = item["contentDetails"]["duration"]
-        total_seconds = parse_duration_to_seconds(duration_raw)
-        
-        if total_seconds > max_duration: 
-            continue
-
-        # 2. 定義基本變數 (必須在 append 之前定義！)
-        stats = item["statistics"]
-        snippet = item["snippet"]
-        views = int(stats.get("viewCount", 0))
-        
-        # 3. 觀看數過濾
-        if views < min_views: 
-            continue
-
-        # 4. 計算爆發指數與時間
-        published = datetime.fromisoformat(snippet["publishedAt"].replace("Z", "+00:00"))
-        now = datetime.now(timezone.utc)
-        hours_passed = max((now - published).total_seconds() / 3600, 1)
-        viral_score = views / hours_passed
-        
-        # 5. 爆發指數過濾
-        if viral_score < min_viral_score: 
-            continue
-
-        # 6. 格式化顯示時長
-        m, s = divmod(total_seconds, 60)
-        duration_display = f"{m}:{s:02d}"
-
-        # 7. 最後才加入結果清單 (只需一次 append)
-        results.append({
-            "title": snippet["title"],
-            "views": views,
-            "duration": duration_display,
-            "hours": round(hours_passed, 1),
-            "viral_score": round(viral_score, 2),
-            "published": published.strftime("%Y-%m-%d %H:%M"),
-            "url": f"https://www.youtube.com/watch?v={item['id']}"
-        })
-
-    # 排序並回傳
-    results.sort(key=lambda x: x["viral_score"], reverse=True)
-    return results
+def service_client():
+    """ config.json 設了 service_url 就改由共用趨勢服務搜尋與分析（見 trend_service.py），否則回傳 None """
+    url = load_config().get("service_url", "").strip()
+    return trend_service.ServiceClient(url) if url else None
+
+def quota_ledger(api_key):
+    """ 趨勢服務模式下搜尋在服務端花配額，用服務端的記帳；否則用本機的 """
+    service = service_client()
+    return service.quota(api_key) if service else QuotaLedger(api_key)
+
+def fetch_trending_shorts(api_key, keyword, days, min_views, min_subs, max_results, min_viral_score, max_duration,
+                          incremental=False, **kwargs):
+    # 多關鍵字並行搜尋、本機快取、配額記帳、觀看數快照、向量化計分（見 trends.py）
+    # kwargs：on_batch / on_progress / cancel（背景搜尋邊查邊顯示）
+    # min_subs：頻道訂閱數下限，訂閱數在本機保存 24 小時，重複搜尋幾乎不再花配額（見 channel_store.py）
+    # incremental：只搜上次之後發布的影片，已知影片只更新觀看數（見 sweep_store.py）
+    service = service_client()
+    if service:
+        # 服務端完成後一次回傳（不逐批顯示、不能中途取消）
+        return service.search(api_key, keyword, days, min_views, max_results, min_viral_score, max_duration, min_subs,
+                              incremental=incremental)
+    return trends.fetch_trending_shorts(api_key, keyword, days, min_views, max_results, min_viral_score, max_duration,
+                                        min_subs=min_subs, incremental=incremental, **kwargs)
 
 # ========================
 # Core Logic: Gemini AI Analysis
 # ========================
-def ai_generate_prompt(gemini_api_key, video_url, progress_callback):
-    """
-    下載影片並由 Gemini 產生提示詞
-    """
-    if not gemini_api_key:
-        return "⚠️ 請先在【進階設定】輸入 Gemini API Key！"
-    
-    try:
-        progress_callback("正在下載影片片段...")
-        # --- 新增：獲取內置 ffmpeg 的路徑 ---
-        """ ffmpeg_path = resource_path(".") # 指向臨時資料夾根目錄
-        
-        ydl_opts = {
-            'format': 'best[ext=mp4]/tiny',
-            'outtmpl': 'temp_ai_input.mp4',
-            'overwrites': True,
-            # 強制指定 ffmpeg 的位置
-            'ffmpeg_location': ffmpeg_path 
-        }        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url]) """
-
-        ydl_opts = {
-            'format': 'best[ext=mp4]/tiny',
-            'outtmpl': 'temp_ai_input.mp4',
-            'overwrites': True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([video_url])
-
-        client = genai.Client(api_key=gemini_api_key)
-        
-        # 獲取可用模型
-        models_list = [m.name for m in client.models.list()]
-        #priority_models = ["models/gemini-2.0-flash-exp", "models/gemini-1.5-flash", "models/gemini-1.5-pro"]
-        priority_models = ["models/gemini-2.0-flash-exp"]
-        target_model = next((p for p in priority_models if p in models_list), models_list[0])
-
-        progress_callback(f"正在上傳至 Gemini ({target_model})...")
-        with open("temp_ai_input.mp4", "rb") as f:
-            video_file = client.files.upload(file=f, config={'mime_type': 'video/mp4'})
-
-        while video_file.state == "PROCESSING":
-            time.sleep(2)
-            video_file = client.files.get(name=video_file.name)
-
-        progress_callback("AI 正在分析內容...")
-        prompt_instruction = "請擔任專業影片分析師，觀察此影片並為 AI 影片生成模型 (如 Sora) 撰寫英文提示詞 (Prompt)。包含：主角特徵、動作、環境、鏡頭運動與光影氛圍。"
-        
-        response = client.models.generate_content(model=target_model, contents=[video_file, prompt_instruction])
-        
-        client.files.delete(name=video_file.name)
-        if os.path.exists("temp_ai_input.mp4"): os.remove("temp_ai_input.mp4")
-        
-        return response.text
-    except Exception as e:
-        return f"❌ AI 分析失敗: {str(e)}"
-
 # ========================
 # GUI Setup
 # ========================
@@ -217,7 +115,11 @@ def default_config():
         "min_subs": 0,
         "max_results": 30,
         "min_viral_score": 3000,
-        "max_duration": 20  # 預設排除超過 20 秒的影片
+        "max_duration": 20,  # 預設排除超過 20 秒的影片
+        "incremental": False,  # 增量搜尋（見 sweep_store.py）
+        "watchlists": [],    # 背景排程用（見 watch_daemon.py）
+        "service_url": "",   # 共用趨勢服務，例如 http://127.0.0.1:8765（見 trend_service.py），空白 = 在本機執行
+        "media": dict(media_prep.DEFAULT_SETTINGS)  # AI 分析前的下載／轉檔設定
     }
 
 def load_config():
@@ -266,6 +168,7 @@ min_subs_var = tk.IntVar(value=cfg["min_subs"])
 max_results_var = tk.IntVar(value=cfg["max_results"])
 min_viral_score_var = tk.DoubleVar(value=cfg["min_viral_score"])
 max_duration_var = tk.IntVar(value=cfg.get("max_duration", 20))
+incremental_var = tk.BooleanVar(value=cfg["incremental"])
 
 current_results = []
 selected_url = ""
@@ -273,45 +176,128 @@ selected_url = ""
 # ========================
 # Actions
 # ========================
+# AI 分析工作：固定 2 條執行緒，同一影片 + 模式還在跑就共用同一個工作
+shown_job_id = None   # ai_text 目前顯示的工作
+
+def render_job(job):
+    """ 重畫 ai_text：進度紀錄 + 結果 """
+    ai_text.delete("1.0", tk.END)
+    ai_text.insert(tk.END, f"🚀 啟動分析：{job.url}（{video_analysis.MODES[job.mode]}）\n")
+    for msg in job.log:
+        ai_text.insert(tk.END, f"> {msg}\n")
+    if job.text:
+        ai_text.insert(tk.END, f"\n--- 分析結果 ---\n\n{job.text}")
+    if job.error is not None:
+        ai_text.insert(tk.END, f"\n\n❌ AI 分析失敗: {job.error}")
+    elif not job.active and not job.text:
+        ai_text.insert(tk.END, f"\n{job.state}")
+
+def on_job_event(job, event, data):
+    """ 背景執行緒回呼，透過 root.after 回主執行緒；只更新目前顯示中的工作 """
+    first_chunk = event == "chunk" and job.text == data
+
+    def apply():
+        if job.id != shown_job_id:
+            return
+        if event == "progress":
+            ai_text.insert(tk.END, f"> {data}\n")
+        elif event == "chunk":
+            ai_text.insert(tk.END, ("\n--- 分析結果 ---\n\n" if first_chunk else "") + data)
+        else:
+            render_job(job)
+        ai_text.see(tk.END)
+
+    root.after(0, apply)
+
+ai_jobs = job_manager.JobManager(workers=2, listener=on_job_event)
+
 def start_ai_process(url):
     """ 核心 AI 啟動流程，支援不同來源的 URL """
+    global shown_job_id
+    gemini_key = gemini_key_var.get().strip()
+    if not gemini_key:
+        messagebox.showwarning("提示", "請先在【進階設定】輸入 Gemini API Key！")
+        return
+    mode = selected_ai_mode()
+    media_settings = load_config().get("media")
+    service = service_client()
+
+    def run(progress, chunk):
+        if service:
+            return service.analyze(gemini_key, url, mode, media_settings, progress_callback=progress)
+        return video_analysis.analyze_video(gemini_key, url, progress, chunk, mode=mode,
+                                            media_settings=media_settings)
+
+    job, is_new = ai_jobs.submit(url, mode, run)
     notebook.select(ai_tab)
-    ai_text.delete("1.0", tk.END)
-    ai_text.insert(tk.END, f"🚀 啟動分析：{url}\n")
-    
-    def worker():
-        # 這裡調用您原始碼中定義的 ai_generate_prompt
-        result = ai_generate_prompt(
-            gemini_key_var.get().strip(), 
-            url, 
-            lambda msg: root.after(0, lambda: ai_text.insert(tk.END, f"> {msg}\n"))
-        )
-        root.after(0, lambda: ai_text.insert(tk.END, f"\n--- 分析結果 ---\n\n{result}"))
-
-    import threading
-    threading.Thread(target=worker, daemon=True).start()
+    shown_job_id = job.id
+    render_job(job)
+    if not is_new:
+        ai_text.insert(tk.END, "> 這部影片正在分析中，直接顯示同一個工作\n")
+    refresh_job_list()
     
 def run_ai_analysis():
-    global selected_url
     if not selected_url:
         messagebox.showwarning("提示", "請先從清單中右鍵點選一部影片。")
         return
     start_ai_process(selected_url)
-    
+
+batch_pipeline = None   # 目前（或上一次）的批次流水線；同時只跑一批，工作顯示在狀態清單
+
+def run_batch_analysis():
+    """ 分析結果清單中選取的多部影片：下載／上傳／分析三段同時進行（第 1 部分析時第 2 部在上傳） """
+    global batch_pipeline, shown_job_id
+    urls = [tree.item(i, "values")[-1] for i in tree.selection()]
+    gemini_key = gemini_key_var.get().strip()
+    if not urls:
+        messagebox.showwarning("提示", "請先在清單中選取影片（可用 Ctrl / Shift 多選）。")
+        return
+    if not gemini_key:
+        messagebox.showwarning("提示", "請先在【進階設定】輸入 Gemini API Key！")
+        return
+    if batch_pipeline is not None and batch_pipeline.active:
+        messagebox.showwarning("提示", "上一批還在分析中，請等它完成或先按「取消批次」。")
+        return
+
+    def on_done(job):
+        text = job.result if job.error is None else f"❌ AI 分析失敗: {job.error}"
+        root.after(0, lambda: (ai_text.insert(tk.END, f"\n--- {job.state}：{job.url} ---\n\n{text or ''}\n"),
+                               ai_text.see(tk.END)))
+
+    try:
+        pipeline = batch_pipeline = analysis_pipeline.AnalysisPipeline(
+            gemini_key, mode=selected_ai_mode(), media_settings=load_config().get("media"), on_done=on_done)
+    except Exception as e:
+        messagebox.showerror("錯誤", f"AI 分析失敗: {e}")
+        return
+    shown_job_id = None   # 結果區改顯示批次輸出
     notebook.select(ai_tab)
     ai_text.delete("1.0", tk.END)
-    ai_text.insert(tk.END, "🚀 啟動 AI 分析流程...\n")
-    
+    ai_text.insert(tk.END, f"🚀 批次分析 {len(urls)} 部影片（流水線）\n")
+    batch_cancel_btn.config(state="normal")
+
     def worker():
-        result = ai_generate_prompt(
-            gemini_key_var.get().strip(), 
-            selected_url, 
-            lambda msg: root.after(0, lambda: ai_text.insert(tk.END, f"> {msg}\n"))
-        )
-        root.after(0, lambda: ai_text.insert(tk.END, f"\n--- 分析結果 ---\n\n{result}"))
-
-    import threading
-    threading.Thread(target=worker, daemon=True).start()
+        # 送出（查快取可能要連網）與等待都在這條執行緒；取消後 close() 會等執行中的階段結束
+        try:
+            for url in urls:
+                pipeline.submit(url)
+            pipeline.close()
+            summary = pipeline.summary()
+        except Exception as e:
+            pipeline.close(wait=False)
+            summary = f"❌ AI 分析失敗: {e}"
+        root.after(0, lambda: (ai_text.insert(tk.END, f"\n> {summary}\n"), batch_cancel_btn.config(state="disabled"),
+                               refresh_job_list()))
+
+    threading.Thread(target=worker, daemon=True, name="batch-analysis").start()
+    refresh_job_list()
+
+def cancel_batch():
+    """ 取消整批：排隊中的直接略過，執行中的在目前階段結束後停下 """
+    if batch_pipeline is not None:
+        batch_pipeline.cancel()
+        ai_text.insert(tk.END, "\n> 已要求取消批次（執行中的影片在目前階段結束後停下）\n")
+        refresh_job_list()
 
 def copy_ai_result():
     content = ai_text.get("1.0", tk.END)
@@ -328,11 +314,13 @@ basic_tab = ttk.Frame(notebook)
 adv_tab = ttk.Frame(notebook)
 result_tab = ttk.Frame(notebook)
 ai_tab = ttk.Frame(notebook)
+diag_tab = ttk.Frame(notebook)
 
 notebook.add(basic_tab, text="基本設定")
 notebook.add(adv_tab, text="進階與 API")
 notebook.add(result_tab, text="分析結果")
 notebook.add(ai_tab, text="AI Prompt 結果")
+notebook.add(diag_tab, text="效能診斷")
 
 # --- Basic Tab ---
 def labeled_entry(parent, label, var, row, help_text=None):
@@ -340,41 +328,59 @@ def labeled_entry(parent, label, var, row, help_text=None):
     ttk.Entry(parent, textvariable=var, width=40).grid(row=row, column=1, padx=10)
     if help_text: ttk.Label(parent, text=help_text, foreground="gray").grid(row=row, column=2, sticky="w")
 
-labeled_entry(basic_tab, "關鍵字", keyword_var, 0)
+labeled_entry(basic_tab, "關鍵字", keyword_var, 0, "多個用逗號分隔，例如: cat, dog, cooking")
 labeled_entry(basic_tab, "搜尋天數", days_var, 1, "例如: 7 = 最近 7 天")
 labeled_entry(basic_tab, "排除長度超過(秒)", max_duration_var, 2, "例如: 20 = 只找 20 秒內的影片")
+ttk.Checkbutton(basic_tab, text="增量搜尋", variable=incremental_var).grid(row=3, column=1, sticky="w", padx=10, pady=5)
+ttk.Label(basic_tab, text="同一關鍵字只搜上次之後發布的影片，已知影片只更新觀看數（省配額）",
+          foreground="gray").grid(row=3, column=2, sticky="w")
 
 # --- Adv Tab ---
 labeled_entry(adv_tab, "YouTube API Key", api_key_var, 0, "到 Google Cloud 申請 YouTube Data API v3")
 labeled_entry(adv_tab, "Gemini API Key", gemini_key_var, 1, "用於分析影片產生 Prompt")
 labeled_entry(adv_tab, "最少觀看數", min_views_var, 2, "低於此數字會被過濾")
 labeled_entry(adv_tab, "爆發指數門檻", min_viral_score_var, 3, "觀看數 ÷ 發布後小時（越高代表成長越快）")
+labeled_entry(adv_tab, "最大結果數", max_results_var, 4, "超過 50 會自動翻頁（每頁 100 配額）")
+labeled_entry(adv_tab, "最少訂閱數", min_subs_var, 5, "0 = 不限；隱藏訂閱數的頻道不過濾")
 
 # --- Result Tab ---
-tree = ttk.Treeview(result_tab, columns=("title", "views", "duration","hours", "viral", "published", "url"), show="headings")
-for col, head in zip(tree["columns"], ["標題", "觀看數", "總時長", "發布小時", "爆發指數", "發布時間"]):
+tree = ttk.Treeview(result_tab, columns=("title", "views", "duration","hours", "viral", "velocity", "subs", "per_sub", "published", "keywords", "url"), show="headings")
+for col, head in zip(tree["columns"], ["標題", "觀看數", "總時長", "發布小時", "爆發指數", "觀看速度/時", "訂閱數", "觀看/訂閱", "發布時間", "符合關鍵字"]):
     tree.heading(col, text=head)
 tree.column("title", width=300)
 tree.column("views", width=100)
 tree.column("duration", width=80, anchor="center")
 tree.column("hours", width=80, anchor="center")
 tree.column("viral", width=100, anchor="center")
+tree.column("velocity", width=100, anchor="center")
+tree.column("subs", width=90, anchor="center")
+tree.column("per_sub", width=80, anchor="center")
 tree.column("published", width=150, anchor="center")
+tree.column("keywords", width=150)
 tree.column("url", width=0, stretch=tk.NO) # 關鍵：設為 0 且不延伸，URL 就會消失
 tree.pack(fill="both", expand=True, padx=10, pady=10)
 
+page_frame = ttk.Frame(result_tab)
+page_frame.pack(fill="x", padx=10, pady=(0, 10))
+ttk.Button(page_frame, text="◀ 上一頁", command=lambda: render_page(result_page - 1)).pack(side="left")
+page_label = ttk.Label(page_frame, foreground="gray")
+page_label.pack(side="left", padx=10)
+ttk.Button(page_frame, text="下一頁 ▶", command=lambda: render_page(result_page + 1)).pack(side="left")
+
 # 右鍵選單
 context_menu = tk.Menu(root, tearoff=0)
 context_menu.add_command(label="開啟影片 (瀏覽器)", command=lambda: webbrowser.open(selected_url))
 context_menu.add_command(label="複製連結", command=lambda: pyperclip.copy(selected_url))
 context_menu.add_separator()
 context_menu.add_command(label="✨ 使用 AI 產生影片 Prompt", command=run_ai_analysis)
+context_menu.add_command(label="✨ 批次分析選取的影片", command=run_batch_analysis)
 
 def show_context_menu(event):
     global selected_url
     item_id = tree.identify_row(event.y)
     if item_id:
-        tree.selection_set(item_id)
+        if item_id not in tree.selection():  # 在已選取的列上按右鍵時保留多選（批次分析）
+            tree.selection_set(item_id)
         selected_url = tree.item(item_id, "values")[-1]
         context_menu.tk_popup(event.x_root, event.y_root)
 
@@ -406,16 +412,144 @@ def run_manual_ai():
 
 ttk.Button(url_frame, text="立即分析", command=run_manual_ai).pack(side="left")
 
+# 分析模式：完整影片 / 關鍵畫格（較快，不經過檔案上傳與雲端處理）
+ttk.Label(url_frame, text="模式:").pack(side="left", padx=(15, 0))
+ai_mode_var = tk.StringVar(value=video_analysis.MODES["video"])
+ttk.Combobox(url_frame, textvariable=ai_mode_var, values=list(video_analysis.MODES.values()),
+             state="readonly", width=14).pack(side="left", padx=5)
+
+def selected_ai_mode():
+    return next(k for k, v in video_analysis.MODES.items() if v == ai_mode_var.get())
+
+# 工作狀態清單（點選可切換顯示該工作的進度與結果）
+job_frame = ttk.Frame(ai_tab)
+job_frame.pack(fill="x", padx=10)
+job_tree = ttk.Treeview(job_frame, columns=("state", "mode", "elapsed", "url"), show="headings", height=4)
+for col, text, width in (("state", "狀態", 70), ("mode", "模式", 110), ("elapsed", "秒數", 60), ("url", "網址", 420)):
+    job_tree.heading(col, text=text)
+    job_tree.column(col, width=width, anchor="w" if col == "url" else "center")
+job_tree.pack(side="left", fill="x", expand=True)
+
+def batch_jobs():
+    """ 批次流水線的工作，iid 以 batch- 開頭和單筆工作區分 """
+    if batch_pipeline is None:
+        return []
+    mode = video_analysis.MODES[batch_pipeline.mode]
+    return [(f"batch-{i}", job, (f"批次・{job.state}", mode, f"{job.elapsed():.0f}", job.url))
+            for i, job in enumerate(list(batch_pipeline.jobs.values()))]
+
+def refresh_job_list():
+    rows = [(str(job.id), job, (job.state, video_analysis.MODES[job.mode], f"{job.elapsed():.0f}", job.url))
+            for job in ai_jobs.snapshot()] + batch_jobs()
+    ids = {iid for iid, _, _ in rows}
+    for iid in job_tree.get_children():
+        if iid not in ids:
+            job_tree.delete(iid)
+    for iid, job, values in rows:
+        if job_tree.exists(iid):
+            job_tree.item(iid, values=values)
+        else:
+            job_tree.insert("", 0, iid=iid, values=values)
+
+def poll_job_list():
+    refresh_job_list()
+    root.after(500, poll_job_list)
+
+def show_selected_job(event=None):
+    global shown_job_id
+    for iid in job_tree.selection():
+        if iid.startswith("batch-"):
+            job = dict((i, j) for i, j, _ in batch_jobs()).get(iid)
+            if job is not None:
+                shown_job_id = None
+                text = job.result if job.error is None else f"❌ AI 分析失敗: {job.error}"
+                ai_text.delete("1.0", tk.END)
+                ai_text.insert(tk.END, f"🚀 批次分析：{job.url}\n> {job.state}\n\n{text or ''}")
+            continue
+        job = ai_jobs.jobs.get(int(iid))
+        if job:
+            shown_job_id = job.id
+            render_job(job)
+
+def cancel_selected_jobs():
+    batch = dict((i, j) for i, j, _ in batch_jobs())
+    for iid in job_tree.selection():
+        if iid in batch:
+            batch_pipeline.cancel(batch[iid].url)
+        else:
+            ai_jobs.cancel(int(iid))
+    refresh_job_list()
+
+job_tree.bind("<<TreeviewSelect>>", show_selected_job)
+ttk.Button(job_frame, text="取消選取的工作", command=cancel_selected_jobs).pack(side="left", padx=5)
+batch_cancel_btn = ttk.Button(job_frame, text="取消批次", command=cancel_batch, state="disabled")
+batch_cancel_btn.pack(side="left")
+
 # 原有的文字框
 ai_text = tk.Text(ai_tab, wrap="word", font=("Microsoft JhengHei", 10))
 ai_text.pack(fill="both", expand=True, padx=10, pady=10)
 ttk.Button(ai_tab, text="複製分析結果", command=copy_ai_result).pack(pady=5)
 
+# --- Diagnostics Tab ---
+# 各階段耗時（client build、search/videos、計分、選模型、下載轉檔、上傳、PROCESSING、生成），見 perf_metrics.py
+DIAG_COLUMNS = (("stage", "階段", 160), ("count", "次數", 60), ("p50_s", "p50 秒", 80), ("p90_s", "p90 秒", 80),
+                ("p99_s", "p99 秒", 80), ("max_s", "最大 秒", 80), ("total_s", "總秒數", 80), ("errors", "失敗", 60))
+diag_tree = ttk.Treeview(diag_tab, columns=[c[0] for c in DIAG_COLUMNS], show="headings")
+for col, text, width in DIAG_COLUMNS:
+    diag_tree.heading(col, text=text)
+    diag_tree.column(col, width=width, anchor="w" if col == "stage" else "center")
+diag_tree.pack(fill="both", expand=True, padx=10, pady=10)
+# 重試／時限／斷路次數與斷路器狀態（見 resilience.py）
+diag_events = ttk.Label(diag_tab, foreground="gray", wraplength=900, justify="left")
+diag_events.pack(fill="x", padx=10)
+
+def refresh_diagnostics():
+    diag_tree.delete(*diag_tree.get_children())
+    for row in perf_metrics.get_default_metrics().snapshot():
+        diag_tree.insert("", "end", values=["" if row[c[0]] is None else row[c[0]] for c in DIAG_COLUMNS])
+    events = [f"{r['event']} {r['count']}" for r in perf_metrics.get_default_metrics().counter_snapshot()]
+    breakers = [f"{b['name']}：{b['state']}" + (f"（{b['open_for_s']:.0f} 秒後恢復）" if b["open_for_s"] else "")
+                for b in resilience.breaker_table()]
+    diag_events.config(text="｜".join(events + breakers) or "尚無重試或限流紀錄")
+
+def poll_diagnostics():
+    # 只在分頁顯示時更新
+    if notebook.select() == str(diag_tab):
+        refresh_diagnostics()
+    root.after(2000, poll_diagnostics)
+
+def export_metrics(ext):
+    path = filedialog.asksaveasfilename(defaultextension=ext, initialfile=f"shortsai_metrics{ext}",
+                                        filetypes=[("Prometheus", "*.prom")] if ext == ".prom" else [("JSONL", "*.jsonl")])
+    if not path:
+        return
+    try:
+        perf_metrics.get_default_metrics().export(path)
+    except OSError as e:
+        messagebox.showerror("錯誤", f"匯出失敗: {e}")
+
+def reset_metrics():
+    perf_metrics.get_default_metrics().reset()
+    refresh_diagnostics()
+
+diag_btns = ttk.Frame(diag_tab)
+diag_btns.pack(fill="x", padx=10, pady=(0, 10))
+ttk.Button(diag_btns, text="重新整理", command=refresh_diagnostics).pack(side="left")
+ttk.Button(diag_btns, text="匯出 Prometheus", command=lambda: export_metrics(".prom")).pack(side="left", padx=5)
+ttk.Button(diag_btns, text="匯出 JSONL", command=lambda: export_metrics(".jsonl")).pack(side="left")
+ttk.Button(diag_btns, text="清除統計", command=reset_metrics).pack(side="right")
+
 # ========================
 # Run Actions
 # ========================
+search_cancel = None   # 搜尋中時為 threading.Event，按「取消」設定它
+
 def run_search():
+    global search_cancel
+    if search_cancel is not None:
+        return  # 已在搜尋中
     save_config({
+        **load_config(),  # 保留其他設定（例如 watchlists）
         "api_key": api_key_var.get().strip(),
         "gemini_key": gemini_key_var.get().strip(),
         "keyword": keyword_var.get(),
@@ -424,22 +558,182 @@ def run_search():
         "min_subs": min_subs_var.get(),
         "max_results": max_results_var.get(),
         "min_viral_score": min_viral_score_var.get(),
-        "max_duration": max_duration_var.get()
+        "max_duration": max_duration_var.get(),
+        "incremental": incremental_var.get()
     })
-    tree.delete(*tree.get_children())
+    # 依今日剩餘配額規劃搜尋頁數
+    keywords = parse_keywords(keyword_var.get())
+    if not keywords:
+        messagebox.showwarning("提示", "請輸入關鍵字")
+        return
     try:
-        results = fetch_trending_shorts(api_key_var.get(), keyword_var.get(), days_var.get(), min_views_var.get(), 0, max_results_var.get(), min_viral_score_var.get(), max_duration_var.get())
-        for r in results:
-            tree.insert("", "end", values=(r["title"], r["views"], r["duration"], r["hours"], r["viral_score"], r["published"], r["url"]))
-        notebook.select(result_tab)
-    except Exception as e:
+        remaining = quota_ledger(api_key_var.get()).remaining()
+    except trend_service.ServiceError as e:
         messagebox.showerror("錯誤", str(e))
+        return
+    plan = plan_queries(remaining, keywords, max_results_var.get())
+    if not plan.keywords:
+        messagebox.showwarning("配額不足", "今日 YouTube API 配額已用完，請明天再試。")
+        return
+
+    # 在背景執行緒搜尋，視窗不會卡住；每批詳細資料完成就先顯示（Tk 變數在主執行緒先取值）
+    args = (api_key_var.get(), plan.keywords, days_var.get(), min_views_var.get(), min_subs_var.get(), plan.max_results,
+            min_viral_score_var.get(), max_duration_var.get(), incremental_var.get())
+    cancel = search_cancel = threading.Event()
+    result_rows.clear()
+    render_page(0)
+    notebook.select(result_tab)
+    search_btn.config(state="disabled")
+    cancel_btn.config(state="normal")
+    search_status.config(text="搜尋中...")
+
+    def on_progress(done, total):
+        root.after(0, lambda: search_status.config(text=f"取得詳細資料 {done} / {total} 批"))
+
+    def worker():
+        try:
+            results = fetch_trending_shorts(*args, cancel=cancel, on_progress=on_progress,
+                                            on_batch=lambda df: root.after(0, append_rows, df.to_dict("records")))
+            root.after(0, finish_search, results, None)
+        except Exception as e:
+            root.after(0, finish_search, None, e)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+def cancel_search():
+    if search_cancel is not None:
+        search_cancel.set()
+        search_status.config(text="取消中（等待進行中的請求結束）...")
+
+def finish_search(results, error):
+    global search_cancel
+    cancelled = search_cancel.is_set()
+    search_cancel = None
+    search_btn.config(state="normal")
+    cancel_btn.config(state="disabled")
+    if error is not None:
+        search_status.config(text="")
+        messagebox.showerror("錯誤", str(error))
+    else:
+        show_results(results)
+        search_status.config(text=f"{'已取消，顯示已取得的' if cancelled else '完成，共'} {len(results):,} 部")
+    update_quota_label()
+
+# 結果分頁：tree 只放目前這一頁，幾千筆也能快速插入與捲動
+RESULT_PAGE_SIZE = 200
+result_rows = []   # 全部結果（每列為 tree 的 values）
+result_page = 0
+
+def row_values(r):
+    velocity = "" if math.isnan(r["velocity"]) else f"{r['velocity']:.0f}"
+    subs = "隱藏" if math.isnan(r["subscribers"]) else f"{r['subscribers']:.0f}"
+    per_sub = "" if math.isnan(r["views_per_sub"]) else f"{r['views_per_sub']:.1f}"
+    return (r["title"], r["views"], r["duration"], r["hours"], r["viral_score"], velocity, subs, per_sub,
+            r["published"], r["keywords"], r["url"])
+
+def page_count():
+    return max(1, math.ceil(len(result_rows) / RESULT_PAGE_SIZE))
+
+def update_page_label():
+    page_label.config(text=f"第 {result_page + 1} / {page_count()} 頁（共 {len(result_rows):,} 部）")
+
+def render_page(page):
+    global result_page
+    result_page = min(max(0, page), page_count() - 1)
+    tree.delete(*tree.get_children())
+    start = result_page * RESULT_PAGE_SIZE
+    for values in result_rows[start:start + RESULT_PAGE_SIZE]:
+        tree.insert("", "end", values=values)
+    update_page_label()
+
+def append_rows(records):
+    """ 搜尋途中送來的一批結果：目前頁面還有空位就直接插入，其餘只更新頁數 """
+    start = len(result_rows)
+    result_rows.extend(row_values(r) for r in records)
+    page_start = result_page * RESULT_PAGE_SIZE
+    for values in result_rows[max(start, page_start):page_start + RESULT_PAGE_SIZE]:
+        tree.insert("", "end", values=values)
+    update_page_label()
+
+def show_results(results):
+    result_rows[:] = [row_values(r) for r in results.to_dict("records")]
+    render_page(0)
+    notebook.select(result_tab)
+
+def run_refresh():
+    """ 不重新搜尋，只更新追蹤影片的觀看數（每 50 部 1 單位）並依觀看速度排序；和搜尋一樣在背景執行緒執行 """
+    key = api_key_var.get().strip()
+    if not key:
+        messagebox.showwarning("提示", "請先在【進階與 API】輸入 YouTube API Key")
+        return
+    if str(refresh_btn["state"]) == "disabled":
+        return  # 已在更新中
+    # Tk 變數在主執行緒先取值
+    args = (key, min_views_var.get(), min_viral_score_var.get(), max_duration_var.get(), min_subs_var.get())
+    refresh_btn.config(state="disabled")
+    search_status.config(text="更新追蹤影片中...")
+
+    def worker():
+        try:
+            service = service_client()
+            refresh = service.refresh if service else trends.refresh_tracked
+            root.after(0, finish_refresh, refresh(*args), None)
+        except Exception as e:
+            root.after(0, finish_refresh, None, e)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+def finish_refresh(results, error):
+    refresh_btn.config(state="normal")
+    if search_cancel is None:
+        search_status.config(text="")  # 搜尋進行中時保留搜尋的進度文字
+    if error is not None:
+        messagebox.showerror("錯誤", str(error))
+    else:
+        show_results(results)
+    update_quota_label()
+
+def update_quota_label():
+    """ 顯示今日配額用量 """
+    key = api_key_var.get().strip()
+    if not key:
+        quota_label.config(text="")
+        return
+    try:
+        ledger = quota_ledger(key)
+    except trend_service.ServiceError as e:
+        quota_label.config(text=f"無法取得配額：{e}")
+        return
+    eta = ledger.projected_exhaustion()
+    quota_label.config(text=f"今日配額 {ledger.used_today():,} / {ledger.daily_quota:,}"
+                            f"｜{ledger.burn_rate():,.0f} 單位/小時"
+                            f"｜{'預估 ' + eta.strftime('%H:%M') + ' 用完' if eta else '今日夠用'}")
 
 btn_frame = ttk.Frame(root)
 btn_frame.pack(fill="x", pady=10)
-ttk.Button(btn_frame, text="開始搜尋分析", command=run_search).pack(side="right", padx=10)
+search_btn = ttk.Button(btn_frame, text="開始搜尋分析", command=run_search)
+search_btn.pack(side="right", padx=10)
+cancel_btn = ttk.Button(btn_frame, text="取消搜尋", command=cancel_search, state="disabled")
+cancel_btn.pack(side="right")
+refresh_btn = ttk.Button(btn_frame, text="更新追蹤影片 (低配額)", command=run_refresh)
+refresh_btn.pack(side="right", padx=10)
+quota_label = ttk.Label(btn_frame, foreground="gray")
+quota_label.pack(side="left", padx=10)
+search_status = ttk.Label(btn_frame, foreground="gray")
+search_status.pack(side="left", padx=10)
+update_quota_label()
 
 root.after(1000, check_for_updates) # 程式啟動 1 秒後檢查更新
+root.after(500, poll_job_list)
+root.after(2000, poll_diagnostics)
+
+def on_close():
+    ai_jobs.shutdown()   # 取消排隊中的工作，執行中的在下一個階段停下
+    if batch_pipeline is not None:
+        batch_pipeline.close(wait=False)   # 取消剩下的批次，背景關閉各段執行緒
+    root.destroy()
+
+root.protocol("WM_DELETE_WINDOW", on_close)
 root.mainloop()
 
 
@@ -0,0 +1,236 @@
+"""
+多部影片的分段流水線：下載 → 上傳 → 分析
+- 三個階段各自有固定大小的執行緒池，中間用有上限的佇列串接
+  （下一段塞滿時上一段會停下來等，不會一口氣把所有影片都下載完）
+- 第 1 部在分析時，第 2 部在上傳、第 3 部在下載；總時間接近最慢的那一段，而不是三段相加
+- 每個階段記錄處理件數與忙碌時間（利用率）；可取消單一影片或全部
+"""
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+import media_prep
+import prompt_cache
+import video_analysis
+from gemini_queue import TokenBucket, DEFAULT_RPM
+
+DEFAULT_WORKERS = {"download": 2, "upload": 2, "generate": 2}
+QUEUE_SIZE = 2   # 每段之間最多排幾部
+
+
+class Job:
+    def __init__(self, url):
+        self.url = url
+        self.state = "排隊中"
+        self.work_dir = None
+        self.prepared = None
+        self.contents = None
+        self.stages = []
+        self.model = None
+        self.result = None
+        self.error = None
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def active(self):
+        return not self.done.is_set()
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.created
+
+
+class Stage:
+    def __init__(self, name, fn, workers, maxsize):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=maxsize)
+        self.threads = []
+        self.processed = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.processed += 1
+            self.busy += seconds
+
+
+class AnalysisPipeline:
+    """
+    pipeline = AnalysisPipeline(key, on_done=...)
+    for url in urls: pipeline.submit(url)
+    pipeline.close()      # 等全部跑完；close(wait=False) 取消剩下的並在背景關閉
+    on_progress(job, 訊息) / on_done(job) 在背景執行緒呼叫
+    """
+
+    def __init__(self, gemini_api_key, mode="video", media_settings=None, workers=None, queue_size=QUEUE_SIZE,
+                 rpm=DEFAULT_RPM, on_progress=None, on_done=None):
+        self.registry = video_analysis.get_gemini_registry(gemini_api_key)
+        self.mode = mode
+        self.media_settings = media_settings
+        self.bucket = TokenBucket(rpm)
+        self.on_progress = on_progress or (lambda job, msg: None)
+        self.on_done = on_done or (lambda job: None)
+        self.jobs = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self._closed = False
+        self._cancel_all = threading.Event()   # 整批取消後才送進來的影片直接標為已取消
+        self._close_lock = threading.Lock()
+        workers = {**DEFAULT_WORKERS, **(workers or {})}
+        # 第一段的佇列不設上限（submit 不會卡住 UI），後面幾段有上限形成背壓
+        self.stages = [
+            Stage("download", self._download, workers["download"], 0),
+            Stage("upload", self._upload, workers["upload"], queue_size),
+            Stage("generate", self._generate, workers["generate"], queue_size),
+        ]
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            for n in range(stage.workers):
+                t = threading.Thread(target=self._worker, args=(stage, next_stage), daemon=True,
+                                     name=f"pipeline-{stage.name}-{n}")
+                t.start()
+                stage.threads.append(t)
+
+    # ---- 各階段 ----
+    def _download(self, job):
+        self._progress(job, "下載中")
+        job.work_dir = tempfile.mkdtemp(prefix="shortsai_")
+        job.prepared, job.stages = video_analysis.prepare_stage(self.registry, job.url, self.mode, job.work_dir,
+                                                                self.media_settings)
+
+    def _upload(self, job):
+        if self.mode != "keyframes":
+            self._progress(job, "上傳中")
+        job.contents = video_analysis.upload_stage(self.registry, job.prepared, self.mode, job.stages)
+        self._cleanup(job)
+
+    def _generate(self, job):
+        self._progress(job, "分析中")
+        self.bucket.acquire()
+        job.model, job.result = video_analysis.generate_stage(self.registry, job.url, self.mode, job.contents)
+
+    # ---- 執行緒 ----
+    def _worker(self, stage, next_stage):
+        while True:
+            job = stage.inbox.get()
+            if job is None:
+                break
+            if job.cancelled.is_set():
+                self._finish(job, "已取消")
+                continue
+            start = time.perf_counter()
+            try:
+                stage.fn(job)
+            except Exception as e:
+                job.error = e
+            stage.record(time.perf_counter() - start)
+            if job.error is not None:
+                self._finish(job, "失敗")
+            elif next_stage is None:
+                self._finish(job, "完成")
+            else:
+                next_stage.inbox.put(job)   # 下一段塞滿時在這裡等（背壓）
+
+    def _progress(self, job, state):
+        job.state = state
+        self.on_progress(job, state)
+
+    def _cleanup(self, job):
+        if job.work_dir:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            job.work_dir = None
+
+    def _finish(self, job, state):
+        self._cleanup(job)
+        self._progress(job, state)
+        job.finished = time.time()
+        job.done.set()
+        self.on_done(job)
+
+    # ---- 對外介面 ----
+    def submit(self, url):
+        """ 同一部影片只跑一次；已分析過的直接從快取完成 """
+        url = prompt_cache.canonical_url(url)
+        if url in self.jobs:
+            return self.jobs[url]
+        job = self.jobs[url] = Job(url)
+        if self._closed or self._cancel_all.is_set():
+            self._finish(job, "已取消")
+            return job
+        cached = video_analysis.cached_result(self.registry, url, self.mode)
+        if cached is not None:
+            job.model, job.result = cached
+            self._finish(job, "完成（快取）")
+        else:
+            self.stages[0].inbox.put(job)
+        return job
+
+    def cancel(self, url=None):
+        """ 取消一部（url）或全部；正在某一段執行中的會在該段結束後停下 """
+        if url is None:
+            self._cancel_all.set()
+        jobs = [self.jobs[prompt_cache.canonical_url(url)]] if url else list(self.jobs.values())
+        for job in jobs:
+            job.cancelled.set()
+
+    @property
+    def active(self):
+        return not self._closed or any(job.active for job in self.jobs.values())
+
+    def close(self, wait=True):
+        """
+        不再接受新影片，依序關閉各段（前一段結束才關下一段）
+        wait=False 則取消剩下的，並在背景關閉（不等執行中的階段結束，適合介面關閉時呼叫）；重複呼叫不會重複關閉
+        """
+        if not wait:
+            self.cancel()
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        if wait:
+            self._shutdown()
+        else:
+            threading.Thread(target=self._shutdown, daemon=True, name="pipeline-close").start()
+
+    def _shutdown(self):
+        for stage in self.stages:
+            for _ in stage.threads:
+                stage.inbox.put(None)
+            for t in stage.threads:
+                t.join()
+        self.finished = time.perf_counter()
+
+    def run(self, urls):
+        """ 跑完一批影片，回傳 {url: Job} """
+        for url in urls:
+            self.submit(url)
+        self.close()
+        return self.jobs
+
+    def metrics(self):
+        """ 各段處理件數、忙碌秒數、利用率（忙碌時間 ÷ (執行緒數 × 經過時間)） """
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "processed": stage.processed,
+                "busy_s": round(stage.busy, 2),
+                "queued": stage.inbox.qsize(),
+                "utilisation": round(stage.busy / (stage.workers * elapsed), 3) if elapsed > 0 else 0.0,
+            }
+            for stage in self.stages
+        }
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        parts = [f"{media_prep.STAGE_NAMES.get(name, name)} {m['processed']} 部／利用率 {m['utilisation']:.0%}"
+                 for name, m in self.metrics().items()]
+        return f"總時間 {elapsed:.1f}s｜" + "｜".join(parts)
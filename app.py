@@ -1,133 +1,76 @@
 import streamlit as st
-import requests
-import pandas as pd
-from datetime import datetime, timedelta, timezone
-from googleapiclient.discovery import build
-import google.generativeai as genai
-import re
 import json
 import os
+from yt_search import parse_keywords
+from yt_cache import get_default_cache
+from sweep_store import get_default_store as get_sweep_store
+from quota import QuotaLedger, plan_queries
+import trends
+import yt_client
+import version_check
+import prompt_cache
+import perf_metrics
+import resilience
+import trend_service
+from gemini_queue import GenerationQueue, DEFAULT_RPM, DEFAULT_CONCURRENCY
+from gemini_models import peek_registry, GenerativeAIBackend
+from prompt_engine import pick_model, model_registry, cached_prompt, generate_prompt_text
 
 # 配置
 st.set_page_config(layout="wide", page_icon="🎥", page_title="YouTube Shorts 分析工具")
 
-@st.cache_data(ttl=300)
-# == search YT and create prompt ==
-def fetch_trending_shorts(api_key, keyword, days, min_views, max_results, min_viral_score, max_duration):
-    """YouTube Shorts 趨勢搜尋（無 yt_dlp）"""
-    youtube = build("youtube", "v3", developerKey=api_key)
-    published_after = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
-
-    # 只搜短影片
-    search_response = youtube.search().list(
-        q=f"{keyword} shorts", 
-        part="id,snippet", 
-        type="video", 
-        order="viewCount", 
-        maxResults=max_results, 
-        videoDuration="short",
-        publishedAfter=published_after
-    ).execute()
-
-    video_ids = [item["id"]["videoId"] for item in search_response["items"] if item["id"]["videoId"]]
-    if not video_ids: return []
+RESULT_FORMAT = {"title_len": 80, "published_fmt": "%m-%d %H:%M", "url_format": "https://youtube.com/watch?v={}"}
 
-    # 詳細資料
-    video_response = youtube.videos().list(
-        part="snippet,statistics,contentDetails", 
-        id=",".join(video_ids[:50])
-    ).execute()
+# 設了 SHORTSAI_SERVICE_URL 就把搜尋與生成交給共用的趨勢服務（見 trend_service.py），多個網頁行程共用快取、相同查詢只打一次上游
+SERVICE_URL = os.environ.get("SHORTSAI_SERVICE_URL", "")
+service = trend_service.ServiceClient(SERVICE_URL) if SERVICE_URL else None
 
-    results = []
-    for item in video_response.get("items", []):
-        duration_raw = item["contentDetails"]["duration"]
-        total_seconds = parse_duration_to_seconds(duration_raw)
-        if total_seconds > max_duration: continue
+def quota_ledger(api_key):
+    """趨勢服務模式下搜尋在服務端花配額，用服務端的記帳；否則用本機的"""
+    return service.quota(api_key) if service else QuotaLedger(api_key)
 
-        stats = item.get("statistics", {})
-        snippet = item["snippet"]
-        views = int(stats.get("viewCount", 0))
-        if views < min_views: continue
+# == search YT and create prompt ==
+def fetch_trending_shorts(api_key, keyword, days, min_views, max_results, min_viral_score, max_duration, min_subs=0,
+                          incremental=False):
+    """YouTube Shorts 趨勢搜尋（無 yt_dlp），keyword 可用逗號分隔多個，API 回應存在本機 SQLite 快取"""
+    # 只搜短影片（多關鍵字並行、每個自動翻頁直到 max_results，合併去重）
+    search = service.search if service else trends.fetch_trending_shorts
+    return search(
+        api_key, keyword, days, min_views, max_results, min_viral_score, max_duration, min_subs=min_subs,
+        query_format="{} shorts", video_duration="short", incremental=incremental, **RESULT_FORMAT
+    )
 
-        published = datetime.fromisoformat(snippet["publishedAt"].replace("Z", "+00:00"))
-        now = datetime.now(timezone.utc)
-        hours_passed = max((now - published).total_seconds() / 3600, 1)
-        viral_score = views / hours_passed
-        
-        if viral_score < min_viral_score: continue
+def ai_generate_prompt(gemini_api_key, video_url, on_chunk=None):
+    """單筆生成，錯誤轉成提示文字（趨勢服務模式不串流，完成後一次顯示）"""
+    try:
+        if service:
+            return service.prompt(gemini_api_key, video_url)
+        return generate_prompt_text(gemini_api_key, video_url, on_chunk=on_chunk)
+    except Exception as e:
+        return f"❌ 錯誤：{str(e)}\n\n檢查：\n• API Key 正確？\n• 網路連線？\n• https://aistudio.google.com"
 
-        m, s = divmod(total_seconds, 60)
-        results.append({
-            "title": snippet["title"][:80],
-            "views": views,
-            "duration": f"{m}:{s:02d}",
-            "hours": round(hours_passed, 1),
-            "viral_score": round(viral_score, 2),
-            "published": published.strftime("%m-%d %H:%M"),
-            "url": f"https://youtube.com/watch?v={item['id']}"
-        })
-    
-    return sorted(results, key=lambda x: x["viral_score"], reverse=True)
+def stream_prompt(gemini_api_key, video_url):
+    """邊生成邊顯示（不用等整段結果），完成後結果存在 st.session_state.ai_result"""
+    box = st.empty()
+    box.info("🎨 AI 生成中...")
+    st.session_state.ai_result = ""
 
-def parse_duration_to_seconds(duration_str):
-    h = re.search(r'(\d+)H', duration_str)
-    m = re.search(r'(\d+)M', duration_str)
-    s = re.search(r'(\d+)S', duration_str)
-    return (int(h.group(1)) if h else 0)*3600 + (int(m.group(1)) if m else 0)*60 + (int(s.group(1)) if s else 0)
+    def on_chunk(text):
+        st.session_state.ai_result += text
+        box.code(st.session_state.ai_result, language=None)
 
-def ai_generate_prompt(gemini_api_key, video_url):
-    """支援多模型自動選擇"""
-    try:
-        genai.configure(api_key=gemini_api_key)
-        
-        # ✅ 2025最新可用模型（自動選擇）
-        available_models = [
-            'gemini-2.0-flash-exp',      # 最快
-            'gemini-1.5-pro-latest',     # 最佳品質
-            'gemini-1.5-flash-latest',   # 平衡
-            'gemini-pro'                 # 備用
-        ]
-        
-        model_name = None
-        for model in available_models:
-            try:
-                model_obj = genai.GenerativeModel(model)
-                model_name = model
-                break
-            except:
-                continue
-        
-        if not model_name:
-            return "❌ 無可用 Gemini 模型，請檢查 API Key"
-        
-        prompt = f"""Create detailed English prompt for AI video generation recreating YouTube Shorts: {video_url}
+    st.session_state.ai_result = ai_generate_prompt(gemini_api_key, video_url, on_chunk=on_chunk)
+    box.empty()
 
-Essential elements:
-• Main character description (appearance, clothing, expression)
-• Specific actions/movements  
-• Environment/setting details
-• Camera movements (zoom, pan, close-up)
-• Lighting and color atmosphere
-• Video exact duration: match original video length
-
-Single paragraph, optimized for Sora/Runway/RunwayML."""
-        
-        model_obj = genai.GenerativeModel(model_name)
-        response = model_obj.generate_content(prompt)
-        return f"✅ 使用模型：{model_name}\n\n{response.text}"
-        
-    except Exception as e:
-        return f"❌ 錯誤：{str(e)}\n\n檢查：\n• API Key 正確？\n• 網路連線？\n• https://aistudio.google.com"
+def batch_table(df, prompts):
+    """ 搜尋結果中已生成 Prompt 的列 """
+    rows = df[df["url"].isin(list(prompts))]
+    return rows[["title", "url"]].assign(prompt=rows["url"].map(prompts))
 
 # == current version ==
-@st.cache_data(ttl=3600)
-def get_current_version():
-    try:
-        return requests.get("https://raw.githubusercontent.com/foreverjacky79/ShortsAI/refs/heads/main/version.txt", timeout=5).text.strip()
-    except:
-        return "1.0.5"
-
-version = get_current_version()
+# 只讀本機快取，不等網路；背景抓到新版本號後，下次重新整理就會顯示
+version_check.latest_version_async()
+version = version_check.cached_version("1.0.5")
 
 # ===== 美觀 Title + 版本（替換你的 st.markdown）=====
 # Title + 版號（往下移版號）
@@ -182,7 +125,7 @@ st.sidebar.markdown("---")
 
 st.sidebar.header("🔍 搜尋設定")
 col1, col2 = st.sidebar.columns(2)
-keyword = col1.text_input("關鍵字", value="animal")
+keyword = col1.text_input("關鍵字", value="animal", help="多個關鍵字用逗號分隔，例如：cat, dog, cooking")
 days = col2.number_input("最近天數", 1, 14, 7)
 
 col3, col4 = st.sidebar.columns(2)
@@ -191,25 +134,141 @@ max_duration = col4.number_input("最長秒數", 0, 60, 20)
 
 col5, col6 = st.sidebar.columns(2)
 min_viral = col5.number_input("最低爆發指數", 500.0, 10000.0, 3000.0)
-max_results = col6.number_input("最大結果", 20, 100, 50)
+max_results = col6.number_input("最大結果", 20, 500, 50, help="每 50 筆多一頁搜尋（每頁 100 配額）")
+min_subs = st.sidebar.number_input("最少訂閱數", 0, 100000000, 0, step=1000,
+                                   help="0 = 不限；頻道訂閱數在本機保存 24 小時，重複搜尋幾乎不花配額")
+incremental = st.sidebar.checkbox("⚡ 增量搜尋", value=False,
+                                  help="同一關鍵字只搜上次之後發布的影片，已知影片只更新觀看數（每 50 部 1 配額）")
+
+# 趨勢服務模式下快取在服務端，顯示服務端的數字
+cache_stats = prompt_stats = None
+if service:
+    try:
+        service_stats = service.stats()
+        cache_stats, prompt_stats = service_stats["api_cache"], service_stats["prompt_cache"]
+        st.sidebar.caption(f"🛰️ 趨勢服務：{SERVICE_URL}｜合併 {service_stats['coalescer']['coalesced']} 次相同查詢"
+                           f"（{service_stats['coalescer']['saved_rate']:.0%}）")
+    except trend_service.ServiceError as e:
+        st.sidebar.warning(f"⚠️ {e}")
+else:
+    cache_stats = get_default_cache().stats()
+    prompt_stats = prompt_cache.get_default_cache().stats()
+if cache_stats:
+    st.sidebar.caption(f"💾 {'服務端' if service else '本機'}快取：{cache_stats['entries']} 筆"
+                       f" / {cache_stats['bytes'] / 1024:.0f} KB")
+if prompt_stats:
+    st.sidebar.caption(f"🧠 Prompt 快取：{prompt_stats['entries']} 筆｜本次命中率 {prompt_stats['hit_rate']:.0%}")
+client_stats = yt_client.get_default_factory().stats()
+if client_stats["builds"]:
+    st.sidebar.caption(f"🔌 YouTube client 重用 {client_stats['reused']} 次，省下約 {client_stats['saved_s']:.1f} 秒"
+                       f"｜連線重用 {client_stats['http_reused']} 次")
+registry = peek_registry(GenerativeAIBackend, gemini_key) if gemini_key else None
+if registry and registry.stats:
+    with st.sidebar.expander("🤖 Gemini 模型狀態"):
+        st.dataframe(registry.stats_table(), use_container_width=True, hide_index=True)
+# 各階段耗時（build、search/videos、計分、選模型、上傳、PROCESSING、生成），整個行程累計
+metrics = perf_metrics.get_default_metrics()
+with st.sidebar.expander("⚙️ 效能"):
+    stage_rows = metrics.snapshot()
+    if stage_rows:
+        st.dataframe(stage_rows, use_container_width=True, hide_index=True,
+                     column_order=["stage", "count", "p50_s", "p90_s", "p99_s", "max_s", "errors"])
+    else:
+        st.caption("尚無資料，搜尋或分析後顯示各階段耗時")
+    # 重試、時限、斷路次數與斷路器狀態（見 resilience.py）
+    event_rows = metrics.counter_snapshot()
+    if event_rows:
+        st.dataframe(event_rows, use_container_width=True, hide_index=True)
+    breaker_rows = resilience.breaker_table()
+    if breaker_rows:
+        st.dataframe(breaker_rows, use_container_width=True, hide_index=True)
+    col_m1, col_m2 = st.columns(2)
+    col_m1.download_button("Prometheus", data=metrics.to_prometheus(), file_name="shortsai.prom",
+                           mime="text/plain", use_container_width=True)
+    col_m2.download_button("JSONL", data=metrics.to_jsonl(), file_name="shortsai_metrics.jsonl",
+                           mime="application/jsonl", use_container_width=True)
+    if st.button("重設統計", use_container_width=True):
+        metrics.reset()
+        st.rerun()
+if st.sidebar.button("🧹 清除搜尋快取", type="secondary"):
+    if service:
+        try:
+            service.clear_cache()  # 服務端的快取與水位
+        except trend_service.ServiceError as e:
+            st.sidebar.error(f"❌ {e}")
+            st.stop()
+    else:
+        get_default_cache().clear()
+        get_sweep_store().reset()  # 增量搜尋的水位也清掉，下次整段重搜
+    st.rerun()
 
 # 搜尋按鈕
 if st.sidebar.button("🚀 開始分析", type="primary", use_container_width=True):
     if not api_key:
         st.sidebar.error("❌ 需要 YouTube API Key")
         st.stop()
+    # 依今日剩餘配額規劃搜尋頁數
+    keywords = parse_keywords(keyword)
+    if not keywords:
+        st.sidebar.error("❌ 請輸入關鍵字")
+        st.stop()
+    try:
+        remaining = quota_ledger(api_key).remaining()
+    except trend_service.ServiceError as e:
+        st.sidebar.error(f"❌ {e}")
+        st.stop()
+    plan = plan_queries(remaining, keywords, max_results)
+    if not plan.keywords:
+        st.sidebar.error("❌ 今日 YouTube 配額不足，請明天再試")
+        st.stop()
+    if plan.max_results < max_results or len(plan.keywords) < len(keywords):
+        st.sidebar.warning(f"⚠️ 配額有限，本次只搜尋 {', '.join(plan.keywords)}，每個前 {plan.max_results} 筆")
     with st.spinner("🔍 搜尋熱門 Shorts 中..."):
-        results = fetch_trending_shorts(api_key, keyword, days, min_views, max_results, min_viral, max_duration)
+        try:
+            results = fetch_trending_shorts(api_key, plan.keywords, days, min_views, plan.max_results, min_viral,
+                                            max_duration, min_subs, incremental)
+        except Exception as e:
+            # 暫時性錯誤已自動重試過；到這裡代表重試用完、超過時限或配額用完（斷路中）
+            st.error(f"❌ 搜尋失敗：{e}")
+            st.stop()
         st.session_state.results = results
-        if results:
+        if len(results):
             st.success(f"✅ 找到 {len(results)} 個符合條件的熱門影片！")
         else:
             st.warning("⚠️ 未找到符合條件的影片，請調整搜尋條件")
         st.rerun()
 
+# 追蹤影片更新：不重新搜尋，只打 videos().list(part=statistics)，每 50 部 1 單位
+if st.sidebar.button("🔄 更新追蹤影片（低配額）", use_container_width=True,
+                     help="只更新已搜尋過的影片觀看數，計算觀看速度與加速度"):
+    if not api_key:
+        st.sidebar.error("❌ 需要 YouTube API Key")
+        st.stop()
+    with st.spinner("🔄 更新追蹤影片統計中..."):
+        refresh = service.refresh if service else trends.refresh_tracked
+        st.session_state.results = refresh(api_key, min_views, min_viral, max_duration, min_subs, **RESULT_FORMAT)
+    st.rerun()
+
+# 配額狀態
+ledger = None
+if api_key:
+    try:
+        ledger = quota_ledger(api_key)
+    except trend_service.ServiceError as e:
+        st.sidebar.warning(f"⚠️ 無法取得配額：{e}")
+if ledger:
+    used = ledger.used_today()
+    eta = ledger.projected_exhaustion()
+    st.sidebar.markdown("---")
+    st.sidebar.header("📉 今日 YouTube 配額")
+    st.sidebar.progress(min(used / ledger.daily_quota, 1.0), text=f"{used:,} / {ledger.daily_quota:,} 單位")
+    col_q1, col_q2 = st.sidebar.columns(2)
+    col_q1.metric("消耗速度", f"{ledger.burn_rate():,.0f} /小時")
+    col_q2.metric("預估用完", eta.strftime("%H:%M") if eta else "今日夠用")
+
 # 結果展示
-if "results" in st.session_state and st.session_state.results:
-    df = pd.DataFrame(st.session_state.results)
+if "results" in st.session_state and len(st.session_state.results):
+    df = st.session_state.results
     
     st.markdown(f"## 📊 搜尋結果 ({len(df)} 筆)")
     
@@ -235,22 +294,77 @@ if "results" in st.session_state and st.session_state.results:
     col1, col2 = st.columns(2)
     if col1.button("🤖 生成 AI Prompt", type="primary", use_container_width=True, disabled=not gemini_key):
         if gemini_key:
-            with st.spinner("🎨 AI 生成中..."):
-                result = ai_generate_prompt(gemini_key, selected['url'])
-                st.session_state.ai_result = result
-                st.success("✅ AI Prompt 生成完成！")
+            stream_prompt(gemini_key, selected['url'])
+            st.success("✅ AI Prompt 生成完成！")
     
     # 完整表格
     st.markdown("### 📋 完整搜尋結果")
     st.dataframe(
-        df[['title', 'views', 'viral_score', 'duration', 'published']],
+        df[['title', 'views', 'viral_score', 'velocity', 'acceleration', 'subscribers', 'views_per_sub', 'duration',
+            'published', 'keywords']],
         use_container_width=True,
         column_config={
+            "velocity": st.column_config.NumberColumn("觀看速度/時", format="%.0f", help="最近 6 小時每小時新增觀看數"),
+            "acceleration": st.column_config.NumberColumn("加速度", format="%.1f", help="觀看速度每小時的變化，正數代表還在加速"),
+            "subscribers": st.column_config.NumberColumn("訂閱數", format="%,d", help="空白代表頻道隱藏訂閱數"),
+            "views_per_sub": st.column_config.NumberColumn("觀看/訂閱", format="%.1f", help="觀看數 ÷ 訂閱數，越高代表小頻道爆紅"),
+            "keywords": st.column_config.TextColumn("符合關鍵字"),
             "views": st.column_config.NumberColumn("觀看數", format="%,d"),
             "viral_score": st.column_config.NumberColumn("爆發指數", format="%.1f")
         },
         hide_index=True
     )
+
+    # 批次生成：權杖桶限流 + 同時請求數上限 + 429 退避重試，每完成一筆就更新表格
+    st.markdown("### 🤖 批次生成 AI Prompt")
+    all_rows = st.checkbox("全選", key="batch_select_all")
+    batch_idx = st.multiselect(
+        "選擇要生成的影片",
+        range(len(df)),
+        default=list(range(len(df))) if all_rows else [],
+        format_func=lambda i: f"{df.iloc[i]['title'][:60]} | 爆發指數 {df.iloc[i]['viral_score']:.0f}"
+    )
+    col_b1, col_b2, col_b3 = st.columns([1, 1, 2])
+    rpm = col_b1.number_input("每分鐘上限 (RPM)", 1, 2000, DEFAULT_RPM, help="Gemini 免費版為每分鐘 15 次")
+    concurrency = col_b2.number_input("同時請求數", 1, 10, DEFAULT_CONCURRENCY)
+    if col_b3.button(f"🚀 為選取的 {len(batch_idx)} 部影片生成", type="primary", use_container_width=True,
+                     disabled=not gemini_key or not batch_idx):
+        batch = st.session_state.setdefault("batch_prompts", {})
+        jobs = {}
+        if service:
+            # 快取與選模型都在服務端
+            jobs = {df.iloc[i]['url']: (gemini_key, df.iloc[i]['url']) for i in batch_idx}
+        else:
+            model_name = pick_model(gemini_key)
+            fallbacks = model_registry(gemini_key).candidates()  # 之前換過模型產生的也算命中
+            for i in batch_idx:
+                url = df.iloc[i]['url']
+                hit = cached_prompt(url, model_name, fallbacks)  # 快取命中的不佔用 RPM
+                if hit is not None:
+                    batch[url] = hit
+                else:
+                    jobs[url] = (gemini_key, url, model_name)
+        queue = GenerationQueue(service.prompt if service else generate_prompt_text, rpm=rpm, concurrency=concurrency)
+        total = len(batch_idx)
+        progress = st.progress((total - len(jobs)) / total, text=f"{total - len(jobs)} / {total} 完成（快取）")
+        live_table = st.empty()
+        for done, (url, text, error) in enumerate(queue.map_as_completed(jobs), total - len(jobs) + 1):
+            batch[url] = text if error is None else f"❌ 錯誤：{error}"
+            progress.progress(done / total, text=f"{done} / {total} 完成（429 重試 {queue.retries} 次）")
+            live_table.dataframe(batch_table(df, batch), use_container_width=True, hide_index=True)
+        queue.shutdown()
+        live_table.empty()
+
+    if st.session_state.get("batch_prompts"):
+        batch_df = batch_table(df, st.session_state.batch_prompts)
+        st.dataframe(batch_df, use_container_width=True, hide_index=True,
+                     column_config={"prompt": st.column_config.TextColumn("AI Prompt", width="large")})
+        st.download_button(
+            "💾 下載全部 Prompt.txt",
+            data="\n\n".join(f"{r.title}\n{r.url}\n{r.prompt}" for r in batch_df.itertuples()),
+            file_name="youtube_shorts_ai_prompts.txt",
+            mime="text/plain"
+        )
 # ===== 手動輸入 YT URL =====
 st.markdown("---")
 st.markdown("### 🔗 **手動輸入 YouTube URL 分析**")
@@ -264,11 +378,9 @@ manual_url = col_url1.text_input(
 
 if col_url2.button("🤖 直接生成 Prompt", type="primary", disabled=not gemini_key or not manual_url):
     if gemini_key and manual_url:
-        with st.spinner("🎨 AI 分析中..."):
-            result = ai_generate_prompt(gemini_key, manual_url)
-            st.session_state.ai_result = result
-            st.session_state.manual_mode = True  # 標記手動模式
-            st.success("✅ 手動 URL Prompt 生成完成！")
+        stream_prompt(gemini_key, manual_url)
+        st.session_state.manual_mode = True  # 標記手動模式
+        st.success("✅ 手動 URL Prompt 生成完成！")
             
 # AI Prompt 結果
 if "ai_result" in st.session_state:
@@ -307,7 +419,7 @@ with st.expander("📖 使用說明 & API 申請"):
     2. **Get API Key** → 複製
     
     ### 💡 搜尋技巧
-    - **關鍵字**：`cat` `dog` `cooking` `dance`
+    - **關鍵字**：`cat` `dog` `cooking` `dance`，可用逗號一次搜多個：`cat, dog, cooking`
     - **天數**：1-3天最熱門，7天較全面
     - **爆發指數**：2000+ = 病毒式傳播
     """)
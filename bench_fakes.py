@@ -0,0 +1,219 @@
+"""
+效能測試用的離線假服務（不連網、不需 API Key）
+- FakeYouTube：與 googleapiclient 的 youtube client 同樣的呼叫方式（search / videos / channels().list(...).execute()），
+  回傳錄下來的回應（fixtures JSON）或合成資料，每次呼叫可加固定延遲模擬網路來回
+- synthetic_video_items：產生 videos().list 格式的合成影片（benchmark 與 trend_service --stub 共用）
+- FakeGeminiBackend：與 gemini_models 的 backend 介面相同，可設定延遲、首字時間、錯誤率（429 / 一般錯誤）
+- export_fixtures：把本機 API 快取裡真實的回應匯出成 fixtures，之後可重播
+"""
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+
+def synthetic_video_items(n, seed=0):
+    """ 產生 n 筆 videos().list 格式的假資料 """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    items = []
+    for i in range(n):
+        seconds = rng.randint(3, 180)
+        m, s = divmod(seconds, 60)
+        items.append({
+            "id": f"vid{i:08d}",
+            "snippet": {
+                "title": f"Synthetic short #{i} " + "x" * rng.randint(0, 90),
+                "channelId": f"UC{rng.randint(0, n // 10 + 1):06d}",
+                "publishedAt": (now - timedelta(minutes=rng.randint(10, 14 * 24 * 60))).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            },
+            "contentDetails": {"duration": f"PT{m}M{s}S" if m else f"PT{s}S"},
+            "statistics": {"viewCount": str(rng.randint(0, 5_000_000)), "likeCount": str(rng.randint(0, 100_000))},
+        })
+    return items
+
+
+class FakeRequest:
+    def __init__(self, service, endpoint, fn):
+        self.service = service
+        self.endpoint = endpoint
+        self.fn = fn
+
+    def execute(self, http=None, num_retries=0):
+        self.service.record(self.endpoint)
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        return self.fn()
+
+
+class FakeResource:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def list(self, **params):
+        return self._fn(params)
+
+
+class FakeYouTube:
+    """
+    items：videos().list 格式的影片清單（合成資料）；fixtures：export_fixtures 匯出的錄製回應（優先使用）
+    search 依關鍵字從影片池中取一段（不同關鍵字部分重疊），依 maxResults 翻頁
+    """
+
+    def __init__(self, items=None, fixtures=None, latency=0.0, pages_per_query=10):
+        fixtures = fixtures or {}
+        self.search_pages = fixtures.get("search", [])
+        self.video_items = {item["id"]: item for item in fixtures.get("videos", []) or items or []}
+        self.channel_items = {item["id"]: item for item in fixtures.get("channels", [])}
+        self.video_ids = list(self.video_items)
+        self.latency = latency
+        self.pages_per_query = pages_per_query
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    # ---- googleapiclient 相容介面 ----
+    def search(self):
+        return FakeResource(lambda p: FakeRequest(self, "search", lambda: self._search(p)))
+
+    def videos(self):
+        return FakeResource(lambda p: FakeRequest(self, "videos", lambda: self._videos(p)))
+
+    def channels(self):
+        return FakeResource(lambda p: FakeRequest(self, "channels", lambda: self._channels(p)))
+
+    def _search(self, params):
+        page = int(params.get("pageToken") or 0)
+        if self.search_pages:
+            response = dict(self.search_pages[page % len(self.search_pages)])
+            response.pop("nextPageToken", None)
+            if page + 1 < self.pages_per_query:
+                response["nextPageToken"] = str(page + 1)
+            return response
+        size = params.get("maxResults", 50)
+        # 同一個關鍵字每次拿到同一段影片；不同關鍵字的起點不同
+        start = zlib.crc32(str(params.get("q", "")).encode("utf-8")) % max(1, len(self.video_ids))
+        ids = [self.video_ids[(start + page * size + i) % len(self.video_ids)] for i in range(size)] \
+            if self.video_ids else []
+        response = {"items": [{"id": {"kind": "youtube#video", "videoId": vid}} for vid in ids]}
+        if page + 1 < self.pages_per_query:
+            response["nextPageToken"] = str(page + 1)
+        return response
+
+    def _videos(self, params):
+        return {"items": [self.video_items[vid] for vid in params["id"].split(",") if vid in self.video_items]}
+
+    def _channels(self, params):
+        items = []
+        for cid in params["id"].split(","):
+            item = self.channel_items.get(cid)
+            if item is None:
+                subscribers = zlib.crc32(cid.encode("utf-8")) % 2_000_000
+                item = {"id": cid, "statistics": {"subscriberCount": str(subscribers), "videoCount": "120",
+                                                  "hiddenSubscriberCount": subscribers % 17 == 0}}
+            items.append(item)
+        return {"items": items}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiBackend:
+    """
+    latency：整段生成秒數；ttft：首字時間（串流）；error_rate：失敗機率
+    rate_limit_ratio：失敗中屬於 429 的比例（gemini_queue 會退避重試），其餘為一般錯誤（換下一個模型）
+    """
+    name = "fake"
+
+    def __init__(self, api_key=None, models=("fake-flash", "fake-pro"), latency=0.2, ttft=0.05, chunks=8,
+                 error_rate=0.0, rate_limit_ratio=0.5, seed=0):
+        self.models = list(models)
+        self.latency = latency
+        self.ttft = min(ttft, latency)
+        self.chunks = max(1, chunks)
+        self.error_rate = error_rate
+        self.rate_limit_ratio = rate_limit_ratio
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self, model):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.error_rate
+            rate_limited = self._rng.random() < self.rate_limit_ratio
+            if failed:
+                self.errors += 1
+        if failed:
+            if rate_limited:
+                raise RuntimeError("429 Too Many Requests (injected)")
+            raise RuntimeError(f"500 Internal error on {model} (injected)")
+
+    def _text(self, contents):
+        return f"Fake prompt for {str(contents)[:60]}"
+
+    def list_models(self):
+        return list(self.models)
+
+    def generate(self, model, contents, **kwargs):
+        time.sleep(self.latency)
+        self._maybe_fail(model)
+        return FakeResponse(self._text(contents))
+
+    def stream(self, model, contents, **kwargs):
+        time.sleep(self.ttft)
+        self._maybe_fail(model)
+        text = self._text(contents)
+        step = -(-len(text) // self.chunks)
+        for i in range(0, len(text), step):
+            if i:
+                time.sleep((self.latency - self.ttft) / self.chunks)
+            yield text[i:i + step]
+
+    def image_part(self, data, mime_type="image/jpeg"):
+        return {"mime_type": mime_type, "data": data}
+
+    def probe(self, model):
+        pass
+
+
+def export_fixtures(path, db_path=None):
+    """ 從本機 API 快取（api_cache）匯出錄下的 search / videos / channels 回應，回傳各類筆數 """
+    fixtures = {"search": [], "videos": [], "channels": []}
+    with storage.connect(db_path or storage.data_path(storage.DB_FILE)) as conn:
+        # 還沒搜尋過的新安裝沒有 api_cache / channel_stats 資料表
+        has_cache = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'api_cache'").fetchone()
+        rows = conn.execute("SELECT endpoint, payload FROM api_cache ORDER BY created").fetchall() \
+            if has_cache else []
+        # 頻道不走 API 快取，從 channel_stats 組回 channels().list 格式；videos 為 NULL 的是 API 沒回傳的頻道（負向快取），
+        # 重播時同樣不該出現在回應裡
+        has_channels = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'channel_stats'").fetchone()
+        channel_rows = conn.execute("""SELECT channel_id, subscribers, videos, hidden FROM channel_stats
+            WHERE videos IS NOT NULL""").fetchall() if has_channels else []
+    for endpoint, payload in rows:
+        payload = json.loads(payload)
+        if endpoint == "search":
+            fixtures["search"].append(payload)
+        elif endpoint in fixtures:
+            fixtures[endpoint].extend(payload.get("items", []))
+    for cid, subscribers, videos, hidden in channel_rows:
+        fixtures["channels"].append({"id": cid, "statistics": {
+            "subscriberCount": str(subscribers or 0), "videoCount": str(videos), "hiddenSubscriberCount": bool(hidden)}})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixtures, f, ensure_ascii=False)
+    return {k: len(v) for k, v in fixtures.items()}
+
+
+def load_fixtures(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,460 @@
+"""
+效能基準測試（離線執行，不需 API Key）
+
+    python benchmark.py scoring --items 10000
+    python benchmark.py startup
+    python benchmark.py media sample.mp4 --seconds 30 --height 360
+    python benchmark.py keyframes sample.mp4 [--gemini-key KEY]   # 有 Key 時實際呼叫 Gemini 比較兩種模式
+    python benchmark.py client      # 每次 build vs 重用 YouTube client（不連網）
+    python benchmark.py suite --output runs/today.json --compare runs/baseline.json
+    python benchmark.py record fixtures.json    # 把本機 API 快取裡的真實回應匯出，suite --fixtures 重播
+
+suite 全部離線：YouTube 與 Gemini 都換成 bench_fakes 的假服務，資料寫在暫存資料夾，不動到本機快取
+"""
+import argparse
+import json
+import platform
+import re
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import scoring
+from bench_fakes import synthetic_video_items
+
+
+def legacy_score(items, min_views, min_viral_score, max_duration):
+    """ 舊版逐筆迴圈（每筆三次 re.search、一次 fromisoformat、一次 datetime.now），作為比較基準 """
+    results = []
+    for item in items:
+        d = item["contentDetails"]["duration"]
+        h = re.search(r'(\d+)H', d)
+        m = re.search(r'(\d+)M', d)
+        s = re.search(r'(\d+)S', d)
+        total_seconds = (int(h.group(1)) if h else 0) * 3600 + (int(m.group(1)) if m else 0) * 60 + (int(s.group(1)) if s else 0)
+        if total_seconds > max_duration: continue
+        views = int(item["statistics"].get("viewCount", 0))
+        if views < min_views: continue
+        published = datetime.fromisoformat(item["snippet"]["publishedAt"].replace("Z", "+00:00"))
+        hours_passed = max((datetime.now(timezone.utc) - published).total_seconds() / 3600, 1)
+        viral_score = views / hours_passed
+        if viral_score < min_viral_score: continue
+        mm, ss = divmod(total_seconds, 60)
+        results.append({
+            "title": item["snippet"]["title"], "views": views, "duration": f"{mm}:{ss:02d}",
+            "hours": round(hours_passed, 1), "viral_score": round(viral_score, 2),
+            "published": published.strftime("%Y-%m-%d %H:%M"),
+            "url": f"https://www.youtube.com/watch?v={item['id']}",
+        })
+    results.sort(key=lambda x: x["viral_score"], reverse=True)
+    return results
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_scoring(n_items, repeat=3, min_views=10000, min_viral_score=100, max_duration=60):
+    items = synthetic_video_items(n_items)
+    legacy_time, legacy = best_of(lambda: legacy_score(items, min_views, min_viral_score, max_duration), repeat)
+    vector_time, vector = best_of(lambda: scoring.score_videos(items, min_views, min_viral_score, max_duration), repeat)
+    return {
+        "items": n_items,
+        "kept": len(vector),
+        "legacy_kept": len(legacy),
+        "legacy_s": round(legacy_time, 4),
+        "vectorized_s": round(vector_time, 4),
+        "legacy_items_per_s": round(n_items / legacy_time),
+        "vectorized_items_per_s": round(n_items / vector_time),
+        "speedup": round(legacy_time / vector_time, 2),
+    }
+
+
+# 舊版啟動時在 import 階段就載入的重型套件
+EAGER_IMPORTS = ["requests", "pandas", "googleapiclient.discovery", "google.generativeai"]
+# 目前桌面版／網頁版啟動時實際載入的模組（重型套件改為用到才載入）
+STARTUP_IMPORTS = ["trends", "quota", "yt_search", "yt_cache", "yt_client", "version_check"]
+
+
+def import_time(modules, repeat=3):
+    """ 在全新的子行程裡量 import 時間（秒），取最快一次；缺少的套件略過 """
+    code = ("import importlib, time\n"
+            "t = time.perf_counter()\n"
+            f"for m in {modules!r}:\n"
+            "    try: importlib.import_module(m)\n"
+            "    except ImportError: pass\n"
+            "print(time.perf_counter() - t)")
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip()))
+    return min(times)
+
+
+def bench_startup(repeat=3):
+    import version_check
+
+    start = time.perf_counter()
+    version_check.cached_version()
+    cached_s = time.perf_counter() - start
+    return {
+        "eager_imports_s": round(import_time(EAGER_IMPORTS, repeat), 4),
+        "startup_imports_s": round(import_time(STARTUP_IMPORTS, repeat), 4),
+        "cached_version_s": round(cached_s, 6),
+        "old_version_checks_worst_s": 2 * 5,  # 兩次同步 requests.get(timeout=5)
+    }
+
+
+def bench_client(searches=20):
+    """ 舊版每次搜尋都 build 一次 client；現在每個 Key 只 build 一次。比較 searches 次搜尋的 setup 時間 """
+    import yt_client
+
+    start = time.perf_counter()
+    for i in range(searches):
+        yt_client.build_client("benchmark-key")
+    per_build_s = (time.perf_counter() - start) / searches
+
+    factory = yt_client.ClientFactory()
+    start = time.perf_counter()
+    for i in range(searches):
+        factory.get("benchmark-key")
+    factory_s = time.perf_counter() - start
+    return {
+        "searches": searches,
+        "build_every_time_s": round(per_build_s * searches, 4),
+        "factory_s": round(factory_s, 4),
+        "saved_per_search_ms": round((per_build_s * searches - factory_s) / searches * 1000, 2),
+    }
+
+
+def bench_media(path, settings, uplink_mbps=10.0):
+    """ 本機影片檔跑一次前處理，比較原檔與縮小後的大小，並依上傳頻寬估算上傳時間 """
+    import media_prep
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        _, stages = media_prep.prepare_media(path, work_dir, settings)
+    original = stages[0].bytes
+    prepared = stages[-1].bytes
+    transcode_s = stages[-1].seconds if stages[-1].name == "transcode" else 0.0
+    bytes_per_s = uplink_mbps * 1_000_000 / 8
+    return {
+        "original_bytes": original,
+        "prepared_bytes": prepared,
+        "size_ratio": round(prepared / original, 3) if original else None,
+        "transcode_s": round(transcode_s, 3),
+        "upload_original_s": round(original / bytes_per_s, 2),
+        "upload_prepared_s": round(prepared / bytes_per_s, 2),
+        "saved_s": round(original / bytes_per_s - prepared / bytes_per_s - transcode_s, 2),
+        "stages": media_prep.format_stages(stages),
+    }
+
+
+def bench_keyframes(source, settings, gemini_key=None, uplink_mbps=10.0):
+    """
+    完整影片模式 vs 關鍵畫格模式
+    沒有 Key：只比較本機準備時間與要送出的位元組數；有 Key：兩種模式各實際跑一次（不用快取）
+    """
+    import media_prep
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        start = time.perf_counter()
+        _, video_stages = media_prep.prepare_media(source, work_dir, settings)
+        video_prep_s = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as work_dir:
+        start = time.perf_counter()
+        frames, _, frame_stages = media_prep.prepare_keyframes(source, work_dir, settings)
+        frame_prep_s = time.perf_counter() - start
+
+    bytes_per_s = uplink_mbps * 1_000_000 / 8
+    result = {
+        "video_bytes": video_stages[-1].bytes,
+        "video_prep_s": round(video_prep_s, 3),
+        "video_upload_est_s": round(video_stages[-1].bytes / bytes_per_s, 2),
+        "frames": len(frames),
+        "keyframe_bytes": frame_stages[-1].bytes,
+        "keyframe_prep_s": round(frame_prep_s, 3),
+        "keyframe_upload_est_s": round(frame_stages[-1].bytes / bytes_per_s, 2),
+    }
+    if gemini_key:
+        import video_analysis
+
+        for mode in ("video", "keyframes"):
+            start = time.perf_counter()
+            video_analysis.analyze_video(gemini_key, source, lambda msg: None, mode=mode, media_settings=settings,
+                                         use_cache=False)
+            result[f"{mode}_end_to_end_s"] = round(time.perf_counter() - start, 2)
+    return result
+
+
+SUITE_SCORING_SIZES = [50, 500, 50000]
+SUITE_CONCURRENCY = [1, 2, 4, 8]
+SUITE_KEYWORDS = ["cat", "dog", "cooking", "asmr"]
+REGRESSION_THRESHOLD = 0.10   # 比基準慢超過 10% 視為退步
+
+
+def bench_search(fake, keywords=SUITE_KEYWORDS, max_results=100, runs=2):
+    """
+    端對端搜尋（trends.fetch_trending_shorts：搜尋 → 詳細資料 → 快照 → 計分 → 頻道 → 速度），YouTube 換成假 client
+    第一次是冷快取，之後各次應該全部命中本機快取
+    """
+    import trends
+    import yt_client
+    from channel_store import get_default_store as get_channel_store
+    from quota import key_id
+    from yt_cache import get_default_cache
+
+    api_key = "benchmark-key"
+    factory = yt_client.get_default_factory()
+    factory.http_pool = yt_client.NullPool()   # 假 client 不需要 httplib2 連線
+    factory.clients[key_id(api_key)] = fake
+    cache = get_default_cache()
+    channels = get_channel_store()
+    result = []
+    for run in range(runs):
+        hits, misses = cache.hits, cache.misses
+        channel_hits, channel_fetched = channels.hits, channels.fetched
+        calls = dict(fake.calls)
+        start = time.perf_counter()
+        results = trends.fetch_trending_shorts(api_key, keywords, 7, 0, max_results, 0, 60)
+        elapsed = time.perf_counter() - start
+        lookups = cache.hits - hits + cache.misses - misses
+        channel_lookups = channels.hits - channel_hits + channels.fetched - channel_fetched
+        result.append({
+            "run": "cold" if run == 0 else "warm",
+            "latency_s": round(elapsed, 4),
+            "results": len(results),
+            "api_calls": {k: v - calls.get(k, 0) for k, v in fake.calls.items() if v - calls.get(k, 0)},
+            "cache_hit_rate": round((cache.hits - hits) / lookups, 3) if lookups else 0.0,
+            "channel_hit_rate": round((channels.hits - channel_hits) / channel_lookups, 3) if channel_lookups else 0.0,
+        })
+    return result
+
+
+def bench_batch_analysis(n_videos, concurrency_levels=SUITE_CONCURRENCY, **backend_kwargs):
+    """
+    批次分析（與網頁版批次生成相同：GenerationQueue + 模型自動換手），Gemini 換成假 backend
+    每個同時請求數各跑一輪（不用快取），最後兩輪量 Prompt 快取命中率
+    """
+    import perf_metrics
+    import prompt_cache
+    import video_analysis
+    from bench_fakes import FakeGeminiBackend
+    from gemini_models import ModelRegistry
+    from gemini_queue import GenerationQueue
+
+    urls = [f"https://www.youtube.com/shorts/bench{i:06d}" for i in range(n_videos)]
+
+    def analyze(registry, url, use_cache):
+        contents = [f"video {url}", video_analysis.PROMPT_INSTRUCTION]
+        if use_cache:
+            cached = video_analysis.cached_result(registry, url, "video")
+            if cached is not None:
+                return cached
+        return video_analysis.generate_stage(registry, url, "video", contents, use_cache=use_cache)
+
+    def run_batch(registry, concurrency, use_cache):
+        queue = GenerationQueue(lambda url: analyze(registry, url, use_cache), rpm=60000, concurrency=concurrency,
+                                backoff_base=0.01)
+        start = time.perf_counter()
+        failed = sum(1 for _, _, error in queue.map_as_completed({url: (url,) for url in urls}) if error)
+        elapsed = time.perf_counter() - start
+        queue.shutdown()
+        return elapsed, failed, queue.retries
+
+    def model_retries():
+        return perf_metrics.get_default_metrics().counters.get("gemini.generate.retries", 0)
+
+    levels = []
+    for concurrency in concurrency_levels:
+        backend = FakeGeminiBackend(**backend_kwargs)
+        registry = ModelRegistry(backend, "benchmark-key", backend.models)
+        before = model_retries()
+        elapsed, failed, retries = run_batch(registry, concurrency, use_cache=False)
+        levels.append({"concurrency": concurrency, "wall_s": round(elapsed, 4),
+                       "videos_per_s": round(n_videos / elapsed, 2), "failed": failed, "retries": retries,
+                       "model_retries": model_retries() - before,
+                       "backend_calls": backend.calls, "injected_errors": backend.errors})
+
+    cache = prompt_cache.get_default_cache()
+    registry = ModelRegistry(FakeGeminiBackend(**dict(backend_kwargs, error_rate=0.0)), "benchmark-key", ["fake-flash"])
+    passes = []
+    for _ in range(2):
+        hits, misses = cache.hits, cache.misses
+        elapsed, _, _ = run_batch(registry, max(concurrency_levels), use_cache=True)
+        lookups = cache.hits - hits + cache.misses - misses
+        passes.append({"wall_s": round(elapsed, 4),
+                       "hit_rate": round((cache.hits - hits) / lookups, 3) if lookups else 0.0})
+    return {"videos": n_videos, "levels": levels, "prompt_cache": passes}
+
+
+def run_suite(sizes=SUITE_SCORING_SIZES, videos=20, concurrency_levels=SUITE_CONCURRENCY, fixtures=None,
+              yt_latency=0.02, gemini_latency=0.2, error_rate=0.05, repeat=3):
+    """ 跑完整離線測試組，回傳可存成 JSON 的結果 """
+    from bench_fakes import FakeYouTube, load_fixtures
+
+    fake = FakeYouTube(items=synthetic_video_items(5000), fixtures=load_fixtures(fixtures) if fixtures else None,
+                       latency=yt_latency)
+    return {
+        "created": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"sizes": sizes, "videos": videos, "concurrency": concurrency_levels,
+                   "fixtures": os.path.basename(fixtures) if fixtures else None, "yt_latency_s": yt_latency,
+                   "gemini_latency_s": gemini_latency, "error_rate": error_rate},
+        "scoring": [bench_scoring(n, repeat) for n in sizes],
+        "search": bench_search(fake),
+        "batch_analysis": bench_batch_analysis(videos, concurrency_levels, latency=gemini_latency,
+                                               error_rate=error_rate),
+    }
+
+
+def timing_metrics(report):
+    """ 把結果攤平成 {名稱: 秒數}，只取時間類（越小越好）的數字，用來和基準比較 """
+    metrics = {}
+    for r in report.get("scoring", []):
+        metrics[f"scoring[{r['items']}].vectorized_s"] = r["vectorized_s"]
+    for r in report.get("search", []):
+        metrics[f"search[{r['run']}].latency_s"] = r["latency_s"]
+    for r in report.get("batch_analysis", {}).get("levels", []):
+        metrics[f"batch[c={r['concurrency']}].wall_s"] = r["wall_s"]
+    return metrics
+
+
+def compare_reports(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """ 回傳 [(名稱, 基準, 目前, 變化比例, 是否退步)]，只比兩邊都有的項目 """
+    now, before = timing_metrics(current), timing_metrics(baseline)
+    rows = []
+    for name, value in now.items():
+        if name not in before or not before[name]:
+            continue
+        change = value / before[name] - 1
+        rows.append((name, before[name], value, change, change > threshold))
+    return rows
+
+
+def print_suite(report):
+    for r in report["scoring"]:
+        print(f"計分 {r['items']:>7,} 筆｜向量化 {r['vectorized_s']:.4f}s ({r['vectorized_items_per_s']:,}/s)"
+              f"｜舊版 {r['legacy_s']:.4f}s｜加速 {r['speedup']}x")
+    for r in report["search"]:
+        print(f"搜尋（{r['run']}）{r['latency_s']:.3f}s｜{r['results']} 筆｜API 呼叫 {r['api_calls']}"
+              f"｜快取命中 {r['cache_hit_rate']:.0%}｜頻道命中 {r['channel_hit_rate']:.0%}")
+    batch = report["batch_analysis"]
+    for r in batch["levels"]:
+        print(f"批次分析 {batch['videos']} 部｜同時 {r['concurrency']}｜{r['wall_s']:.2f}s"
+              f"（{r['videos_per_s']} 部/s）｜失敗 {r['failed']}｜429 重試 {r['retries']}"
+              f"｜整輪重試 {r.get('model_retries', 0)}")
+    for i, r in enumerate(batch["prompt_cache"], 1):
+        print(f"Prompt 快取第 {i} 輪：{r['wall_s']:.2f}s｜命中率 {r['hit_rate']:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ShortsAI 離線效能測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_scoring = sub.add_parser("scoring", help="逐筆迴圈 vs 向量化計分")
+    p_scoring.add_argument("--items", type=int, nargs="+", default=[10000])
+    p_scoring.add_argument("--repeat", type=int, default=3)
+    p_startup = sub.add_parser("startup", help="冷啟動 import 時間與版本檢查")
+    p_startup.add_argument("--repeat", type=int, default=3)
+    p_media = sub.add_parser("media", help="上傳前縮小影片：大小與時間比較（需要 ffmpeg）")
+    p_media.add_argument("file", help="本機影片檔")
+    p_media.add_argument("--seconds", type=int, default=30)
+    p_media.add_argument("--height", type=int, default=360)
+    p_media.add_argument("--fps", type=int, default=8)
+    p_media.add_argument("--bitrate", default="300k")
+    p_media.add_argument("--uplink-mbps", type=float, default=10.0)
+    p_client = sub.add_parser("client", help="YouTube client 每次 build vs 重用")
+    p_client.add_argument("--searches", type=int, default=20)
+    p_frames = sub.add_parser("keyframes", help="完整影片 vs 關鍵畫格模式（需要 ffmpeg）")
+    p_frames.add_argument("source", help="本機影片檔或 YouTube 網址")
+    p_frames.add_argument("--seconds", type=int, default=30)
+    p_frames.add_argument("--max-frames", type=int, default=8)
+    p_frames.add_argument("--gemini-key", help="有填才會實際呼叫 Gemini")
+    p_frames.add_argument("--uplink-mbps", type=float, default=10.0)
+    p_suite = sub.add_parser("suite", help="完整離線測試組（假 YouTube / 假 Gemini），結果存成 JSON")
+    p_suite.add_argument("--sizes", type=int, nargs="+", default=SUITE_SCORING_SIZES)
+    p_suite.add_argument("--videos", type=int, default=20, help="批次分析的影片數")
+    p_suite.add_argument("--concurrency", type=int, nargs="+", default=SUITE_CONCURRENCY)
+    p_suite.add_argument("--fixtures", help="record 匯出的回應檔，沒給就用合成資料")
+    p_suite.add_argument("--yt-latency", type=float, default=0.02, help="每次 YouTube API 呼叫的模擬延遲（秒）")
+    p_suite.add_argument("--gemini-latency", type=float, default=0.2, help="每次生成的模擬延遲（秒）")
+    p_suite.add_argument("--error-rate", type=float, default=0.05, help="Gemini 模擬錯誤率（一半為 429）")
+    p_suite.add_argument("--repeat", type=int, default=3)
+    p_suite.add_argument("--output", help="結果 JSON 存放路徑")
+    p_suite.add_argument("--compare", help="基準結果 JSON，列出變慢超過門檻的項目")
+    p_suite.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    p_record = sub.add_parser("record", help="把本機 API 快取裡的回應匯出成 fixtures")
+    p_record.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "scoring":
+        for n in args.items:
+            r = bench_scoring(n, args.repeat)
+            print(f"{r['items']:>8,} 筆｜舊版 {r['legacy_s']:.4f}s ({r['legacy_items_per_s']:,}/s)"
+                  f"｜向量化 {r['vectorized_s']:.4f}s ({r['vectorized_items_per_s']:,}/s)"
+                  f"｜加速 {r['speedup']}x｜保留 {r['kept']} 筆")
+    elif args.command == "startup":
+        r = bench_startup(args.repeat)
+        print(f"舊版啟動 import：{r['eager_imports_s']:.3f}s ＋ 版本檢查最多 {r['old_version_checks_worst_s']}s（離線時）")
+        print(f"目前啟動 import：{r['startup_imports_s']:.3f}s ＋ 讀本機版本快取 {r['cached_version_s'] * 1000:.2f}ms")
+    elif args.command == "media":
+        if not os.path.isfile(args.file):
+            parser.error(f"找不到檔案：{args.file}")
+        settings = {"max_seconds": args.seconds, "height": args.height, "fps": args.fps, "video_bitrate": args.bitrate}
+        r = bench_media(args.file, settings, args.uplink_mbps)
+        print(r["stages"])
+        print(f"上傳量：{r['original_bytes'] / 1024 / 1024:.1f} MB → {r['prepared_bytes'] / 1024 / 1024:.1f} MB"
+              f"（{r['size_ratio']:.0%}）")
+        print(f"上傳時間（{args.uplink_mbps:g} Mbps）：{r['upload_original_s']}s → {r['upload_prepared_s']}s"
+              f"，扣掉轉檔 {r['transcode_s']}s 後省下 {r['saved_s']}s")
+    elif args.command == "client":
+        r = bench_client(args.searches)
+        print(f"{r['searches']} 次搜尋：每次 build {r['build_every_time_s']:.3f}s｜重用 {r['factory_s']:.3f}s"
+              f"｜每次搜尋省下 {r['saved_per_search_ms']:.1f}ms（另外省下 TLS 握手，視網路而定）")
+    elif args.command == "keyframes":
+        settings = {"max_seconds": args.seconds, "max_frames": args.max_frames}
+        r = bench_keyframes(args.source, settings, args.gemini_key, args.uplink_mbps)
+        print(f"完整影片：準備 {r['video_prep_s']}s，送出 {r['video_bytes'] / 1024:.0f} KB"
+              f"（{args.uplink_mbps:g} Mbps 約 {r['video_upload_est_s']}s，另加雲端處理）")
+        print(f"關鍵畫格：準備 {r['keyframe_prep_s']}s，{r['frames']} 張共 {r['keyframe_bytes'] / 1024:.0f} KB"
+              f"（約 {r['keyframe_upload_est_s']}s，無雲端處理）")
+        if args.gemini_key:
+            print(f"實際總時間：完整影片 {r['video_end_to_end_s']}s｜關鍵畫格 {r['keyframes_end_to_end_s']}s")
+
+    elif args.command == "suite":
+        # 資料寫在暫存資料夾：快取從空的開始，也不會動到平常使用的 shorts_data.sqlite3
+        os.environ["SHORTSAI_DATA_DIR"] = tempfile.mkdtemp(prefix="shortsai_bench_")
+        report = run_suite(args.sizes, args.videos, args.concurrency, args.fixtures, args.yt_latency,
+                           args.gemini_latency, args.error_rate, args.repeat)
+        print_suite(report)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"結果已存到 {args.output}")
+        if args.compare:
+            with open(args.compare, "r", encoding="utf-8") as f:
+                rows = compare_reports(report, json.load(f), args.threshold)
+            for name, before, now, change, regressed in rows:
+                print(f"{'⚠️ 退步' if regressed else '   '} {name}：{before} → {now}（{change:+.0%}）")
+            if any(r[4] for r in rows):
+                sys.exit(1)
+    elif args.command == "record":
+        from bench_fakes import export_fixtures
+
+        counts = export_fixtures(args.output)
+        print(f"已匯出 search {counts['search']} 頁、videos {counts['videos']} 筆、channels {counts['channels']} 筆"
+              f" → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+頻道訂閱數（本機 SQLite，有效期限內不重查）
+- 從搜尋結果收集 snippet.channelId，沒查過或過期的才打 channels().list(part=statistics)，50 個一批、每批 1 單位
+- 訂閱數變化慢，預設 24 小時內直接用本機資料；重複搜尋同一類關鍵字幾乎不再花配額
+- 結果加上 subscribers / channel_videos / views_per_sub（觀看數 ÷ 訂閱數，越高越是「小頻道爆紅」）
+- 頻道隱藏訂閱數時 subscribers 為 NaN，不會被 min_subs 過濾掉
+- 回應裡沒有的頻道（已刪除 / 停權）也記一筆空資料，有效期限內不再重查
+"""
+import time
+
+import pandas as pd
+
+import storage
+from yt_search import fetch_channels
+
+CHANNEL_TTL = 24 * 3600
+
+
+class ChannelStore:
+    def __init__(self, path=None, ttl=CHANNEL_TTL):
+        self.path = path or storage.data_path(storage.DB_FILE)
+        self.ttl = ttl
+        self.hits = 0
+        self.fetched = 0
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS channel_stats (
+                channel_id TEXT PRIMARY KEY, subscribers INTEGER, videos INTEGER, hidden INTEGER, fetched REAL)""")
+
+    def lookup(self, channel_ids, now=None):
+        """ 有效期限內的 {channel_id: (subscribers 或 None, videos)} """
+        since = (now or time.time()) - self.ttl
+        found = {}
+        with storage.connect(self.path) as conn:
+            # SQLite 參數數量有上限，分段查詢
+            for i in range(0, len(channel_ids), 500):
+                batch = channel_ids[i:i + 500]
+                rows = conn.execute(f"""SELECT channel_id, subscribers, videos, hidden FROM channel_stats
+                    WHERE fetched >= ? AND channel_id IN ({','.join('?' * len(batch))})""", [since] + batch).fetchall()
+                found.update({cid: (None if hidden else subs, videos) for cid, subs, videos, hidden in rows})
+        return found
+
+    def record_items(self, items, ts=None):
+        """ 存入 channels().list 的 items """
+        ts = ts or time.time()
+        rows = []
+        for item in items:
+            stats = item.get("statistics", {})
+            hidden = bool(stats.get("hiddenSubscriberCount"))
+            rows.append((item["id"], None if hidden else int(stats.get("subscriberCount", 0)),
+                         int(stats.get("videoCount", 0)), int(hidden), ts))
+        with storage.connect(self.path) as conn:
+            conn.executemany("INSERT OR REPLACE INTO channel_stats VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def record_missing(self, channel_ids, ts=None):
+        """ channels().list 沒回傳的頻道：subscribers / videos 留空，當作查過（負向快取） """
+        ts = ts or time.time()
+        with storage.connect(self.path) as conn:
+            conn.executemany("INSERT OR REPLACE INTO channel_stats VALUES (?, NULL, NULL, 0, ?)",
+                             [(cid, ts) for cid in channel_ids])
+        return len(channel_ids)
+
+    def get(self, youtube, channel_ids, ledger=None):
+        """ 先查本機，缺的或過期的才打 API；回傳 {channel_id: (subscribers 或 None, videos)} """
+        channel_ids = list(dict.fromkeys(c for c in channel_ids if c))
+        found = self.lookup(channel_ids)
+        missing = [c for c in channel_ids if c not in found]
+        self.hits += len(found)
+        if missing:
+            items = fetch_channels(youtube, missing, ledger=ledger)
+            ts = time.time()
+            self.record_items(items, ts)
+            self.record_missing(set(missing) - {item["id"] for item in items}, ts)
+            self.fetched += len(missing)
+            found.update(self.lookup(missing))
+        return found
+
+    def stats(self):
+        with storage.connect(self.path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM channel_stats WHERE fetched >= ?",
+                                 (time.time() - self.ttl,)).fetchone()[0]
+        return {"channels": count, "hits": self.hits, "fetched": self.fetched}
+
+
+def add_channel_stats(results, store, youtube, ledger=None, min_subs=0):
+    """
+    在搜尋結果 DataFrame 加上 subscribers / channel_videos / views_per_sub 欄位
+    min_subs > 0 時過濾掉訂閱數不足的頻道（隱藏訂閱數的保留）
+    """
+    if results.empty:
+        return results.assign(subscribers=pd.Series(dtype="float64"), channel_videos=pd.Series(dtype="float64"),
+                              views_per_sub=pd.Series(dtype="float64"))
+    channels = store.get(youtube, results["channel_id"].tolist(), ledger=ledger)
+    channel_ids = results["channel_id"]
+    subscribers = channel_ids.map({c: s for c, (s, _) in channels.items()}).astype("float64")
+    results = results.assign(
+        subscribers=subscribers.to_numpy(),
+        channel_videos=channel_ids.map({c: v for c, (_, v) in channels.items()}).astype("float64").to_numpy(),
+        views_per_sub=(results["views"] / subscribers.where(subscribers > 0)).round(2).to_numpy(),
+    )
+    if min_subs:
+        results = results[~(results["subscribers"] < min_subs)].reset_index(drop=True)
+    return results
+
+
+_default_store = None
+
+
+def get_default_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = ChannelStore()
+    return _default_store
@@ -0,0 +1,315 @@
+"""
+Gemini 模型清單（每個 API Key 只查一次，TTL 內共用）
+- 列出支援 generateContent 的模型，依優先順序排好，並實際試打第一個可用的模型
+- 記錄每個模型的延遲、首字時間與錯誤次數；生成時失敗就自動換下一個模型
+- 串流模式邊生成邊回呼，介面不用等整段結果
+- 所有模型都失敗且是暫時性錯誤（429、5xx）時整輪退避重試；連續被限流就斷路（見 resilience）
+支援兩種 SDK：google.generativeai（網頁版）與 google.genai（桌面版）
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+
+import perf_metrics
+import resilience
+import storage
+from quota import key_id
+
+MODEL_TTL = 6 * 3600
+FAILURE_COOLDOWN = 600     # 連續失敗的模型 10 分鐘內排到最後
+MAX_PROBES = 3
+
+StreamResult = namedtuple("StreamResult", "model text ttft total")
+
+
+def _short_name(name):
+    return name[len("models/"):] if name.startswith("models/") else name
+
+
+class GenerativeAIBackend:
+    """ google.generativeai（app.py） """
+    name = "generativeai"
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.genai = genai
+
+    def list_models(self):
+        return [_short_name(m.name) for m in self.genai.list_models()
+                if "generateContent" in getattr(m, "supported_generation_methods", ["generateContent"])]
+
+    def generate(self, model, contents, timeout=None, **kwargs):
+        if timeout:
+            kwargs["request_options"] = {**kwargs.get("request_options", {}), "timeout": timeout}
+        return self.genai.GenerativeModel(model).generate_content(contents, **kwargs)
+
+    def stream(self, model, contents, timeout=None, **kwargs):
+        if timeout:
+            kwargs["request_options"] = {**kwargs.get("request_options", {}), "timeout": timeout}
+        for chunk in self.genai.GenerativeModel(model).generate_content(contents, stream=True, **kwargs):
+            yield chunk.text
+
+    def image_part(self, data, mime_type="image/jpeg"):
+        return {"mime_type": mime_type, "data": data}
+
+    def probe(self, model):
+        self.generate(model, "ping", generation_config={"max_output_tokens": 1})
+
+
+def _with_timeout(kwargs, timeout):
+    """ google.genai 的逾時放在 config.http_options（毫秒） """
+    if not timeout:
+        return kwargs
+    config = kwargs.get("config") or {}
+    http_options = {"timeout": max(int(timeout * 1000), 1)}
+    if isinstance(config, dict):
+        config = {**config, "http_options": http_options}
+    else:
+        config = config.model_copy(update={"http_options": http_options})
+    return {**kwargs, "config": config}
+
+
+class GenAIBackend:
+    """ google.genai（ShortWithGeminiPrompt.py），client 也給上傳檔案用 """
+    name = "genai"
+
+    def __init__(self, api_key):
+        from google import genai
+        self.client = genai.Client(api_key=api_key)
+
+    def list_models(self):
+        return [_short_name(m.name) for m in self.client.models.list()
+                if "generateContent" in (getattr(m, "supported_actions", None) or ["generateContent"])]
+
+    def generate(self, model, contents, timeout=None, **kwargs):
+        return self.client.models.generate_content(model=model, contents=contents, **_with_timeout(kwargs, timeout))
+
+    def stream(self, model, contents, timeout=None, **kwargs):
+        for chunk in self.client.models.generate_content_stream(model=model, contents=contents,
+                                                                **_with_timeout(kwargs, timeout)):
+            yield chunk.text
+
+    def image_part(self, data, mime_type="image/jpeg"):
+        from google.genai import types
+        return types.Part.from_bytes(data=data, mime_type=mime_type)
+
+    def probe(self, model):
+        self.generate(model, "ping", config={"max_output_tokens": 1})
+
+
+def _remaining(expires):
+    """ 距離 expires（monotonic）還剩幾秒；已經到期就丟出 DeadlineExceeded，不再換下一個模型 """
+    if expires is None:
+        return None
+    remaining = expires - time.monotonic()
+    if remaining <= 0:
+        raise resilience.DeadlineExceeded("Gemini 生成超過時限")
+    return remaining
+
+
+def _ewma(avg, value):
+    return value if avg is None else 0.7 * avg + 0.3 * value
+
+
+class ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_error = ""
+        self.last_error_at = 0.0
+        self.avg_latency = None   # 指數移動平均（秒）
+        self.avg_ttft = None      # 串流首字時間，同上
+
+    def record(self, latency=None, error=None, ttft=None):
+        self.calls += 1
+        if error is None:
+            self.consecutive_errors = 0
+            self.avg_latency = _ewma(self.avg_latency, latency)
+            if ttft is not None:
+                self.avg_ttft = _ewma(self.avg_ttft, ttft)
+        else:
+            self.errors += 1
+            self.consecutive_errors += 1
+            self.last_error = str(error)[:200]
+            self.last_error_at = time.time()
+
+    def cooling_down(self):
+        return self.consecutive_errors > 0 and time.time() - self.last_error_at < FAILURE_COOLDOWN
+
+
+class ModelRegistry:
+    def __init__(self, backend, api_key, priority, ttl=MODEL_TTL, path=None):
+        self.backend = backend
+        self.key = key_id(api_key)
+        self.priority = [_short_name(p) for p in priority]
+        self.ttl = ttl
+        self.path = path or storage.data_path(storage.DB_FILE)
+        self.stats = {}
+        self.breaker = resilience.get_breaker(f"gemini:{self.key}")
+        self._models = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS gemini_models (
+                key_id TEXT, backend TEXT, models TEXT, probed_at REAL, PRIMARY KEY (key_id, backend))""")
+
+    def _stats(self, model):
+        return self.stats.setdefault(model, ModelStats())
+
+    def _load(self):
+        """ 記憶體 → 本機資料庫 → 連網查詢並試打 """
+        now = time.time()
+        if self._models is not None and now - self._loaded_at < self.ttl:
+            return self._models
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT models, probed_at FROM gemini_models WHERE key_id = ? AND backend = ?",
+                               (self.key, self.backend.name)).fetchone()
+        if row and now - row[1] < self.ttl:
+            self._models, self._loaded_at = json.loads(row[0]), row[1]
+            return self._models
+
+        with perf_metrics.span("gemini.models"):
+            listed = self.backend.list_models()
+            ordered = [m for m in self.priority if m in listed] + [m for m in listed if m not in self.priority]
+            self._models = self._probe(ordered)
+        self._loaded_at = now
+        with storage.connect(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO gemini_models VALUES (?, ?, ?, ?)",
+                         (self.key, self.backend.name, json.dumps(self._models), now))
+        return self._models
+
+    def _probe(self, ordered):
+        """ 依序試打，第一個成功的排最前面；試打失敗的排到最後 """
+        failed = []
+        for model in ordered[:MAX_PROBES]:
+            start = time.perf_counter()
+            try:
+                self.backend.probe(model)
+            except Exception as e:
+                self._stats(model).record(error=e)
+                failed.append(model)
+                continue
+            self._stats(model).record(latency=time.perf_counter() - start)
+            break
+        return [m for m in ordered if m not in failed] + failed
+
+    def refresh(self):
+        with self._lock:
+            self._models = None
+            with storage.connect(self.path) as conn:
+                conn.execute("DELETE FROM gemini_models WHERE key_id = ? AND backend = ?", (self.key, self.backend.name))
+            return self._load()
+
+    def candidates(self):
+        """ 可用模型的嘗試順序：最近連續失敗的排到最後 """
+        with self._lock:
+            models = list(self._load())
+        return [m for m in models if not self._stats(m).cooling_down()] + \
+               [m for m in models if self._stats(m).cooling_down()]
+
+    def primary(self):
+        candidates = self.candidates()
+        if not candidates:
+            raise RuntimeError("無可用 Gemini 模型，請檢查 API Key")
+        return candidates[0]
+
+    def generate(self, contents, models=None, **kwargs):
+        """ 依序嘗試模型，回傳 (實際使用的模型, response)；全部失敗時退避重試，仍失敗丟出最後一個錯誤 """
+        return resilience.call(lambda timeout: self._generate_once(contents, models, timeout, **kwargs),
+                               "gemini.generate", breaker=self.breaker, deadline=resilience.DEADLINES["gemini.generate"],
+                               pass_timeout=True, **resilience.GEMINI_RETRY)
+
+    def _generate_once(self, contents, models=None, timeout=None, **kwargs):
+        """ timeout：這一輪（含換模型）剩餘的秒數，每個模型的請求逾時取剩下的時間 """
+        last_error = RuntimeError("無可用 Gemini 模型，請檢查 API Key")
+        expires = None if timeout is None else time.monotonic() + timeout
+        for model in models or self.candidates():
+            timeout = _remaining(expires)
+            start = time.perf_counter()
+            try:
+                response = self.backend.generate(model, contents, timeout=timeout, **kwargs)
+            except Exception as e:
+                self._stats(model).record(error=e)
+                perf_metrics.observe("gemini.generate", time.perf_counter() - start, error=True)
+                last_error = e
+                continue
+            latency = time.perf_counter() - start
+            self._stats(model).record(latency=latency)
+            perf_metrics.observe("gemini.generate", latency)
+            return model, response
+        raise last_error
+
+    def stream(self, contents, on_chunk, models=None, **kwargs):
+        """
+        串流生成，每收到一段文字就呼叫 on_chunk(text)，回傳 StreamResult
+        還沒輸出任何文字前失敗才換下一個模型或重試（已輸出一半就直接拋出，避免內容重複）
+        """
+        emitted = []
+
+        def forward(text):
+            emitted.append(True)
+            on_chunk(text)
+
+        return resilience.call(lambda timeout: self._stream_once(contents, forward, models, timeout, **kwargs),
+                               "gemini.generate", breaker=self.breaker, deadline=resilience.DEADLINES["gemini.generate"],
+                               retry_if=lambda e: not emitted and resilience.is_retriable(e), pass_timeout=True,
+                               **resilience.GEMINI_RETRY)
+
+    def _stream_once(self, contents, on_chunk, models=None, timeout=None, **kwargs):
+        last_error = RuntimeError("無可用 Gemini 模型，請檢查 API Key")
+        expires = None if timeout is None else time.monotonic() + timeout
+        for model in models or self.candidates():
+            timeout = _remaining(expires)
+            start = time.perf_counter()
+            ttft = None
+            parts = []
+            try:
+                for text in self.backend.stream(model, contents, timeout=timeout, **kwargs):
+                    if not text:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(text)
+                    on_chunk(text)
+            except Exception as e:
+                self._stats(model).record(error=e)
+                perf_metrics.observe("gemini.generate", time.perf_counter() - start, error=True)
+                if parts:
+                    raise
+                last_error = e
+                continue
+            total = time.perf_counter() - start
+            self._stats(model).record(latency=total, ttft=ttft)
+            perf_metrics.observe("gemini.generate", total)
+            if ttft is not None:
+                perf_metrics.observe("gemini.ttft", ttft)
+            return StreamResult(model, "".join(parts), ttft, total)
+        raise last_error
+
+    def stats_table(self):
+        return [{"model": m, "calls": s.calls, "errors": s.errors,
+                 "avg_latency_s": None if s.avg_latency is None else round(s.avg_latency, 3),
+                 "avg_ttft_s": None if s.avg_ttft is None else round(s.avg_ttft, 3),
+                 "last_error": s.last_error} for m, s in self.stats.items()]
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(backend_cls, api_key, priority):
+    """ 同一個 SDK + API Key 在行程內共用一個 registry """
+    cache_key = (backend_cls.name, key_id(api_key))
+    with _registries_lock:
+        registry = _registries.get(cache_key)
+        if registry is None:
+            registry = _registries[cache_key] = ModelRegistry(backend_cls(api_key), api_key, priority)
+        return registry
+
+
+def peek_registry(backend_cls, api_key):
+    """ 只查已建立的 registry（不載入 SDK、不連網），沒有則回傳 None """
+    return _registries.get((backend_cls.name, key_id(api_key)))
@@ -0,0 +1,103 @@
+"""
+Gemini 批次生成佇列
+- 權杖桶限流：依設定的每分鐘請求數（免費版 15 RPM）平均放行，不會一次衝出去被擋
+- 同時進行的請求數有上限
+- 遇到 429 / 配額錯誤時指數退避重試（完整抖動）；斷路中至少等到斷路器冷卻結束，每筆有總時限
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import perf_metrics
+import resilience
+
+DEFAULT_RPM = 15
+DEFAULT_CONCURRENCY = 3
+MAX_RETRIES = 4
+BACKOFF_BASE = 4.0   # 秒；第 n 次重試等 0～4, 0～8, 0～16... 秒（完整抖動）
+BACKOFF_MAX = 60.0
+
+
+class TokenBucket:
+    """ 每分鐘 rate_per_minute 個權杖，最多累積 burst 個 """
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """ 取得一個權杖，必要時等待；超過 timeout 回傳 False """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def is_rate_limit_error(error):
+    """ 429 / ResourceExhausted / 配額錯誤 """
+    text = f"{type(error).__name__} {error}"
+    return any(s in text for s in ("429", "ResourceExhausted", "RESOURCE_EXHAUSTED", "Too Many Requests", "quota"))
+
+
+class GenerationQueue:
+    """
+    fn(*args) 丟進佇列執行；同一個佇列共用一個限流器
+    submit() 回傳 Future，可用 as_completed() 逐筆取得結果
+    """
+
+    def __init__(self, fn, rpm=DEFAULT_RPM, concurrency=DEFAULT_CONCURRENCY, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, deadline=resilience.DEADLINES["gemini.generate"]):
+        self.fn = fn
+        self.bucket = TokenBucket(rpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.deadline = deadline
+        self.pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def _run(self, args):
+        start = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                return self.fn(*args)
+            except Exception as e:
+                circuit_open = isinstance(e, resilience.CircuitOpenError)
+                if attempt >= self.max_retries or not (circuit_open or is_rate_limit_error(e)):
+                    raise
+                delay = resilience.backoff_delay(attempt, self.backoff_base, BACKOFF_MAX)
+                if circuit_open:
+                    delay = max(delay, e.retry_after)
+                if time.monotonic() - start + delay > self.deadline:
+                    perf_metrics.increment("gemini.queue.deadline")
+                    raise resilience.DeadlineExceeded(f"超過 {self.deadline:.0f} 秒仍被限流：{e}") from e
+                with self._lock:
+                    self.retries += 1
+                perf_metrics.increment("gemini.queue.retries")
+                time.sleep(delay)
+
+    def submit(self, *args):
+        return self.pool.submit(self._run, args)
+
+    def map_as_completed(self, jobs):
+        """ jobs 為 {key: args tuple}，依完成順序 yield (key, 結果, 例外) """
+        futures = {self.submit(*args): key for key, args in jobs.items()}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield futures[future], (None if error else future.result()), error
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait, cancel_futures=not wait)
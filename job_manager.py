@@ -0,0 +1,144 @@
+"""
+桌面版 AI 分析工作管理（不依賴 Tkinter）
+- 固定大小的執行緒池，不會每按一次就多開一條執行緒
+- 同一部影片 + 同一模式還在跑時不重複送出，共用同一個工作與結果
+- 可取消：還沒開始的直接移除；執行中的在下一個階段回報時中止
+- 每個工作保留進度紀錄與（串流中的）結果文字，介面輪詢 snapshot() 顯示狀態
+每個工作的暫存檔放在各自的暫存資料夾（見 video_analysis.analyze_video），彼此不會互相覆蓋
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import prompt_cache
+
+DEFAULT_WORKERS = 2
+MAX_FINISHED = 50   # 狀態清單最多保留幾個已結束的工作
+
+STATE_QUEUED = "排隊中"
+STATE_RUNNING = "執行中"
+STATE_DONE = "完成"
+STATE_FAILED = "失敗"
+STATE_CANCELLED = "已取消"
+
+
+class JobCancelled(BaseException):
+    """ 繼承 BaseException：不會被模型失敗時換下一個模型的 except Exception 攔下來 """
+
+
+class AIJob:
+    def __init__(self, job_id, url, mode):
+        self.id = job_id
+        self.url = url
+        self.mode = mode
+        self.state = STATE_QUEUED
+        self.log = []
+        self.text = ""
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self.cancelled = threading.Event()
+
+    @property
+    def active(self):
+        return self.state in (STATE_QUEUED, STATE_RUNNING)
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobManager:
+    """
+    job, is_new = manager.submit(url, mode, run)
+    run(progress, chunk) 回傳結果文字；progress(訊息)、chunk(文字) 由工作管理器轉給 listener
+    listener(job, 事件, 內容)：事件為 "progress" / "chunk" / "done"，在背景執行緒呼叫
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, listener=None):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ai-job")
+        self.listener = listener or (lambda job, event, data: None)
+        self.jobs = {}
+        self._inflight = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, url, mode, run):
+        """ 同一影片 + 模式還在跑就回傳既有的工作（is_new=False） """
+        key = (prompt_cache.canonical_url(url), mode)
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None and job.active:
+                return job, False
+            job = AIJob(next(self._ids), key[0], mode)
+            self.jobs[job.id] = job
+            self._inflight[key] = job
+            self._trim()
+            job.future = self.pool.submit(self._run, job, run)
+        return job, True
+
+    def _run(self, job, run):
+        if job.cancelled.is_set():
+            return self._finish(job, STATE_CANCELLED)
+        job.state = STATE_RUNNING
+        job.started = time.time()
+
+        def progress(msg):
+            if job.cancelled.is_set():
+                raise JobCancelled()
+            job.log.append(msg)
+            self.listener(job, "progress", msg)
+
+        def chunk(text):
+            if job.cancelled.is_set():
+                raise JobCancelled()
+            job.text += text
+            self.listener(job, "chunk", text)
+
+        try:
+            result = run(progress, chunk)
+        except JobCancelled:
+            return self._finish(job, STATE_CANCELLED)
+        except Exception as e:
+            job.error = e
+            return self._finish(job, STATE_FAILED)
+        job.text = result
+        self._finish(job, STATE_DONE)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.time()
+        with self._lock:
+            key = (job.url, job.mode)
+            if self._inflight.get(key) is job:
+                del self._inflight[key]
+        self.listener(job, "done", state)
+
+    def _trim(self):
+        finished = [j for j in self.jobs.values() if not j.active]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self.jobs[job.id]
+
+    def cancel(self, job_id):
+        """ 排隊中的直接取消；執行中的標記後在下一次進度回報時中止 """
+        job = self.jobs.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancelled.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, STATE_CANCELLED)
+        return True
+
+    def snapshot(self):
+        """ 依建立順序回傳所有工作（介面輪詢用） """
+        with self._lock:
+            return list(self.jobs.values())
+
+    def shutdown(self, wait=False):
+        for job in self.snapshot():
+            job.cancelled.set()
+        self.pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,195 @@
+"""
+影片前處理（上傳 Gemini 前先縮小）
+- 只下載前 N 秒（yt_dlp download_ranges），不抓整部影片
+- ffmpeg 轉成低解析度、低幀率、低位元率，減少上傳量與 Gemini 端 PROCESSING 時間
+- 關鍵畫格模式：只抽場景切換的畫面（JPEG），不用上傳整部影片
+- 每個階段記錄檔案大小與耗時；來源可以是網址或本機檔案（方便離線測試）
+找不到 ffmpeg 時退回整段下載、不轉檔；ffmpeg 每次執行與下載連線都有時限，卡住時會丟出錯誤而不是一直等
+"""
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from resilience import DEADLINES
+
+DEFAULT_SETTINGS = {
+    "max_seconds": 30,        # 只取前 30 秒；0 = 整部
+    "height": 360,            # 最大高度（不放大）
+    "fps": 8,
+    "video_bitrate": "300k",
+    "audio_bitrate": "32k",   # 空字串 = 不要聲音
+    "max_frames": 8,          # 關鍵畫格模式最多幾張
+    "scene_threshold": 0.3,   # 場景變化門檻（0~1，越小抽越多）
+}
+DOWNLOAD_FORMAT = "best[ext=mp4][height<=720]/best[ext=mp4]/tiny"
+SOCKET_TIMEOUT = 30                     # 下載連線多久沒資料就放棄（yt_dlp 會自行重試幾次）
+FFMPEG_TIMEOUT = DEADLINES["media.ffmpeg"]
+
+Stage = namedtuple("Stage", "name bytes seconds")
+
+
+def find_ffmpeg():
+    """ 環境變數 SHORTSAI_FFMPEG → 打包在 exe 裡的 ffmpeg → PATH """
+    candidates = [os.environ.get("SHORTSAI_FFMPEG")]
+    if hasattr(sys, "_MEIPASS"):
+        candidates += [os.path.join(sys._MEIPASS, "ffmpeg.exe"), os.path.join(sys._MEIPASS, "ffmpeg")]
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+    return shutil.which("ffmpeg")
+
+
+def is_url(source):
+    return "://" in source or source.startswith(("youtube.com", "www.youtube.com", "youtu.be"))
+
+
+def download_segment(url, out_path, max_seconds=0, ffmpeg=None):
+    """ 下載影片；有 ffmpeg 且 max_seconds > 0 時只抓前 max_seconds 秒 """
+    import yt_dlp  # 用到時才載入
+
+    opts = {"format": DOWNLOAD_FORMAT, "outtmpl": out_path, "overwrites": True, "quiet": True, "noprogress": True,
+            "socket_timeout": SOCKET_TIMEOUT}
+    if max_seconds and ffmpeg:
+        from yt_dlp.utils import download_range_func
+        opts["download_ranges"] = download_range_func(None, [(0, max_seconds)])
+        opts["ffmpeg_location"] = ffmpeg
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        ydl.download([url])
+    return out_path
+
+
+def shrink_video(in_path, out_path, settings, ffmpeg):
+    """ ffmpeg 轉成 H.264 小檔（scale 只縮不放） """
+    cmd = [ffmpeg, "-y", "-loglevel", "error", "-i", in_path]
+    if settings["max_seconds"]:
+        cmd += ["-t", str(settings["max_seconds"])]
+    bitrate = settings["video_bitrate"]
+    cmd += ["-vf", f"scale=-2:min({int(settings['height'])}\\,ih),fps={settings['fps']}",
+            "-c:v", "libx264", "-preset", "veryfast", "-b:v", bitrate, "-maxrate", bitrate, "-bufsize", bitrate]
+    if settings["audio_bitrate"]:
+        cmd += ["-c:a", "aac", "-b:a", settings["audio_bitrate"], "-ac", "1"]
+    else:
+        cmd += ["-an"]
+    cmd += ["-movflags", "+faststart", out_path]
+    subprocess.run(cmd, check=True, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    return out_path
+
+
+def probe_duration(path, ffmpeg):
+    """ 從 ffmpeg -i 的輸出讀影片長度（秒），讀不到回傳 0 """
+    out = subprocess.run([ffmpeg, "-hide_banner", "-i", path], capture_output=True, text=True, errors="replace",
+                         timeout=FFMPEG_TIMEOUT)
+    m = re.search(r"Duration: (\d+):(\d+):([\d.]+)", out.stderr)
+    return int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3)) if m else 0.0
+
+
+def _run_frames(ffmpeg, path, video_filter, out_dir, prefix, max_seconds):
+    """ 跑一次抽圖，回傳 [(秒數, 路徑)]（時間取自 showinfo） """
+    cmd = [ffmpeg, "-hide_banner", "-y", "-i", path]
+    if max_seconds:
+        cmd += ["-t", str(max_seconds)]
+    pattern = os.path.join(out_dir, prefix + "_%03d.jpg")
+    cmd += ["-vf", video_filter + ",showinfo", "-vsync", "vfr", "-q:v", "5", pattern]
+    out = subprocess.run(cmd, capture_output=True, text=True, errors="replace", check=True, timeout=FFMPEG_TIMEOUT)
+    times = [float(t) for t in re.findall(r"pts_time:([\d.]+)", out.stderr)]
+    return [(t, pattern % (i + 1)) for i, t in enumerate(times) if os.path.exists(pattern % (i + 1))]
+
+
+def _spread(frames, n):
+    """ 平均挑 n 張（保留第一張與最後一張） """
+    if len(frames) <= n:
+        return frames
+    if n <= 1:
+        return frames[:n]
+    step = (len(frames) - 1) / (n - 1)
+    return [frames[round(i * step)] for i in range(n)]
+
+
+def extract_keyframes(path, out_dir, settings, ffmpeg):
+    """
+    抽場景切換的畫面（先縮小再算場景差異，比較快）；場景不夠多時用平均取樣補滿
+    回傳 ([(秒數, JPEG 路徑)], 影片長度)
+    """
+    max_frames = int(settings["max_frames"])
+    scale = f"scale=-2:min({int(settings['height'])}\\,ih)"
+    duration = probe_duration(path, ffmpeg)
+    if settings["max_seconds"]:
+        duration = min(duration, settings["max_seconds"]) if duration else settings["max_seconds"]
+
+    frames = _spread(_run_frames(ffmpeg, path, f"{scale},select=eq(n\\,0)+gt(scene\\,{settings['scene_threshold']})",
+                                 out_dir, "scene", settings["max_seconds"]), max_frames)
+    if len(frames) < max_frames and duration:
+        gap = duration / max_frames / 2
+        even = _run_frames(ffmpeg, path, f"{scale},fps={max_frames / duration:.4f}", out_dir, "even",
+                           settings["max_seconds"])
+        extra = [f for f in even if all(abs(f[0] - t) >= gap for t, _ in frames)]
+        frames = sorted(frames + _spread(extra, max_frames - len(frames)))
+    return frames, duration
+
+
+def fetch_source(source, work_dir, settings, ffmpeg):
+    """ 網址就下載（只抓前 N 秒），本機檔案直接用；回傳 (路徑, Stage) """
+    if is_url(source):
+        start = time.perf_counter()
+        raw = download_segment(source, os.path.join(work_dir, "source.mp4"), settings["max_seconds"], ffmpeg)
+        return raw, Stage("download", os.path.getsize(raw), time.perf_counter() - start)
+    return source, Stage("source", os.path.getsize(source), 0.0)
+
+
+def prepare_keyframes(source, work_dir, settings=None):
+    """ 來源 → 關鍵畫格，回傳 ([(秒數, JPEG bytes)], 影片長度, [Stage...]) """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    ffmpeg = find_ffmpeg()
+    if ffmpeg is None:
+        raise RuntimeError("關鍵畫格模式需要 ffmpeg")
+    raw, stage = fetch_source(source, work_dir, settings, ffmpeg)
+    stages = [stage]
+
+    start = time.perf_counter()
+    paths, duration = extract_keyframes(raw, work_dir, settings, ffmpeg)
+    frames = []
+    for t, path in paths:
+        with open(path, "rb") as f:
+            frames.append((t, f.read()))
+    stages.append(Stage("keyframes", sum(len(data) for _, data in frames), time.perf_counter() - start))
+    return frames, duration, stages
+
+
+def prepare_media(source, work_dir, settings=None):
+    """
+    來源（網址或本機檔案）→ 準備好上傳的檔案，回傳 (路徑, [Stage...])
+    轉檔後沒有變小就用原檔
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    ffmpeg = find_ffmpeg()
+    raw, stage = fetch_source(source, work_dir, settings, ffmpeg)
+    stages = [stage]
+
+    if ffmpeg is None:
+        return raw, stages
+
+    start = time.perf_counter()
+    small = shrink_video(raw, os.path.join(work_dir, "upload.mp4"), settings, ffmpeg)
+    stages.append(Stage("transcode", os.path.getsize(small), time.perf_counter() - start))
+    return (small if os.path.getsize(small) < os.path.getsize(raw) else raw), stages
+
+
+STAGE_NAMES = {"source": "原檔", "download": "下載", "transcode": "轉檔", "keyframes": "關鍵畫格",
+               "upload": "上傳", "reuse": "重用已上傳檔案", "processing": "雲端處理", "generate": "分析"}
+
+
+def format_stages(stages):
+    """ 下載 3.2 MB / 1.4s → 轉檔 0.4 MB / 0.8s（-88%） """
+    parts = []
+    for s in stages:
+        size = f"{s.bytes / 1024 / 1024:.1f} MB / " if s.bytes else ""
+        parts.append(f"{STAGE_NAMES.get(s.name, s.name)} {size}{s.seconds:.1f}s")
+    text = " → ".join(parts)
+    sizes = [s.bytes for s in stages if s.name in ("source", "download", "transcode", "keyframes")]
+    if len(sizes) == 2 and sizes[0]:
+        text += f"（{(sizes[1] - sizes[0]) / sizes[0]:+.0%}）"
+    return text
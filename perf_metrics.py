@@ -0,0 +1,179 @@
+"""
+各階段耗時統計（行程內，不需額外套件）
+- with span("yt.search"): ... 記一次耗時；已經量好的時間用 observe(名稱, 秒數)
+- 每個階段保留次數、總時間、固定分界的直方圖（給 Prometheus）與最近 1000 筆樣本（算 p50 / p90 / p99）
+- 另有事件計數（increment），例如重試、斷路次數（見 resilience）
+- 匯出 Prometheus 文字格式（node_exporter textfile collector 可直接讀）或 JSONL（每次匯出每個階段一行）
+階段名稱：
+  yt.build / yt.search / yt.videos / yt.channels   YouTube client 建立與實際打到 API 的呼叫（快取命中不算）
+  search.total / search.scoring                    整次搜尋、計分＋頻道＋速度
+  gemini.models / gemini.generate / gemini.ttft    模型清單與試打、生成總時間、串流首字時間
+  gemini.upload / gemini.reuse / gemini.processing   Files API 上傳（或重用）、等 PROCESSING
+  media.download / media.transcode / media.keyframes   AI 分析前的本機處理
+"""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 直方圖分界（秒），涵蓋本機計分（毫秒級）到影片上傳與生成（數十秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MAX_SAMPLES = 1000
+METRIC_NAME = "shortsai_stage_seconds"
+
+
+def percentile(sorted_values, q):
+    """ 最近排名法：q 介於 0～100 """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS, max_samples=MAX_SAMPLES):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最後一格是 +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.samples = deque(maxlen=max_samples)
+
+    def observe(self, seconds, error=False):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+        if error:
+            self.errors += 1
+
+    def summary(self):
+        values = sorted(self.samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_s": round(self.total, 4),
+            "avg_s": round(self.total / self.count, 4) if self.count else None,
+            "p50_s": _round(percentile(values, 50)),
+            "p90_s": _round(percentile(values, 90)),
+            "p99_s": _round(percentile(values, 99)),
+            "max_s": round(self.max, 4),
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+class StageMetrics:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds, error)
+
+    def increment(self, event, n=1):
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + n
+
+    @contextmanager
+    def span(self, stage):
+        """ 量 with 區塊的耗時；區塊內丟出例外也會記錄（計入 errors） """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(stage, time.perf_counter() - start, error=True)
+            raise
+        self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """ 依階段名稱排序的 [{stage, count, p50_s, ...}] """
+        with self._lock:
+            return [dict(stage=stage, **h.summary()) for stage, h in sorted(self.histograms.items())]
+
+    def counter_snapshot(self):
+        with self._lock:
+            return [{"event": event, "count": count} for event, count in sorted(self.counters.items())]
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def to_prometheus(self):
+        """ Prometheus 文字格式：每個階段一組 _bucket / _sum / _count，另加錯誤次數 """
+        lines = [f"# HELP {METRIC_NAME} ShortsAI stage latency in seconds",
+                 f"# TYPE {METRIC_NAME} histogram"]
+        errors = []
+        with self._lock:
+            for stage, h in sorted(self.histograms.items()):
+                label = f'stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), h.counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"{METRIC_NAME}_sum{{{label}}} {h.total:.6f}")
+                lines.append(f"{METRIC_NAME}_count{{{label}}} {h.count}")
+                errors.append(f"shortsai_stage_errors_total{{{label}}} {h.errors}")
+            events = [f'shortsai_events_total{{event="{event}"}} {count}' for event, count in sorted(self.counters.items())]
+        lines += ["# HELP shortsai_stage_errors_total ShortsAI stage failures",
+                  "# TYPE shortsai_stage_errors_total counter"] + errors
+        lines += ["# HELP shortsai_events_total ShortsAI retries, circuit breaker trips and rejections",
+                  "# TYPE shortsai_events_total counter"] + events
+        return "\n".join(lines) + "\n"
+
+    def to_jsonl(self, ts=None):
+        ts = ts or time.time()
+        return "".join(json.dumps(dict(ts=round(ts, 3), **row), ensure_ascii=False) + "\n"
+                       for row in self.snapshot() + self.counter_snapshot())
+
+    def write_prometheus(self, path):
+        """ 先寫暫存檔再改名，收集程式不會讀到寫一半的檔案 """
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    def append_jsonl(self, path):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+
+    def export(self, path):
+        """ 副檔名 .jsonl 附加一批 JSONL，其他（.prom）覆寫成 Prometheus 文字格式 """
+        if path.endswith(".jsonl"):
+            self.append_jsonl(path)
+        else:
+            self.write_prometheus(path)
+
+
+_default_metrics = StageMetrics()
+
+
+def get_default_metrics():
+    return _default_metrics
+
+
+def span(stage):
+    return _default_metrics.span(stage)
+
+
+def observe(stage, seconds, error=False):
+    _default_metrics.observe(stage, seconds, error)
+
+
+def increment(event, n=1):
+    _default_metrics.increment(event, n)
@@ -0,0 +1,127 @@
+"""
+AI Prompt 快取（本機 SQLite，跨 session、跨使用者共用）
+key = 影片 id + 提示詞範本雜湊 + 模型名稱
+watch?v=、shorts/、youtu.be/ 等不同網址形式都對應到同一個影片 id
+"""
+import hashlib
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import storage
+
+MAX_ENTRIES = 5000
+MAX_AGE = 30 * 86400
+
+VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+def extract_video_id(url):
+    """ 從各種 YouTube 網址取出 11 碼影片 id，無法辨識時回傳 None """
+    url = (url or "").strip()
+    if VIDEO_ID_RE.match(url):
+        return url
+    if "://" not in url:
+        url = "https://" + url
+    parsed = urlparse(url)
+    host = parsed.netloc.lower().split(":")[0]
+    if host.endswith("youtu.be"):
+        candidate = parsed.path.strip("/").split("/")[0]
+    elif host.endswith("youtube.com") or host.endswith("youtube-nocookie.com"):
+        candidate = parse_qs(parsed.query).get("v", [""])[0]
+        if not candidate:
+            parts = [p for p in parsed.path.split("/") if p]
+            if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v", "e"):
+                candidate = parts[1]
+    else:
+        return None
+    return candidate if VIDEO_ID_RE.match(candidate or "") else None
+
+
+def canonical_url(url):
+    """ 統一成 https://www.youtube.com/shorts/<id>，無法辨識時原樣回傳 """
+    video_id = extract_video_id(url)
+    return f"https://www.youtube.com/shorts/{video_id}" if video_id else (url or "").strip()
+
+
+def template_hash(template):
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_key(url, template, model):
+    video = extract_video_id(url) or canonical_url(url)
+    return hashlib.sha256(f"{video}|{template_hash(template)}|{model}".encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, max_age=MAX_AGE):
+        self.path = path or storage.data_path(storage.DB_FILE)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS prompt_cache (
+                key TEXT PRIMARY KEY, video_id TEXT, model TEXT, template_hash TEXT,
+                text TEXT, created REAL, accessed REAL)""")
+
+    def get(self, url, template, model):
+        key = prompt_key(url, template, model)
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT text, created FROM prompt_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.max_age:
+                conn.execute("UPDATE prompt_cache SET accessed = ? WHERE key = ?", (now, key))
+                self._count(hit=True)
+                return row[0]
+        self._count(hit=False)
+        return None
+
+    def put(self, url, template, model, text):
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO prompt_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (prompt_key(url, template, model), extract_video_id(url), model,
+                          template_hash(template), text, now, now))
+        self.evict()
+
+    def get_or_generate(self, url, template, model, generate):
+        """ 快取命中直接回傳，否則呼叫 generate() 並存入（只存成功的結果） """
+        text = self.get(url, template, model)
+        if text is None:
+            text = generate()
+            self.put(url, template, model, text)
+        return text
+
+    def evict(self):
+        """ 刪除過期項目；超過數量上限時刪掉最久沒用的 """
+        with storage.connect(self.path) as conn:
+            conn.execute("DELETE FROM prompt_cache WHERE created < ?", (time.time() - self.max_age,))
+            conn.execute("""DELETE FROM prompt_cache WHERE key IN (
+                SELECT key FROM prompt_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)""", (self.max_entries,))
+
+    def stats(self):
+        with storage.connect(self.path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {"entries": count, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PromptCache()
+    return _default_cache
@@ -0,0 +1,84 @@
+"""
+依影片網址產生 AI 影片提示詞（網頁版與趨勢服務共用，不依賴 Streamlit）
+- 同一影片（不論網址形式）+ 範本 + 模型只呼叫一次 Gemini（prompt_cache）
+- 模型清單每個 API Key 查一次並快取，失敗時自動換下一個（gemini_models）
+"""
+import prompt_cache
+from gemini_models import get_registry, GenerativeAIBackend
+
+PROMPT_TEMPLATE = """Create detailed English prompt for AI video generation recreating YouTube Shorts: {video_url}
+
+Essential elements:
+• Main character description (appearance, clothing, expression)
+• Specific actions/movements
+• Environment/setting details
+• Camera movements (zoom, pan, close-up)
+• Lighting and color atmosphere
+• Video exact duration: match original video length
+
+Single paragraph, optimized for Sora/Runway/RunwayML."""
+
+# ✅ 優先順序（實際可用清單每個 API Key 查一次並快取，失敗時自動換下一個）
+PREFERRED_MODELS = [
+    'gemini-2.0-flash-exp',      # 最快
+    'gemini-1.5-pro-latest',     # 最佳品質
+    'gemini-1.5-flash-latest',   # 平衡
+    'gemini-pro'                 # 備用
+]
+
+
+def model_registry(gemini_api_key, backend_cls=GenerativeAIBackend):
+    return get_registry(backend_cls, gemini_api_key, PREFERRED_MODELS)
+
+
+def pick_model(gemini_api_key, backend_cls=GenerativeAIBackend):
+    """支援多模型自動選擇（清單快取 6 小時，不再每次重新 configure + 建立模型）"""
+    return model_registry(gemini_api_key, backend_cls).primary()
+
+
+def format_prompt_result(model_name, text):
+    return f"✅ 使用模型：{model_name}\n\n{text}"
+
+
+def _lookup(cache, cache_key, models):
+    """依序找第一個有快取的模型，回傳 (產生它的模型, 文字)；都沒有時回傳 (None, None)"""
+    for model in dict.fromkeys(models):
+        text = cache.get(cache_key, PROMPT_TEMPLATE, model)
+        if text is not None:
+            return model, text
+    return None, None
+
+
+def cached_prompt(video_url, model_name, fallbacks=()):
+    """快取命中時回傳結果文字，否則 None（不呼叫 Gemini）；fallbacks 為換模型的候選，之前換過模型產生的也算命中"""
+    cache_key = prompt_cache.canonical_url(video_url)
+    model_name, text = _lookup(prompt_cache.get_default_cache(), cache_key, [model_name, *fallbacks])
+    return None if text is None else format_prompt_result(model_name, text)
+
+
+def generate_prompt_text(gemini_api_key, video_url, model_name=None, on_chunk=None, backend_cls=GenerativeAIBackend):
+    """
+    同一影片（不論網址形式）+ 範本 + 模型只呼叫一次 Gemini；模型失敗就換下一個，全部失敗才拋出（批次佇列要依 429 重試）
+    快取只記在實際產生結果的模型下；查詢時依換模型的順序找，之前換過模型產生的結果也會命中（並標示該模型）
+    有 on_chunk 時改用串流，每收到一段文字就回呼一次
+    """
+    registry = model_registry(gemini_api_key, backend_cls)
+    model_name = model_name or registry.primary()
+    order = [model_name] + [m for m in registry.candidates() if m != model_name]
+    cache_key = prompt_cache.canonical_url(video_url)  # 只用來當快取鍵，送給 Gemini 的仍是原本的網址
+    cache = prompt_cache.get_default_cache()
+
+    cached_model, text = _lookup(cache, cache_key, order)
+    if text is None:
+        prompt = PROMPT_TEMPLATE.format(video_url=video_url)
+        if on_chunk:
+            model_name, text = registry.stream(prompt, on_chunk, models=order)[:2]
+        else:
+            model_name, response = registry.generate(prompt, models=order)
+            text = response.text
+        cache.put(cache_key, PROMPT_TEMPLATE, model_name, text)
+    else:
+        model_name = cached_model
+        if on_chunk:
+            on_chunk(text)
+    return format_prompt_result(model_name, text)
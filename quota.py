@@ -0,0 +1,141 @@
+"""
+YouTube Data API 配額記帳與查詢規劃
+- 每次實際打到 API 的呼叫都記錄單位成本（快取命中不算）
+- 依 API Key（只存雜湊）與「太平洋時間」日期累計，配額每天太平洋時間午夜重置
+- 規劃器依剩餘配額決定要搜尋幾個關鍵字、每個幾頁，並優先安排便宜的 videos().list 更新
+"""
+import hashlib
+import math
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+DAILY_QUOTA = 10000
+UNIT_COSTS = {
+    "search": 100,    # search().list 每頁
+    "videos": 1,      # videos().list 每批（最多 50 個 id）
+    "channels": 1,    # channels().list 每批
+}
+PAGE_SIZE = 50
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+except Exception:
+    QUOTA_TZ = timezone(timedelta(hours=-8))  # Windows 沒裝 tzdata 時的近似值
+
+
+def key_id(api_key):
+    """ 不在本機保存 API Key 原文，只存前 12 碼雜湊 """
+    return hashlib.sha256((api_key or "").strip().encode("utf-8")).hexdigest()[:12]
+
+
+def quota_day(ts=None):
+    return datetime.fromtimestamp(ts or time.time(), QUOTA_TZ).strftime("%Y-%m-%d")
+
+
+def next_reset(ts=None):
+    """ 下一次配額重置時間（太平洋時間午夜） """
+    now = datetime.fromtimestamp(ts or time.time(), QUOTA_TZ)
+    return (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_quota_error(error):
+    """ 判斷是否為 quotaExceeded / dailyLimitExceeded 錯誤 """
+    text = str(getattr(error, "content", b"") or error)
+    return "quotaExceeded" in text or "dailyLimitExceeded" in text
+
+
+class QuotaLedger:
+    def __init__(self, api_key, daily_quota=DAILY_QUOTA, path=None):
+        self.key = key_id(api_key)
+        self.daily_quota = daily_quota
+        self.path = path or storage.data_path(storage.DB_FILE)
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS quota_calls (
+                key_id TEXT, day TEXT, ts REAL, endpoint TEXT, units INTEGER)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS quota_calls_day ON quota_calls (key_id, day)")
+
+    def record(self, endpoint, calls=1):
+        units = UNIT_COSTS.get(endpoint, 1) * calls
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            conn.execute("INSERT INTO quota_calls VALUES (?, ?, ?, ?, ?)",
+                         (self.key, quota_day(now), now, endpoint, units))
+        return units
+
+    def mark_exhausted(self):
+        """ 收到 quotaExceeded 時把今天剩餘額度記滿，避免繼續白打 """
+        remaining = self.remaining()
+        if remaining > 0:
+            now = time.time()
+            with storage.connect(self.path) as conn:
+                conn.execute("INSERT INTO quota_calls VALUES (?, ?, ?, ?, ?)",
+                             (self.key, quota_day(now), now, "quotaExceeded", remaining))
+
+    def used_today(self):
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT COALESCE(SUM(units), 0) FROM quota_calls WHERE key_id = ? AND day = ?",
+                               (self.key, quota_day())).fetchone()
+        return row[0]
+
+    def remaining(self):
+        return max(self.daily_quota - self.used_today(), 0)
+
+    def daily_totals(self, days=7):
+        """ 最近幾天每天的用量 {日期: 單位} """
+        with storage.connect(self.path) as conn:
+            rows = conn.execute("""SELECT day, SUM(units) FROM quota_calls WHERE key_id = ?
+                                   GROUP BY day ORDER BY day DESC LIMIT ?""", (self.key, days)).fetchall()
+        return dict(rows)
+
+    def burn_rate(self, window=3600):
+        """ 最近 window 秒的消耗速度（單位 / 小時） """
+        since = time.time() - window
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT COALESCE(SUM(units), 0) FROM quota_calls WHERE key_id = ? AND ts >= ?",
+                               (self.key, since)).fetchone()
+        return row[0] * 3600 / window
+
+    def projected_exhaustion(self, window=3600):
+        """ 依目前速度推估用完的時間；在今天重置前用不完則回傳 None """
+        rate = self.burn_rate(window)
+        remaining = self.remaining()
+        if remaining <= 0:
+            return datetime.now(QUOTA_TZ)
+        if rate <= 0:
+            return None
+        eta = datetime.now(QUOTA_TZ) + timedelta(hours=remaining / rate)
+        return eta if eta < next_reset() else None
+
+
+QueryPlan = namedtuple("QueryPlan", "keywords pages_per_keyword max_results refresh_batches estimated_cost")
+
+
+def search_cost(pages):
+    """ 每頁搜尋 100 單位，加上該頁 50 個 id 的 videos().list 1 單位 """
+    return pages * (UNIT_COSTS["search"] + UNIT_COSTS["videos"])
+
+
+def plan_queries(remaining, keywords, max_results, refresh_ids=0):
+    """
+    依剩餘配額排定查詢：
+    1. 先安排已知影片的 videos().list 統計更新（每 50 個 1 單位，最划算）
+    2. 剩下的額度分給搜尋：先減少每個關鍵字的頁數，仍不夠再從後面刪關鍵字
+    """
+    refresh_batches = min(math.ceil(refresh_ids / PAGE_SIZE), remaining)
+    budget = remaining - refresh_batches * UNIT_COSTS["videos"]
+
+    keywords = list(keywords)
+    pages = max(1, math.ceil(max_results / PAGE_SIZE))
+    while keywords and search_cost(pages) * len(keywords) > budget:
+        if pages > 1:
+            pages -= 1
+        else:
+            keywords.pop()
+
+    cost = refresh_batches * UNIT_COSTS["videos"] + (search_cost(pages) * len(keywords) if keywords else 0)
+    return QueryPlan(keywords, pages if keywords else 0, min(max_results, pages * PAGE_SIZE) if keywords else 0,
+                     refresh_batches, cost)
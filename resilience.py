@@ -0,0 +1,205 @@
+"""
+YouTube / Gemini 呼叫共用的重試、退避與斷路器
+- 可重試的錯誤（5xx、429、逾時、連線中斷）以「完整抖動」指數退避重試：等 0～min(上限, 基準 × 2^n) 秒，
+  多條執行緒同時失敗時不會在同一瞬間一起重打
+- 每個階段有硬性時限：剩餘秒數當作每次請求的逾時交給 SDK（pass_timeout），開始重試前與退避前都檢查，
+  超過就直接丟出 DeadlineExceeded，卡住的請求不會讓工作執行緒無限等待
+- 斷路器：連續收到 429 / quotaExceeded 就暫停該端點一段時間（quotaExceeded 直接暫停到配額重置），
+  期間的呼叫立刻丟出 CircuitOpenError，不再白打；冷卻後放行一次試探，成功才恢復
+- 重試、失敗、斷路拒絕次數記在 perf_metrics 的事件計數（效能面板與 Prometheus 匯出都看得到）
+"""
+import random
+import socket
+import threading
+import time
+
+import perf_metrics
+import quota
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+RETRY_TEXT = ("429", "Too Many Requests", "RESOURCE_EXHAUSTED", "ResourceExhausted", "UNAVAILABLE",
+              "ServiceUnavailable", "DEADLINE_EXCEEDED", "InternalServerError", "backendError", "rateLimitExceeded")
+THROTTLE_TEXT = ("429", "Too Many Requests", "RESOURCE_EXHAUSTED", "ResourceExhausted", "rateLimitExceeded")
+
+# 各階段的硬性時限（秒），含重試等待
+DEADLINES = {
+    "youtube": 60,
+    "gemini.generate": 300,
+    "gemini.upload": 300,
+    "gemini.processing": 300,
+    "media.ffmpeg": 180,
+}
+YOUTUBE_RETRY = {"max_retries": 3, "base": 0.5, "cap": 8.0}
+GEMINI_RETRY = {"max_retries": 2, "base": 2.0, "cap": 20.0}
+
+BREAKER_THRESHOLD = 3     # 連續幾次被限流就斷路
+BREAKER_COOLDOWN = 30.0   # 斷路多久後放行試探（秒）
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} 暫停呼叫中（連續被限流），{retry_after:.0f} 秒後再試")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def http_status(error):
+    """ googleapiclient HttpError（resp.status）、google-genai（code）、google.api_core（code()）的 HTTP 狀態碼 """
+    resp = getattr(error, "resp", None)
+    status = getattr(resp, "status", None) or getattr(error, "status_code", None) or getattr(error, "code", None)
+    if callable(status):
+        status = status()
+    status = getattr(status, "value", status)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_text(error):
+    return f"{type(error).__name__} {getattr(error, 'content', b'') or ''} {error}"
+
+
+def is_throttle_error(error):
+    """ 429 / 配額用完：會讓斷路器計數 """
+    if quota.is_quota_error(error):
+        return True
+    if http_status(error) == 429:
+        return True
+    text = _error_text(error)
+    return any(s in text for s in THROTTLE_TEXT)
+
+
+def is_retriable(error):
+    """ 暫時性錯誤才重試；每日配額用完（quotaExceeded）、參數錯誤、斷路中都不重試 """
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)) or quota.is_quota_error(error):
+        return False
+    if isinstance(error, (TimeoutError, socket.timeout, ConnectionError)):
+        return True
+    status = http_status(error)
+    text = _error_text(error)
+    if status is not None and 400 <= status < 600:
+        return status in RETRY_STATUS or "rateLimitExceeded" in text   # YouTube 短時間限流是 403
+    return any(s in text for s in RETRY_TEXT)
+
+
+def backoff_delay(attempt, base, cap):
+    """ 完整抖動：0～min(cap, base × 2^attempt) """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.trips = 0
+        self._probe_at = 0.0   # 試探呼叫開始的時間；試探被中斷（取消）超過冷卻時間就視為結束
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if time.time() < self.open_until:
+            return "open"
+        return "half-open" if self.failures >= self.threshold else "closed"
+
+    def allow(self):
+        """ 斷路中丟出 CircuitOpenError；冷卻結束後只放行一個試探呼叫 """
+        with self._lock:
+            now = time.time()
+            probing = now - self._probe_at < self.cooldown
+            if now < self.open_until or (self.failures >= self.threshold and probing):
+                perf_metrics.increment(f"{self.name}.rejected")
+                raise CircuitOpenError(self.name, max(self.open_until - now, 1.0))
+            if self.failures >= self.threshold:
+                self._probe_at = now
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_at = 0.0
+
+    def failure(self, error):
+        """ 只有限流類錯誤會累計；一般錯誤不影響斷路 """
+        with self._lock:
+            self._probe_at = 0.0
+            if not is_throttle_error(error):
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self._open(time.time() + self.cooldown)
+
+    def trip(self, until):
+        """ 直接斷路到指定時間（例如 YouTube 配額重置） """
+        with self._lock:
+            self.failures = max(self.failures, self.threshold)
+            self._open(until)
+
+    def _open(self, until):
+        if until > self.open_until:
+            self.open_until = until
+            self.trips += 1
+            perf_metrics.increment(f"{self.name}.trips")
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, **kwargs):
+    """ 同名的斷路器在行程內共用 """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **kwargs)
+        return breaker
+
+
+def breaker_table():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [{"name": b.name, "state": b.state, "failures": b.failures, "trips": b.trips,
+             "open_for_s": round(max(b.open_until - time.time(), 0), 1)} for b in breakers]
+
+
+def call(fn, name, breaker=None, max_retries=3, base=1.0, cap=30.0, deadline=None, retry_if=is_retriable,
+         pass_timeout=False):
+    """
+    呼叫 fn()，可重試的錯誤依完整抖動退避重試；deadline 為這次呼叫（含重試）的總秒數上限
+    pass_timeout=True 時改呼叫 fn(剩餘秒數)，由 fn 當作 SDK 的請求逾時（沒有 deadline 時為 None）
+    breaker 斷路中直接丟出 CircuitOpenError；每次成功 / 失敗都回報給 breaker
+    """
+    start = time.monotonic()
+    attempt = 0
+    while True:
+        remaining = None if deadline is None else deadline - (time.monotonic() - start)
+        if remaining is not None and remaining <= 0:
+            perf_metrics.increment(f"{name}.deadline")
+            raise DeadlineExceeded(f"{name} 超過 {deadline:.0f} 秒仍未成功")
+        if breaker is not None:
+            breaker.allow()
+        try:
+            result = fn(remaining) if pass_timeout else fn()
+        except Exception as e:
+            if breaker is not None:
+                breaker.failure(e)
+            if attempt >= max_retries or not retry_if(e):
+                perf_metrics.increment(f"{name}.failures")
+                raise
+            delay = backoff_delay(attempt, base, cap)
+            if deadline is not None and time.monotonic() - start + delay >= deadline:
+                perf_metrics.increment(f"{name}.deadline")
+                raise DeadlineExceeded(f"{name} 超過 {deadline:.0f} 秒仍未成功：{e}") from e
+            perf_metrics.increment(f"{name}.retries")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if breaker is not None:
+            breaker.success()
+        return result
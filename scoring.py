@@ -0,0 +1,138 @@
+"""
+爆發指數計算與過濾（欄位式、向量化，網頁版與桌面版共用）
+一次把 videos().list 的 items 轉成 DataFrame，時長與時間整欄解析，只取一次「現在」時間
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+DURATION_PATTERN = r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$"
+
+RESULT_COLUMNS = {
+    "video_id": "string",
+    "title": "string",
+    "channel_id": "string",
+    "views": "int64",
+    "likes": "int64",
+    "seconds": "int64",
+    "duration": "string",
+    "hours": "float64",
+    "viral_score": "float64",
+    "published": "string",
+    "keywords": "string",
+    "url": "string",
+}
+
+
+def parse_duration_to_seconds(duration_str):
+    """ 將 YouTube 的 PT1M5S 格式轉換為總秒數（單筆用） """
+    match = re.match(DURATION_PATTERN, duration_str or "")
+    if not match:
+        return 0
+    d, h, m, s = (int(x) if x else 0 for x in match.groups())
+    return d * 86400 + h * 3600 + m * 60 + s
+
+
+def parse_durations(durations):
+    """ 整欄解析 ISO-8601 時長：同樣的時長字串只解析一次（Shorts 的時長種類很少） """
+    codes, uniques = pd.factorize(pd.Series(durations, dtype="object").fillna(""))
+    lookup = np.array([parse_duration_to_seconds(d) for d in uniques], dtype="int64")
+    return lookup[codes] if len(lookup) else np.zeros(len(codes), dtype="int64")
+
+
+def parse_timestamps(timestamps):
+    """ 整欄解析 publishedAt（2025-01-31T08:05:00Z）為 UTC datetime64[s] """
+    values = pd.Series(timestamps, dtype="object").fillna("")
+    try:
+        return np.array([t[:19] for t in values], dtype="datetime64[s]")
+    except ValueError:
+        parsed = pd.to_datetime(values, utc=True, errors="coerce").dt.tz_localize(None)
+        return parsed.to_numpy(dtype="datetime64[s]")
+
+
+def format_timestamps(timestamps, fmt):
+    """ 常用的兩種格式直接切 ISO 字串，其他格式才走 strftime """
+    iso = np.datetime_as_string(timestamps, unit="m")  # 2025-01-31T08:05
+    if fmt == "%Y-%m-%d %H:%M":
+        return [t.replace("T", " ") for t in iso]
+    if fmt == "%m-%d %H:%M":
+        return [t[5:].replace("T", " ") for t in iso]
+    return list(pd.DatetimeIndex(timestamps).strftime(fmt))
+
+
+def items_to_frame(items):
+    """ videos().list 的 items → 原始欄位 DataFrame（一次走訪） """
+    columns = ([], [], [], [], [], [], [])
+    for item in items:
+        snippet = item["snippet"]
+        stats = item.get("statistics", {})
+        columns[0].append(item["id"])
+        columns[1].append(snippet["title"])
+        columns[2].append(snippet.get("channelId", ""))
+        columns[3].append(snippet["publishedAt"])
+        columns[4].append(item.get("contentDetails", {}).get("duration", ""))
+        columns[5].append(int(stats.get("viewCount", 0)))
+        columns[6].append(int(stats.get("likeCount", 0)))
+    return pd.DataFrame({
+        "video_id": columns[0],
+        "title": columns[1],
+        "channel_id": columns[2],
+        "published_at": columns[3],
+        "duration_iso": columns[4],
+        "views": np.array(columns[5], dtype="int64"),
+        "likes": np.array(columns[6], dtype="int64"),
+    })
+
+
+def empty_results():
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in RESULT_COLUMNS.items()})
+
+
+def score_videos(items, min_views=0, min_viral_score=0, max_duration=None, now=None, matched=None,
+                 title_len=None, published_fmt="%Y-%m-%d %H:%M", url_format="https://www.youtube.com/watch?v={}"):
+    """
+    計算爆發指數（觀看數 ÷ 發布後小時，最少以 1 小時計）並過濾，依爆發指數由高到低排序
+    items 可以是 videos().list 的 items 或 items_to_frame() 的結果；matched 為 {影片 id: [關鍵字]}
+    """
+    df = items if isinstance(items, pd.DataFrame) else items_to_frame(items)
+    if df.empty:
+        return empty_results()
+
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+    if now.tzinfo is not None:
+        now = now.tz_convert("UTC").tz_localize(None)
+    now = now.to_datetime64().astype("datetime64[s]")
+    seconds = parse_durations(df["duration_iso"])
+    views = df["views"].to_numpy(dtype="int64")
+    published = parse_timestamps(df["published_at"])
+    hours = np.maximum((now - published).astype("float64") / 3600, 1)
+    viral = views / hours
+
+    mask = (views >= min_views) & (viral >= min_viral_score)
+    if max_duration is not None:
+        mask &= seconds <= max_duration
+    if not mask.any():
+        return empty_results()
+
+    df = df.loc[mask]
+    seconds, views, hours, viral, published = seconds[mask], views[mask], hours[mask], viral[mask], published[mask]
+    video_ids = df["video_id"].tolist()
+    titles = df["title"].astype("string")
+    matched = matched or {}
+
+    result = pd.DataFrame({
+        "video_id": video_ids,
+        "title": titles.str.slice(0, title_len) if title_len else titles,
+        "channel_id": df["channel_id"].tolist(),
+        "views": views,
+        "likes": df["likes"].to_numpy(dtype="int64"),
+        "seconds": seconds,
+        "duration": [f"{m}:{s:02d}" for m, s in zip((seconds // 60).tolist(), (seconds % 60).tolist())],
+        "hours": np.round(hours, 1),
+        "viral_score": np.round(viral, 2),
+        "published": format_timestamps(published, published_fmt),
+        "keywords": [", ".join(matched.get(v, [])) for v in video_ids],
+        "url": [url_format.format(v) for v in video_ids],
+    }, index=df.index).astype(RESULT_COLUMNS)
+    return result.sort_values("viral_score", ascending=False, kind="stable").reset_index(drop=True)
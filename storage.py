@@ -0,0 +1,32 @@
+"""
+本機資料存放位置與 SQLite 連線（各快取／紀錄模組共用）
+"""
+import os
+import sqlite3
+import sys
+from contextlib import closing, contextmanager
+
+DB_FILE = "shorts_data.sqlite3"
+
+
+def get_base_path():
+    """ 取得程式執行的真實路徑（打包成 .exe 時為執行檔所在資料夾） """
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def data_path(name):
+    """ 資料檔路徑，可用環境變數 SHORTSAI_DATA_DIR 改放其他資料夾 """
+    base = os.environ.get("SHORTSAI_DATA_DIR") or get_base_path()
+    os.makedirs(base, exist_ok=True)
+    return os.path.join(base, name)
+
+
+@contextmanager
+def connect(path=None):
+    """ 每次操作開一條短連線，跨執行緒／跨行程都安全；離開時自動 commit """
+    with closing(sqlite3.connect(path or data_path(DB_FILE), timeout=30)) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            yield conn
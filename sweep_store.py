@@ -0,0 +1,93 @@
+"""
+增量搜尋的關鍵字水位與候選影片（本機 SQLite）
+- 每個關鍵字（含查詢格式、影片長度條件）記下上次搜尋的時間與連續涵蓋的起點
+- 下次只搜尋上次之後發布的影片（往前重疊 SWEEP_OVERLAP，補上搜尋索引延遲），已知影片只更新統計數字（每 50 部 1 單位）
+- 候選影片 = 這個關鍵字歷次搜尋找到、仍在時間窗內的影片；新舊合併後以同一個 now 重新計分
+- 時間窗比上次涵蓋的還長（例如從 3 天改成 7 天），或超過 MAX_WATERMARK_AGE 沒搜尋，就整段重搜
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import storage
+
+SWEEP_OVERLAP = timedelta(hours=2)
+MAX_WATERMARK_AGE = timedelta(days=3)
+CANDIDATE_DAYS = 14     # 候選影片保留天數（網頁版時間窗上限）
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def query_key(keyword, query_format="{}", video_duration=None):
+    """ 同一個關鍵字、查詢格式與長度條件共用一組水位 """
+    return f"{query_format.format(keyword).strip().lower()}|{video_duration or 'any'}"
+
+
+def format_time(dt):
+    return dt.astimezone(timezone.utc).strftime(TIME_FORMAT)
+
+
+def parse_time(text):
+    return datetime.strptime(text, TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+
+class SweepStore:
+    def __init__(self, path=None):
+        self.path = path or storage.data_path(storage.DB_FILE)
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS sweep_watermarks (
+                query TEXT PRIMARY KEY, covered_from TEXT, swept_at TEXT, updated REAL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS sweep_candidates (
+                query TEXT, video_id TEXT, published_at TEXT, PRIMARY KEY (query, video_id))""")
+
+    def published_after(self, query, window_start, now):
+        """ 這次搜尋的起點：水位有效時從上次搜尋時間往前重疊一段，否則整個時間窗；回傳 (起點, 是否增量) """
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT covered_from, swept_at FROM sweep_watermarks WHERE query = ?",
+                               (query,)).fetchone()
+        if row is None:
+            return window_start, False
+        covered_from, swept_at = parse_time(row[0]), parse_time(row[1])
+        if covered_from > window_start or now - swept_at > MAX_WATERMARK_AGE:
+            return window_start, False
+        return max(window_start, swept_at - SWEEP_OVERLAP), True
+
+    def candidates(self, queries, since):
+        """ 各關鍵字在時間窗內的已知影片：{video_id: [query]} """
+        found = {}
+        with storage.connect(self.path) as conn:
+            for query in queries:
+                rows = conn.execute("""SELECT video_id FROM sweep_candidates
+                    WHERE query = ? AND published_at >= ?""", (query, format_time(since))).fetchall()
+                for (video_id,) in rows:
+                    found.setdefault(video_id, []).append(query)
+        return found
+
+    def record(self, query, items, window_start, now, incremental):
+        """ 搜尋完成後存入候選影片（videos().list 的 items）並推進水位；增量時保留原本的涵蓋起點 """
+        rows = [(query, item["id"], item["snippet"]["publishedAt"]) for item in items if item.get("snippet")]
+        with storage.connect(self.path) as conn:
+            conn.executemany("INSERT OR REPLACE INTO sweep_candidates VALUES (?, ?, ?)", rows)
+            conn.execute("DELETE FROM sweep_candidates WHERE query = ? AND published_at < ?",
+                         (query, format_time(now - timedelta(days=CANDIDATE_DAYS))))
+            previous = conn.execute("SELECT covered_from FROM sweep_watermarks WHERE query = ?", (query,)).fetchone()
+            covered_from = previous[0] if incremental and previous else format_time(window_start)
+            conn.execute("INSERT OR REPLACE INTO sweep_watermarks VALUES (?, ?, ?, ?)",
+                         (query, covered_from, format_time(now), time.time()))
+        return len(rows)
+
+    def reset(self, query=None):
+        """ 清除水位（下次整段重搜）；query 為 None 時全部清除 """
+        with storage.connect(self.path) as conn:
+            if query is None:
+                conn.execute("DELETE FROM sweep_watermarks")
+            else:
+                conn.execute("DELETE FROM sweep_watermarks WHERE query = ?", (query,))
+
+
+_default_store = None
+
+
+def get_default_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = SweepStore()
+    return _default_store
@@ -0,0 +1,424 @@
+"""
+多人共用的趨勢服務（本機 HTTP/JSON，只用標準函式庫）
+- 搜尋、計分、快取、Prompt 生成與 AI 分析都在這個行程裡跑；網頁版（多個 Streamlit 行程）與桌面版只負責畫面
+- 同一個 API Key 同時進來的相同查詢只打一次上游：第一個請求實際執行，其他請求等它完成後拿同一份結果
+  搜尋依參數（關鍵字正規化後）、Prompt 依影片 id + 模型、分析依影片 id + 模式合併
+  合併鍵含 API Key 雜湊：配額由各自的 Key 支付，某個 Key 無效、配額用完或斷路中也不會連累其他使用者；
+  不同 Key 之間靠服務端共用的快取省下上游呼叫
+- API 快取、頻道訂閱數、觀看數快照與 Prompt 快取都在服務端，所有使用者共用
+- 配額記帳也在服務端：用戶端規劃搜尋、顯示用量與清除快取都透過服務，不看本機的資料庫
+- --stub 用 bench_fakes 的假 YouTube / 假 Gemini 當上游，不連網、不花配額，可直接測試合併效果
+端點：
+  POST /search  /refresh  /prompt  /analyze    JSON 進、JSON 出；錯誤回傳 {"error": ...}
+  POST /quota（某個 API Key 今日的用量與消耗速度）  /cache/clear（清除搜尋快取與增量水位）
+  GET  /health  /stats（合併次數、快取狀態、斷路器）  /metrics（Prometheus 文字格式，見 perf_metrics）
+用戶端：網頁版設環境變數 SHORTSAI_SERVICE_URL，桌面版在 config.json 設 service_url（例如 http://127.0.0.1:8765）
+"""
+import argparse
+import json
+import logging
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import perf_metrics
+import resilience
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+CLIENT_TIMEOUT = 900   # AI 分析含下載、上傳、PROCESSING，可能要好幾分鐘
+STATUS_TIMEOUT = 10    # 配額、統計等狀態查詢（畫面更新時呼叫，不能久等）
+
+# 用戶端可以指定的參數；其他欄位忽略
+SEARCH_PARAMS = ("keywords", "days", "min_views", "max_results", "min_viral_score", "max_duration", "min_subs",
+                 "query_format", "video_duration", "incremental")
+REFRESH_PARAMS = ("min_views", "min_viral_score", "max_duration", "min_subs")
+SCORE_PARAMS = ("title_len", "published_fmt", "url_format")
+
+log = logging.getLogger("trend_service")
+
+
+class ServiceError(RuntimeError):
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Coalescer:
+    """ 相同 key 同時只執行一次 fn，其他呼叫等結果（single-flight）；不保留結果，完成後下一次重新執行 """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn):
+        """ 回傳 (結果, 是否沿用其他請求的結果)；執行中的例外同樣丟給每個等待者 """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if not leader:
+            perf_metrics.increment("service.coalesced")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self):
+        with self._lock:
+            inflight = len(self._flights)
+        total = self.leaders + self.followers
+        return {"inflight": inflight, "upstream": self.leaders, "coalesced": self.followers,
+                "saved_rate": round(self.followers / total, 3) if total else 0.0}
+
+
+def encode_frame(df):
+    """ DataFrame → JSON（欄位、型別、資料列）；NaN / <NA> 轉成 null """
+    return {"columns": list(df.columns), "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+            "data": df.astype(object).where(df.notna(), None).values.tolist()}
+
+
+def decode_frame(payload):
+    import pandas as pd
+
+    return pd.DataFrame(payload["data"], columns=payload["columns"]).astype(payload["dtypes"])
+
+
+def _pick(body, names):
+    return {name: body[name] for name in names if body.get(name) is not None}
+
+
+def _require(body, name):
+    value = body.get(name)
+    if not value:
+        raise ServiceError(f"缺少 {name}", 400)
+    return value
+
+
+class TrendService:
+    """ 服務端的搜尋 / Prompt / 分析；backend_cls 為 Prompt 生成用的 Gemini SDK（--stub 換成假 backend） """
+
+    def __init__(self, backend_cls=None):
+        self.backend_cls = backend_cls
+        self.coalescer = Coalescer()
+
+    def search(self, body):
+        from yt_search import parse_keywords
+
+        api_key = _require(body, "api_key")
+        params = _pick(body, SEARCH_PARAMS)
+        params["keywords"] = parse_keywords(params.get("keywords", ""))
+        if not params["keywords"]:
+            raise ServiceError("缺少 keywords", 400)
+        score = _pick(body.get("score") or {}, SCORE_PARAMS)
+
+        def run():
+            import trends
+
+            return encode_frame(trends.fetch_trending_shorts(api_key, **params, **score))
+
+        return self._coalesce("search", api_key, {**params, **score}, run)
+
+    def refresh(self, body):
+        api_key = _require(body, "api_key")
+        params = _pick(body, REFRESH_PARAMS)
+        score = _pick(body.get("score") or {}, SCORE_PARAMS)
+
+        def run():
+            import trends
+
+            return encode_frame(trends.refresh_tracked(api_key, **params, **score))
+
+        return self._coalesce("refresh", api_key, {**params, **score}, run)
+
+    def prompt(self, body):
+        import prompt_cache
+        import prompt_engine
+
+        gemini_key = _require(body, "gemini_key")
+        url = _require(body, "url")
+        model = body.get("model")
+        kwargs = {"backend_cls": self.backend_cls} if self.backend_cls else {}
+
+        def run():
+            # 送給 Gemini 的是原本的網址；prompt_engine 自己會用正規化的網址當快取鍵
+            return {"text": prompt_engine.generate_prompt_text(gemini_key, url, model, **kwargs)}
+
+        return self._coalesce("prompt", gemini_key, {"url": prompt_cache.canonical_url(url), "model": model}, run)
+
+    def analyze(self, body):
+        import prompt_cache
+        import video_analysis
+
+        gemini_key = _require(body, "gemini_key")
+        url = prompt_cache.canonical_url(_require(body, "url"))
+        mode = body.get("mode") or "video"
+        if mode not in video_analysis.MODES:
+            raise ServiceError(f"不支援的模式：{mode}", 400)
+        media_settings = body.get("media_settings")
+
+        def run():
+            progress = []
+            text = video_analysis.analyze_video(gemini_key, url, progress.append, mode=mode,
+                                                media_settings=media_settings)
+            return {"text": text, "log": progress}
+
+        return self._coalesce("analyze", gemini_key, {"url": url, "mode": mode, "media": media_settings}, run)
+
+    def quota(self, body):
+        from quota import QuotaLedger
+
+        ledger = QuotaLedger(_require(body, "api_key"))
+        eta = ledger.projected_exhaustion()
+        return {"daily_quota": ledger.daily_quota, "used": ledger.used_today(), "burn_rate": ledger.burn_rate(),
+                "exhaustion": eta.isoformat() if eta else None}
+
+    def clear_cache(self, body):
+        from sweep_store import get_default_store as get_sweep_store
+        from yt_cache import get_default_cache
+
+        get_default_cache().clear()
+        get_sweep_store().reset()  # 增量搜尋的水位也清掉，下次整段重搜
+        return {"ok": True}
+
+    def _coalesce(self, endpoint, api_key, params, fn):
+        from quota import key_id
+
+        key = json.dumps([endpoint, key_id(api_key), params], sort_keys=True, ensure_ascii=False)
+        with perf_metrics.span(f"service.{endpoint}"):
+            result, shared = self.coalescer.run(key, fn)
+        return dict(result, coalesced=shared)
+
+    def stats(self):
+        import prompt_cache
+        import yt_client
+        from yt_cache import get_default_cache
+
+        return {
+            "coalescer": self.coalescer.stats(),
+            "api_cache": get_default_cache().stats(),
+            "prompt_cache": prompt_cache.get_default_cache().stats(),
+            "youtube_clients": yt_client.get_default_factory().stats(),
+            "breakers": resilience.breaker_table(),
+        }
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "ShortsAI"
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self._send_json(200, {"ok": True})
+        elif self.path == "/stats":
+            self._send_json(200, service.stats())
+        elif self.path == "/metrics":
+            self._send(200, perf_metrics.get_default_metrics().to_prometheus().encode("utf-8"),
+                       "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"找不到 {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        routes = {"/search": service.search, "/refresh": service.refresh, "/prompt": service.prompt,
+                  "/analyze": service.analyze, "/quota": service.quota, "/cache/clear": service.clear_cache}
+        handler = routes.get(self.path)
+        if handler is None:
+            self._send_json(404, {"error": f"找不到 {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ServiceError("請求內容必須是 JSON 物件", 400)
+            self._send_json(200, handler(body))
+        except ServiceError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": f"JSON 格式錯誤：{e}"})
+        except resilience.CircuitOpenError as e:
+            # 用戶端還原成 CircuitOpenError，批次佇列照樣等 retry_after 再試
+            self._send_json(503, {"error": str(e), "breaker": e.name, "retry_after": e.retry_after})
+        except Exception as e:
+            log.warning("%s 失敗：%s", self.path, e)
+            self._send_json(502, {"error": str(e)})
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    def _send(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        log.debug("%s %s", self.address_string(), fmt % args)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+class RemoteQuota:
+    """ 服務端的配額記帳（/quota 的結果），查詢方法同 quota.QuotaLedger，用戶端規劃搜尋與顯示用量時直接替換 """
+
+    def __init__(self, payload):
+        from datetime import datetime
+
+        self.daily_quota = payload["daily_quota"]
+        self.used = payload["used"]
+        self.rate = payload["burn_rate"]
+        self.eta = datetime.fromisoformat(payload["exhaustion"]) if payload.get("exhaustion") else None
+
+    def used_today(self):
+        return self.used
+
+    def remaining(self):
+        return max(self.daily_quota - self.used, 0)
+
+    def burn_rate(self, window=3600):
+        return self.rate
+
+    def projected_exhaustion(self, window=3600):
+        return self.eta
+
+
+class ServiceClient:
+    """ 網頁版 / 桌面版用的用戶端；回傳值與直接呼叫 trends / prompt_engine / video_analysis 相同 """
+
+    def __init__(self, base_url, timeout=CLIENT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, payload=None, timeout=None):
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={"Content-Type": "application/json"} if data else {})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.loads(e.read())
+            except ValueError:
+                raise ServiceError(f"趨勢服務錯誤 {e.code}", e.code) from None
+            if "retry_after" in error:
+                raise resilience.CircuitOpenError(error.get("breaker", "service"), error["retry_after"]) from None
+            raise ServiceError(error.get("error", f"趨勢服務錯誤 {e.code}"), e.code) from None
+        except urllib.error.URLError as e:
+            raise ServiceError(f"無法連線到趨勢服務 {self.base_url}：{e.reason}", 503) from None
+        return body if path == "/metrics" else json.loads(body)
+
+    def search(self, api_key, keywords, days, min_views, max_results, min_viral_score, max_duration, min_subs=0,
+               query_format="{}", video_duration=None, incremental=False, **score_kwargs):
+        """ 同 trends.fetch_trending_shorts（不支援 on_batch / on_progress / cancel，完成後一次回傳） """
+        payload = {"api_key": api_key, "keywords": keywords, "days": days, "min_views": min_views,
+                   "max_results": max_results, "min_viral_score": min_viral_score, "max_duration": max_duration,
+                   "min_subs": min_subs, "query_format": query_format, "video_duration": video_duration,
+                   "incremental": incremental, "score": score_kwargs}
+        return decode_frame(self._request("/search", payload))
+
+    def refresh(self, api_key, min_views, min_viral_score, max_duration, min_subs=0, **score_kwargs):
+        """ 同 trends.refresh_tracked """
+        payload = {"api_key": api_key, "min_views": min_views, "min_viral_score": min_viral_score,
+                   "max_duration": max_duration, "min_subs": min_subs, "score": score_kwargs}
+        return decode_frame(self._request("/refresh", payload))
+
+    def prompt(self, gemini_key, url, model=None):
+        """ 同 prompt_engine.generate_prompt_text（不串流） """
+        return self._request("/prompt", {"gemini_key": gemini_key, "url": url, "model": model})["text"]
+
+    def analyze(self, gemini_key, url, mode="video", media_settings=None, progress_callback=None):
+        """ 同 video_analysis.analyze_video；進度訊息在完成後一次回呼 """
+        result = self._request("/analyze", {"gemini_key": gemini_key, "url": url, "mode": mode,
+                                            "media_settings": media_settings})
+        for msg in result.get("log", []):
+            if progress_callback:
+                progress_callback(msg)
+        return result["text"]
+
+    def quota(self, api_key):
+        """ 服務端記帳的今日配額，回傳 RemoteQuota（查詢方法同 QuotaLedger） """
+        return RemoteQuota(self._request("/quota", {"api_key": api_key}, timeout=STATUS_TIMEOUT))
+
+    def clear_cache(self):
+        """ 清除服務端的搜尋快取與增量搜尋水位 """
+        return self._request("/cache/clear", {})
+
+    def health(self):
+        return self._request("/health", timeout=STATUS_TIMEOUT)
+
+    def stats(self):
+        return self._request("/stats", timeout=STATUS_TIMEOUT)
+
+
+def install_stub(latency=0.05, gemini_latency=0.5):
+    """ 上游換成假服務：所有 YouTube Key 共用同一個 FakeYouTube，Prompt 生成用 FakeGeminiBackend；回傳 (假 YouTube, backend 類別) """
+    import yt_client
+    from bench_fakes import FakeYouTube, FakeGeminiBackend, synthetic_video_items
+
+    fake = FakeYouTube(items=synthetic_video_items(5000), latency=latency)
+    factory = yt_client.get_default_factory()
+    factory.http_pool = yt_client.NullPool()
+    factory.builder = lambda api_key: fake
+
+    class StubGemini(FakeGeminiBackend):
+        def __init__(self, api_key=None):
+            super().__init__(api_key, latency=gemini_latency)
+
+    return fake, StubGemini
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ShortsAI 共用趨勢服務")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="對外服務請改 0.0.0.0（API Key 以明文傳送，建議只在內網使用）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--stub", action="store_true", help="上游改用離線假服務（測試用，不連網、不花配額）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    backend_cls = None
+    if args.stub:
+        backend_cls = install_stub()[1]
+        log.info("使用離線假服務（--stub）")
+    server = make_server(TrendService(backend_cls), args.host, args.port)
+    log.info("趨勢服務啟動：http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+趨勢搜尋流程（不依賴 Tkinter / Streamlit，桌面版、網頁版與背景排程共用）
+搜尋 → 詳細資料 → 觀看數快照 → 計分過濾 → 頻道訂閱數 → 觀看速度
+增量模式：每個關鍵字只搜上次之後發布的影片，已知候選影片只更新統計數字，合併後重新計分（見 sweep_store）
+googleapiclient / pandas 較重，第一次搜尋時才載入，不拖慢視窗啟動；client 每個 Key 只 build 一次（yt_client）
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import perf_metrics
+from quota import QuotaLedger, plan_queries, PAGE_SIZE
+from sweep_store import format_time, query_key
+from yt_cache import get_default_cache
+from yt_client import get_youtube
+
+
+def fetch_trending_shorts(api_key, keywords, days, min_views, max_results, min_viral_score, max_duration,
+                          min_subs=0, query_format="{}", video_duration=None, on_batch=None, on_progress=None,
+                          cancel=None, incremental=False, **score_kwargs):
+    """
+    keywords 可為清單或逗號分隔字串；score_kwargs 交給 scoring.score_videos（標題長度、時間格式、網址格式）
+    API 回應走本機快取、呼叫記入配額帳本、觀看數存入時間序列
+    min_subs：頻道訂閱數下限（訂閱數有效期限內存在本機，見 channel_store）
+    on_batch(部分結果 DataFrame)：每批詳細資料完成就先算分送出（未排序），最後回傳完整排序結果
+    on_progress(已完成批數, 總批數)；cancel（threading.Event）被設定時停止並回傳已取得的部分
+    以上回呼都在背景執行緒呼叫
+    incremental：有上次搜尋的水位時只搜新發布的影片，已知影片只打 videos().list(part=statistics)；取消時不推進水位
+    """
+    with perf_metrics.span("search.total"):
+        return _fetch_trending_shorts(api_key, keywords, days, min_views, max_results, min_viral_score, max_duration,
+                                      min_subs, query_format, video_duration, on_batch, on_progress, cancel,
+                                      incremental, **score_kwargs)
+
+
+def _fetch_trending_shorts(api_key, keywords, days, min_views, max_results, min_viral_score, max_duration, min_subs,
+                           query_format, video_duration, on_batch, on_progress, cancel, incremental, **score_kwargs):
+    from scoring import score_videos, empty_results
+    from velocity_store import get_default_store, add_velocity
+    from channel_store import add_channel_stats, get_default_store as get_channel_store
+    from yt_search import search_keywords, fetch_video_details
+
+    youtube = get_youtube(api_key)
+    cache = get_default_cache()
+    ledger = QuotaLedger(api_key)
+    store = get_default_store()
+    channels = get_channel_store()
+    # 同一個 now：搜尋起點、計分與增量水位都以它為準
+    now = datetime.now(timezone.utc)
+    window_start = now - timedelta(days=days)
+
+    search_params = {"part": "id", "type": "video", "order": "viewCount"}
+    if video_duration:
+        search_params["videoDuration"] = video_duration
+    if incremental:
+        from sweep_store import get_default_store as get_sweep_store
+
+        sweeps = get_sweep_store()
+        video_ids, matched, known, sweep_plan = _incremental_search(
+            youtube, sweeps, keywords, max_results, window_start, now, query_format, video_duration, cache, ledger,
+            cancel, search_params)
+    else:
+        video_ids, matched = search_keywords(youtube, keywords, max_results, query_format=query_format, cache=cache,
+                                             ledger=ledger, cancel=cancel, publishedAfter=format_time(window_start),
+                                             **search_params)
+        known = []
+    if not video_ids and not known:
+        if incremental and not (cancel and cancel.is_set()):
+            _record_sweeps(sweeps, sweep_plan, [], matched, window_start, now)   # 沒有結果也要推進水位
+        return add_velocity(add_channel_stats(empty_results(), channels, youtube), store)
+
+    total = -(-len(video_ids) // PAGE_SIZE) + -(-len(known) // PAGE_SIZE)
+    done = []
+
+    def score_batch(batch_items):
+        partial = score_videos(batch_items, min_views, min_viral_score, max_duration, now=now, matched=matched,
+                               **score_kwargs)
+        partial = add_channel_stats(partial, channels, youtube, ledger, min_subs)
+        if len(partial):
+            on_batch(add_velocity(partial, store))
+
+    def batch_done(batch_items, details=True):
+        store.record_items(batch_items)
+        done.append(len(batch_items))
+        if on_progress:
+            on_progress(len(done), total)
+        if on_batch and details:
+            score_batch(batch_items)
+
+    if on_progress:
+        on_progress(0, total)
+    items = fetch_video_details(youtube, video_ids, cache=cache, ledger=ledger, on_batch=batch_done, cancel=cancel)
+    if known:
+        # 已知影片只更新觀看數（不走快取），再用追蹤資料組回完整 items
+        refreshed = fetch_video_details(youtube, known, part="statistics", ledger=ledger, cancel=cancel,
+                                        on_batch=lambda batch_items: batch_done(batch_items, details=False))
+        known_items = store.tracked_items([item["id"] for item in refreshed])
+        if on_batch and known_items:
+            score_batch(known_items)
+        items = items + known_items
+    if incremental and not (cancel and cancel.is_set()):
+        _record_sweeps(sweeps, sweep_plan, items, matched, window_start, now)
+    with perf_metrics.span("search.scoring"):
+        results = score_videos(items, min_views, min_viral_score, max_duration, now=now, matched=matched,
+                               **score_kwargs)
+    results = add_channel_stats(results, channels, youtube, ledger, min_subs)
+    return add_velocity(results, store)
+
+
+def _incremental_search(youtube, sweeps, keywords, max_results, window_start, now, query_format, video_duration,
+                        cache, ledger, cancel, search_params):
+    """
+    每個關鍵字從自己的水位開始搜尋（起點相同的一起並行），再併入時間窗內的已知候選影片
+    回傳 (要查詳細資料的新影片 id, {影片 id: [關鍵字]}, 只需更新統計的已知影片 id, {關鍵字: (query, 是否增量)})
+    """
+    from yt_search import parse_keywords, search_keywords, KEYWORD_WORKERS
+
+    keywords = parse_keywords(keywords)
+    sweep_plan = {}
+    groups = {}
+    for keyword in keywords:
+        query = query_key(keyword, query_format, video_duration)
+        since, swept = sweeps.published_after(query, window_start, now)
+        sweep_plan[keyword] = (query, swept)
+        groups.setdefault(since, []).append(keyword)
+
+    def search(since, group):
+        return search_keywords(youtube, group, max_results, query_format=query_format, cache=cache, ledger=ledger,
+                               cancel=cancel, publishedAfter=format_time(since), **search_params)[1]
+
+    # 起點不同的各組同時送出，增量模式不會因為水位不同而多等幾輪
+    matched = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(groups), KEYWORD_WORKERS))) as pool:
+        for group_matched in list(pool.map(lambda g: search(*g), groups.items())):
+            for video_id, hits in group_matched.items():
+                matched.setdefault(video_id, []).extend(hits)
+
+    keyword_of = {query: keyword for keyword, (query, _) in sweep_plan.items()}
+    candidates = sweeps.candidates(list(keyword_of), window_start)
+    new_ids = [video_id for video_id in matched if video_id not in candidates]
+    for video_id, queries in candidates.items():
+        matched.setdefault(video_id, []).extend(keyword_of[q] for q in queries)
+    matched = {video_id: sorted(set(hits), key=keywords.index) for video_id, hits in matched.items()}
+    perf_metrics.increment("search.incremental.new", len(new_ids))
+    perf_metrics.increment("search.incremental.known", len(candidates))
+    return new_ids, matched, list(candidates), sweep_plan
+
+
+def _record_sweeps(sweeps, sweep_plan, items, matched, window_start, now):
+    """ 每個關鍵字存入這次找到的候選影片並推進水位 """
+    for keyword, (query, swept) in sweep_plan.items():
+        sweeps.record(query, [item for item in items if keyword in matched.get(item["id"], ())], window_start, now,
+                      swept)
+
+
+def refresh_tracked(api_key, min_views, min_viral_score, max_duration, min_subs=0, **score_kwargs):
+    """ 不重新搜尋，依剩餘配額更新追蹤影片的觀看數（每 50 部 1 單位），回傳依觀看速度排序的結果 """
+    from velocity_store import get_default_store, tracked_results
+    from channel_store import add_channel_stats, get_default_store as get_channel_store
+
+    store = get_default_store()
+    ledger = QuotaLedger(api_key)
+    tracked = store.tracked_ids()
+    plan = plan_queries(ledger.remaining(), [], 0, refresh_ids=len(tracked))
+    youtube = get_youtube(api_key)
+    store.refresh(youtube, tracked[:plan.refresh_batches * PAGE_SIZE], ledger=ledger)
+    results = tracked_results(store, min_views, min_viral_score, max_duration, **score_kwargs)
+    return add_channel_stats(results, get_channel_store(), youtube, ledger, min_subs)
@@ -0,0 +1,150 @@
+"""
+Gemini Files API 上傳紀錄（本機 SQLite）
+- 以檔案內容的 SHA-256 為 key，記住上傳後的檔名與到期時間
+- 同一個檔案再分析（換提示詞、換模型、換模式）時，直接重用還是 ACTIVE 的遠端檔案，
+  不用重新上傳、也不用再等 PROCESSING
+- 不在分析完立刻刪除；過期的自動失效，超過數量上限時刪掉最久沒用的
+- 上傳與查詢狀態的暫時性錯誤會退避重試；等 PROCESSING 有時限，不會永遠卡住
+"""
+import hashlib
+import os
+import time
+from datetime import datetime
+
+import resilience
+import storage
+
+MAX_FILES = 50
+FILE_TTL = 47 * 3600        # Files API 48 小時後自動刪除，留 1 小時緩衝
+EXPIRY_MARGIN = 600         # 快到期的不重用（分析途中過期會失敗）
+POLL_INTERVAL = 2
+POLL_MAX = 10               # 輪詢間隔逐次加倍，最多 10 秒
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _expires_at(video_file, now):
+    """ 遠端回傳的到期時間，沒有就用 FILE_TTL 估算 """
+    expiration = getattr(video_file, "expiration_time", None)
+    if isinstance(expiration, datetime):
+        return min(expiration.timestamp(), now + FILE_TTL)
+    return now + FILE_TTL
+
+
+class UploadRegistry:
+    def __init__(self, path=None, max_files=MAX_FILES):
+        self.path = path or storage.data_path(storage.DB_FILE)
+        self.max_files = max_files
+        self.uploads = 0
+        self.reused = 0
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS gemini_uploads (
+                key_id TEXT, sha256 TEXT, file_name TEXT, size INTEGER,
+                expires_at REAL, created REAL, accessed REAL, PRIMARY KEY (key_id, sha256))""")
+
+    def lookup(self, key, sha256):
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT file_name FROM gemini_uploads WHERE key_id = ? AND sha256 = ? AND expires_at > ?",
+                               (key, sha256, now + EXPIRY_MARGIN)).fetchone()
+            if row:
+                conn.execute("UPDATE gemini_uploads SET accessed = ? WHERE key_id = ? AND sha256 = ?",
+                             (now, key, sha256))
+        return row[0] if row else None
+
+    def remember(self, key, sha256, video_file, size):
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO gemini_uploads VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (key, sha256, video_file.name, size, _expires_at(video_file, now), now, now))
+
+    def forget(self, key, sha256):
+        with storage.connect(self.path) as conn:
+            conn.execute("DELETE FROM gemini_uploads WHERE key_id = ? AND sha256 = ?", (key, sha256))
+
+    def get_or_upload(self, client, key, path, mime_type="video/mp4"):
+        """
+        回傳 (ACTIVE 的遠端檔案, 這次上傳的位元組數)；重用時位元組數為 0
+        遠端檔案已不存在或處理失敗時重新上傳
+        """
+        sha256 = file_sha256(path)
+        name = self.lookup(key, sha256)
+        if name:
+            try:
+                video_file = wait_active(client, client.files.get(name=name))
+                self.reused += 1
+                return video_file, 0
+            except Exception:
+                self.forget(key, sha256)
+
+        def upload(timeout):
+            # 剩餘時限當作這次上傳的請求逾時（毫秒），卡住的上傳不會無限等待
+            with open(path, "rb") as f:
+                return client.files.upload(file=f, config={'mime_type': mime_type,
+                                                           'http_options': {'timeout': max(int(timeout * 1000), 1)}})
+
+        video_file = resilience.call(upload, "gemini.upload", deadline=resilience.DEADLINES["gemini.upload"],
+                                     pass_timeout=True, **resilience.GEMINI_RETRY)
+        size = os.path.getsize(path)
+        self.uploads += 1
+        self.remember(key, sha256, video_file, size)
+        self.evict(client, key)
+        return video_file, size
+
+    def evict(self, client, key):
+        """ 清掉過期的紀錄；同一個 Key 超過 max_files 時刪掉最久沒用的遠端檔案 """
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            conn.execute("DELETE FROM gemini_uploads WHERE expires_at <= ?", (now,))
+            stale = conn.execute("""SELECT sha256, file_name FROM gemini_uploads WHERE key_id = ?
+                ORDER BY accessed DESC LIMIT -1 OFFSET ?""", (key, self.max_files)).fetchall()
+        for sha256, name in stale:
+            try:
+                client.files.delete(name=name)
+            except Exception:
+                pass  # 遠端已經不在也沒關係
+            self.forget(key, sha256)
+
+    def stats(self):
+        with storage.connect(self.path) as conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM gemini_uploads WHERE expires_at > ?",
+                                       (time.time(),)).fetchone()
+        return {"files": count, "bytes": size, "uploads": self.uploads, "reused": self.reused}
+
+
+def _state(video_file):
+    state = getattr(video_file, "state", None)
+    return getattr(state, "name", state)   # google-genai 回傳 enum，舊版是字串
+
+
+def wait_active(client, video_file, timeout=resilience.DEADLINES["gemini.processing"]):
+    """ 等 PROCESSING 結束；FAILED 時丟出錯誤，超過 timeout 秒丟出 resilience.DeadlineExceeded """
+    deadline = time.monotonic() + timeout
+    interval = POLL_INTERVAL
+    while _state(video_file) == "PROCESSING":
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise resilience.DeadlineExceeded(f"Gemini 檔案處理超過 {timeout:.0f} 秒：{video_file.name}")
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, POLL_MAX)
+        video_file = resilience.call(lambda: client.files.get(name=video_file.name), "gemini.files",
+                                     deadline=max(deadline - time.monotonic(), 0), **resilience.GEMINI_RETRY)
+    if _state(video_file) == "FAILED":
+        raise RuntimeError(f"Gemini 檔案處理失敗：{video_file.name}")
+    return video_file
+
+
+_default_registry = None
+
+
+def get_default_registry():
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = UploadRegistry()
+    return _default_registry
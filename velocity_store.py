@@ -0,0 +1,191 @@
+"""
+觀看速度時間序列（本機 SQLite）
+- 每次取得 videos().list 結果就存一筆 (video_id, 時間, 觀看數, 按讚數) 快照
+- 更新模式只對追蹤中的影片打 videos().list(part=statistics)，50 個一批、每批 1 單位，不必重新搜尋
+- 依時間窗計算觀看速度（觀看數 / 小時）與加速度（速度變化 / 小時）
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+import storage
+from scoring import score_videos
+from yt_search import chunked, fetch_video_details
+
+DEFAULT_WINDOW_HOURS = 6
+TRACK_DAYS = 14          # 發布超過 14 天的影片不再追蹤
+MAX_REFRESH_IDS = 500    # 一次更新最多 500 部（10 單位）
+MIN_SNAPSHOT_GAP = 600   # 10 分鐘內觀看數沒變的快照視為快取重播，不重複記錄
+
+
+class VelocityStore:
+    def __init__(self, path=None):
+        self.path = path or storage.data_path(storage.DB_FILE)
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS video_snapshots (
+                video_id TEXT, ts REAL, views INTEGER, likes INTEGER)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS video_snapshots_id ON video_snapshots (video_id, ts)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS tracked_videos (
+                video_id TEXT PRIMARY KEY, title TEXT, channel_id TEXT, published_at TEXT,
+                duration TEXT, first_seen REAL, last_polled REAL)""")
+
+    def record_items(self, items, ts=None):
+        """ 存入 videos().list 的 items：有 snippet 的順便登記為追蹤影片 """
+        ts = ts or time.time()
+        last_views = self._recent_views(ts - MIN_SNAPSHOT_GAP)
+        snapshots = []
+        tracked = []
+        for item in items:
+            stats = item.get("statistics")
+            if stats is None:
+                continue
+            views = int(stats.get("viewCount", 0))
+            if last_views.get(item["id"]) != views:
+                snapshots.append((item["id"], ts, views, int(stats.get("likeCount", 0))))
+            snippet = item.get("snippet")
+            if snippet:
+                tracked.append((item["id"], snippet.get("title", ""), snippet.get("channelId", ""),
+                                snippet.get("publishedAt", ""),
+                                item.get("contentDetails", {}).get("duration", ""), ts, ts))
+        with storage.connect(self.path) as conn:
+            conn.executemany("INSERT INTO video_snapshots VALUES (?, ?, ?, ?)", snapshots)
+            conn.executemany("""INSERT INTO tracked_videos VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, last_polled = excluded.last_polled""",
+                             tracked)
+            conn.executemany("UPDATE tracked_videos SET last_polled = ? WHERE video_id = ?",
+                             [(ts, s[0]) for s in snapshots])
+        return len(snapshots)
+
+    def _recent_views(self, since):
+        with storage.connect(self.path) as conn:
+            rows = conn.execute("""SELECT video_id, views, MAX(ts) FROM video_snapshots
+                                   WHERE ts >= ? GROUP BY video_id""", (since,)).fetchall()
+        return {vid: views for vid, views, _ in rows}
+
+    def tracked_ids(self, max_age_days=TRACK_DAYS, limit=MAX_REFRESH_IDS):
+        """ 追蹤中的影片（發布未超過 max_age_days），最久沒更新的優先 """
+        cutoff = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - max_age_days * 86400))
+        with storage.connect(self.path) as conn:
+            rows = conn.execute("""SELECT video_id FROM tracked_videos WHERE published_at >= ?
+                                   ORDER BY last_polled LIMIT ?""", (cutoff, limit)).fetchall()
+        return [r[0] for r in rows]
+
+    def refresh(self, youtube, video_ids=None, ledger=None):
+        """ 只更新統計數字（part=statistics，每 50 部 1 單位），回傳更新的影片數 """
+        video_ids = video_ids if video_ids is not None else self.tracked_ids()
+        if not video_ids:
+            return 0
+        items = fetch_video_details(youtube, video_ids, part="statistics", ledger=ledger)
+        return self.record_items(items)
+
+    def tracked_items(self, video_ids=None):
+        """ 以追蹤資料 + 最新快照組出 videos().list 格式的 items，可直接交給 scoring.score_videos """
+        query = """SELECT t.video_id, t.title, t.channel_id, t.published_at, t.duration, s.views, s.likes
+            FROM tracked_videos t JOIN video_snapshots s ON s.video_id = t.video_id
+            WHERE s.ts = (SELECT MAX(ts) FROM video_snapshots WHERE video_id = t.video_id)"""
+        rows = []
+        with storage.connect(self.path) as conn:
+            if video_ids is None:
+                rows = conn.execute(query).fetchall()
+            else:
+                # 只查需要的影片，SQLite 參數數量有上限，分段查詢
+                for batch in chunked(list(dict.fromkeys(video_ids)), 500):
+                    rows += conn.execute(query + f" AND t.video_id IN ({','.join('?' * len(batch))})",
+                                         batch).fetchall()
+        return [{
+            "id": vid,
+            "snippet": {"title": title, "channelId": channel, "publishedAt": published},
+            "contentDetails": {"duration": duration},
+            "statistics": {"viewCount": views, "likeCount": likes},
+        } for vid, title, channel, published, duration, views, likes in rows]
+
+    def snapshots(self, video_ids=None, since=None):
+        query = "SELECT video_id, ts, views, likes FROM video_snapshots WHERE ts >= ?"
+        rows = []
+        with storage.connect(self.path) as conn:
+            if video_ids is None:
+                rows = conn.execute(query, (since or 0,)).fetchall()
+            else:
+                # SQLite 參數數量有上限，分段查詢
+                for batch in chunked(list(video_ids), 500):
+                    rows += conn.execute(query + f" AND video_id IN ({','.join('?' * len(batch))})",
+                                         [since or 0] + batch).fetchall()
+        df = pd.DataFrame(rows, columns=["video_id", "ts", "views", "likes"])
+        return df.sort_values(["video_id", "ts"], kind="stable").reset_index(drop=True)
+
+    def velocity(self, video_ids=None, window_hours=DEFAULT_WINDOW_HOURS, now=None):
+        """
+        每部影片：
+        velocity      最近 window_hours 內的觀看數 / 小時
+        acceleration  (最近一窗速度 - 前一窗速度) / window_hours，單位 觀看數 / 小時²
+        快照不足兩筆的窗口為 NaN
+        """
+        now = now or time.time()
+        window = window_hours * 3600
+        snaps = self.snapshots(video_ids, since=now - 2 * window)
+        if snaps.empty:
+            return pd.DataFrame(columns=["video_id", "views", "velocity", "acceleration", "snapshots"])
+
+        latest = snaps.groupby("video_id")["ts"].transform("max")
+        recent_mask = snaps["ts"] >= latest - window
+        previous_mask = (snaps["ts"] < latest - window) & (snaps["ts"] >= latest - 2 * window)
+
+        def window_rate(frame):
+            g = frame.groupby("video_id")
+            first, last = g.first(), g.last()
+            hours = (last["ts"] - first["ts"]) / 3600
+            return (last["views"] - first["views"]) / hours.where(hours > 0)
+
+        recent = window_rate(snaps[recent_mask])
+        # 前一窗的終點接到最近一窗的第一筆快照，兩窗首尾相接
+        boundary = snaps[recent_mask].groupby("video_id").head(1)
+        previous = window_rate(pd.concat([snaps[previous_mask], boundary]).sort_values(["video_id", "ts"]))
+
+        g = snaps.groupby("video_id")
+        result = pd.DataFrame({
+            "views": g["views"].last(),
+            "velocity": recent,
+            "acceleration": (recent - previous.reindex(recent.index)) / window_hours,
+            "snapshots": g.size(),
+        })
+        return result.replace([np.inf, -np.inf], np.nan).reset_index()
+
+    def prune(self, max_age_days=TRACK_DAYS * 2):
+        """ 刪除過舊的快照與不再追蹤的影片 """
+        cutoff = time.time() - max_age_days * 86400
+        with storage.connect(self.path) as conn:
+            conn.execute("DELETE FROM video_snapshots WHERE ts < ?", (cutoff,))
+            conn.execute("DELETE FROM tracked_videos WHERE last_polled < ?", (cutoff,))
+
+
+def add_velocity(results, store, window_hours=DEFAULT_WINDOW_HOURS):
+    """ 在搜尋結果 DataFrame 加上 velocity / acceleration 欄位 """
+    if results.empty:
+        return results.assign(velocity=pd.Series(dtype="float64"), acceleration=pd.Series(dtype="float64"))
+    stats = store.velocity(results["video_id"].tolist(), window_hours)
+    if stats.empty:
+        return results.assign(velocity=np.nan, acceleration=np.nan)
+    stats = stats.set_index("video_id")
+    return results.assign(
+        velocity=results["video_id"].map(stats["velocity"]).astype("float64").round(1).to_numpy(),
+        acceleration=results["video_id"].map(stats["acceleration"]).astype("float64").round(2).to_numpy(),
+    )
+
+
+def tracked_results(store, min_views=0, min_viral_score=0, max_duration=None, window_hours=DEFAULT_WINDOW_HOURS,
+                    **score_kwargs):
+    """ 以追蹤影片的最新統計重新計分（搭配 refresh 使用，不需重新搜尋），依觀看速度排序 """
+    results = score_videos(store.tracked_items(), min_views, min_viral_score, max_duration, **score_kwargs)
+    results = add_velocity(results, store, window_hours)
+    return results.sort_values(["velocity", "viral_score"], ascending=False, na_position="last").reset_index(drop=True)
+
+
+_default_store = None
+
+
+def get_default_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = VelocityStore()
+    return _default_store
@@ -0,0 +1,81 @@
+"""
+版本檢查：背景抓取 GitHub 上的 version.txt，結果存在本機（TTL 6 小時）
+啟動時只讀本機快取，不等網路；同一個行程只會抓一次
+"""
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+import storage
+
+VERSION_URL = "https://raw.githubusercontent.com/foreverjacky79/ShortsAI/refs/heads/main/version.txt"
+CACHE_FILE = "version_cache.json"
+CACHE_TTL = 6 * 3600
+
+_lock = threading.Lock()
+_future = None
+_future_started = 0.0
+
+
+def _read_cache():
+    try:
+        with open(storage.data_path(CACHE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def cached_version(default=None):
+    """ 立即回傳上次抓到的版本號（過期也沒關係），沒有就回傳 default """
+    return _read_cache().get("version") or default
+
+
+def fetch_latest_version(timeout=5):
+    """ 實際連網抓版本號並寫入本機快取 """
+    import requests  # 只有真的要連網時才載入
+
+    response = requests.get(VERSION_URL, timeout=timeout)
+    response.raise_for_status()
+    version = response.text.strip()
+    try:
+        with open(storage.data_path(CACHE_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": version, "fetched_at": time.time()}, f)
+    except OSError:
+        pass
+    return version
+
+
+def latest_version_async(max_age=CACHE_TTL):
+    """
+    回傳 Future：本機快取未過期就直接完成，否則在背景執行緒抓取（max_age 內整個行程共用同一次）
+    抓取失敗時結果為本機快取的舊值或 None，不會丟出例外
+    """
+    global _future, _future_started
+    with _lock:
+        if _future is not None and time.time() - _future_started < max_age:
+            return _future
+        _future = future = Future()
+        _future_started = time.time()
+
+    cache = _read_cache()
+    if cache.get("version") and time.time() - cache.get("fetched_at", 0) < max_age:
+        future.set_result(cache["version"])
+        return future
+
+    def worker():
+        try:
+            future.set_result(fetch_latest_version())
+        except Exception as e:
+            print(f"檢查更新失敗: {e}")
+            future.set_result(cache.get("version"))
+
+    threading.Thread(target=worker, daemon=True).start()
+    return future
+
+
+def is_newer(latest, current):
+    """ 以數字比較版本號（1.0.10 > 1.0.7） """
+    def parts(v):
+        return tuple(int(p) if p.isdigit() else 0 for p in (v or "").strip().split("."))
+    return parts(latest) > parts(current)
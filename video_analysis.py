@@ -0,0 +1,126 @@
+"""
+Gemini 影片分析（不依賴 Tkinter，桌面版與效能測試共用）
+兩種模式：
+- video：下載片段 → 縮小 → 上傳 Files API → 等 PROCESSING → 分析
+  （同一個檔案內容上傳過且還沒過期就直接重用，見 upload_registry）
+- keyframes：本機抽場景切換畫面，連同時間資訊以內嵌圖片一次送出，不經過 Files API
+"""
+import tempfile
+import time
+
+import media_prep
+import perf_metrics
+import prompt_cache
+import upload_registry
+from gemini_models import get_registry, GenAIBackend
+
+#PRIORITY_MODELS = ["gemini-2.0-flash-exp", "gemini-1.5-flash", "gemini-1.5-pro"]
+PRIORITY_MODELS = ["gemini-2.0-flash-exp"]
+PROMPT_INSTRUCTION = "請擔任專業影片分析師，觀察此影片並為 AI 影片生成模型 (如 Sora) 撰寫英文提示詞 (Prompt)。包含：主角特徵、動作、環境、鏡頭運動與光影氛圍。"
+KEYFRAME_INSTRUCTION = "以上是同一部短影片依時間順序擷取的關鍵畫面。" + PROMPT_INSTRUCTION + "請從畫面之間的變化推斷動作與鏡頭運動。"
+
+MODES = {"video": "完整影片", "keyframes": "關鍵畫格（較快）"}
+
+
+def get_gemini_registry(gemini_api_key):
+    return get_registry(GenAIBackend, gemini_api_key, PRIORITY_MODELS)
+
+
+def instruction_for(mode):
+    return KEYFRAME_INSTRUCTION if mode == "keyframes" else PROMPT_INSTRUCTION
+
+
+def generate(registry, contents, chunk_callback=None):
+    """ 模型失敗（下架、暫時錯誤）就依序換下一個；有 chunk_callback 時串流，回傳 (模型, 文字) """
+    if chunk_callback:
+        # 首字時間與總時間記在 registry.stats（依模型）
+        return registry.stream(contents, chunk_callback)[:2]
+    model, response = registry.generate(contents)
+    return model, response.text
+
+
+def upload_video(registry, path, stages):
+    """ 上傳到 Files API（內容相同且還有效就重用）並等到 PROCESSING 結束，時間記進 stages """
+    client = registry.backend.client
+    start = time.perf_counter()
+    video_file, uploaded = upload_registry.get_default_registry().get_or_upload(client, registry.key, path)
+    stages.append(media_prep.Stage("upload" if uploaded else "reuse", uploaded, time.perf_counter() - start))
+    perf_metrics.observe("gemini.upload" if uploaded else "gemini.reuse", stages[-1].seconds)
+
+    start = time.perf_counter()
+    video_file = upload_registry.wait_active(client, video_file)
+    stages.append(media_prep.Stage("processing", 0, time.perf_counter() - start))
+    perf_metrics.observe("gemini.processing", stages[-1].seconds)
+    return video_file
+
+
+def keyframe_contents(backend, frames, duration):
+    """ 每張畫面前面加一行時間，最後附上指示 """
+    contents = [f"影片長度約 {duration:.1f} 秒，共 {len(frames)} 張關鍵畫面："]
+    for t, data in frames:
+        contents.append(f"{t:.1f} 秒：")
+        contents.append(backend.image_part(data))
+    contents.append(KEYFRAME_INSTRUCTION)
+    return contents
+
+
+def cached_result(registry, video_url, mode):
+    """ 同一影片 + 指示 + 模型分析過就回傳 (模型, 文字)，否則 None """
+    target_model = registry.primary()
+    text = prompt_cache.get_default_cache().get(video_url, instruction_for(mode), target_model)
+    return None if text is None else (target_model, text)
+
+
+def prepare_stage(registry, video_url, mode, work_dir, media_settings=None):
+    """ 下載＋轉檔（video）或抽關鍵畫格（keyframes），回傳 (contents 或影片路徑, stages) """
+    if mode == "keyframes":
+        frames, duration, stages = media_prep.prepare_keyframes(video_url, work_dir, media_settings)
+        prepared = keyframe_contents(registry.backend, frames, duration)
+    else:
+        prepared, stages = media_prep.prepare_media(video_url, work_dir, media_settings)
+    for stage in stages:
+        if stage.name != "source":
+            perf_metrics.observe(f"media.{stage.name}", stage.seconds)
+    return prepared, stages
+
+
+def upload_stage(registry, prepared, mode, stages):
+    """ video 模式上傳並等處理完成，回傳 contents；keyframes 模式原樣通過 """
+    if mode == "keyframes":
+        return prepared
+    return [upload_video(registry, prepared, stages), PROMPT_INSTRUCTION]
+
+
+def generate_stage(registry, video_url, mode, contents, chunk_callback=None, use_cache=True):
+    """ 分析並寫入快取，回傳 (模型, 文字)；遠端檔案留著給下次重用，到期或超過上限才刪 """
+    target_model, text = generate(registry, contents, chunk_callback)
+    if use_cache:
+        prompt_cache.get_default_cache().put(video_url, instruction_for(mode), target_model, text)
+    return target_model, text
+
+
+def analyze_video(gemini_api_key, video_url, progress_callback, chunk_callback=None, mode="video",
+                  media_settings=None, use_cache=True):
+    """
+    分析一部影片（網址或本機檔案），回傳提示詞文字；錯誤直接拋出
+    同一影片 + 指示 + 模型分析過就直接用快取（use_cache=False 給效能測試用）
+    """
+    registry = get_gemini_registry(gemini_api_key)
+
+    # 各種網址形式統一成同一個影片 id 查快取
+    video_url = prompt_cache.canonical_url(video_url)
+    cached = cached_result(registry, video_url, mode) if use_cache else None
+    if cached is not None:
+        progress_callback(f"已分析過此影片，直接使用快取結果 ({cached[0]})")
+        return cached[1]
+
+    with tempfile.TemporaryDirectory(prefix="shortsai_") as work_dir:
+        progress_callback("正在下載影片片段...")
+        prepared, stages = prepare_stage(registry, video_url, mode, work_dir, media_settings)
+        if mode != "keyframes":
+            progress_callback(f"正在上傳至 Gemini ({registry.primary()})...")
+        contents = upload_stage(registry, prepared, mode, stages)
+        progress_callback(media_prep.format_stages(stages))
+
+    progress_callback("AI 正在分析內容...")
+    return generate_stage(registry, video_url, mode, contents, chunk_callback, use_cache)[1]
@@ -0,0 +1,178 @@
+"""
+背景排程（無視窗）：只載入搜尋／計分模組，不載入 Tkinter 與 Streamlit
+定時執行 config.json 裡的 watchlists，結果寫入本機資料庫（watch_results 表）
+
+    python watch_daemon.py                 # 依排程持續執行（Ctrl+C 或 SIGTERM 結束）
+    python watch_daemon.py --once          # 每個 watchlist 執行一次就結束
+    python watch_daemon.py --config /path/config.json --workers 2
+    python watch_daemon.py --metrics /var/lib/node_exporter/shortsai.prom   # 每輪結束輸出各階段耗時（.jsonl 則附加）
+
+config.json 範例（與桌面版共用同一個檔案）：
+{
+  "api_key": "...",
+  "watchlists": [
+    {"name": "animals", "keywords": "cat, dog", "days": 3, "min_views": 50000,
+     "max_results": 100, "min_viral_score": 2000, "max_duration": 30, "interval_minutes": 120},
+    {"name": "fast", "keywords": "cooking", "incremental": true, "interval_minutes": 15},
+    {"name": "tracked", "refresh_only": true, "interval_minutes": 30}
+  ]
+}
+未設定的欄位沿用 config.json 最外層的搜尋設定；YouTube API Key 也可用環境變數 YOUTUBE_API_KEY
+"incremental": true 只搜上次之後發布的影片、已知影片只更新觀看數，適合短間隔排程（見 sweep_store.py）
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import perf_metrics
+import storage
+import trends
+from quota import QuotaLedger, plan_queries
+from yt_search import parse_keywords
+
+log = logging.getLogger("watch_daemon")
+
+DEFAULT_INTERVAL_MINUTES = 60
+DEFAULT_WORKERS = 2
+# 與桌面版 default_config() 相同的預設搜尋條件
+SEARCH_DEFAULTS = {"days": 7, "min_views": 100000, "min_subs": 0, "max_results": 30, "min_viral_score": 3000, "max_duration": 20}
+
+
+def load_watchlists(cfg):
+    """ 補齊每個 watchlist 的預設值；沒有設定 watchlists 時用最外層的搜尋設定當作一個 """
+    watchlists = cfg.get("watchlists") or [{"name": "default", "keywords": cfg.get("keyword", "")}]
+    result = []
+    for i, watch in enumerate(watchlists):
+        watch = dict(watch)
+        watch.setdefault("name", f"watchlist-{i + 1}")
+        watch.setdefault("keywords", cfg.get("keyword", ""))
+        for key, default in SEARCH_DEFAULTS.items():
+            watch.setdefault(key, cfg.get(key, default))
+        watch.setdefault("interval_minutes", DEFAULT_INTERVAL_MINUTES)
+        result.append(watch)
+    return result
+
+
+class WatchResults:
+    """ 每次排程的結果（本機 SQLite） """
+
+    def __init__(self, path=None):
+        self.path = path or storage.data_path(storage.DB_FILE)
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS watch_results (
+                watchlist TEXT, run_ts REAL, video_id TEXT, title TEXT, views INTEGER,
+                viral_score REAL, velocity REAL, keywords TEXT, url TEXT)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS watch_results_run ON watch_results (watchlist, run_ts)")
+
+    def save(self, watchlist, results, run_ts=None):
+        run_ts = run_ts or time.time()
+        rows = [(watchlist, run_ts, r["video_id"], r["title"], int(r["views"]), float(r["viral_score"]),
+                 None if math.isnan(r["velocity"]) else float(r["velocity"]), r["keywords"], r["url"])
+                for r in results.to_dict("records")]
+        with storage.connect(self.path) as conn:
+            conn.executemany("INSERT INTO watch_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def latest(self, watchlist):
+        with storage.connect(self.path) as conn:
+            rows = conn.execute("""SELECT * FROM watch_results WHERE watchlist = ? AND run_ts =
+                (SELECT MAX(run_ts) FROM watch_results WHERE watchlist = ?) ORDER BY viral_score DESC""",
+                                (watchlist, watchlist)).fetchall()
+        return rows
+
+
+def run_watchlist(api_key, watch, results_store):
+    """ 執行一個 watchlist：依剩餘配額規劃 → 搜尋（或只更新追蹤影片）→ 寫入結果 """
+    name = watch["name"]
+    start = time.perf_counter()
+    if watch.get("refresh_only"):
+        results = trends.refresh_tracked(api_key, watch["min_views"], watch["min_viral_score"], watch["max_duration"],
+                                         min_subs=watch["min_subs"])
+    else:
+        keywords = parse_keywords(watch["keywords"])
+        plan = plan_queries(QuotaLedger(api_key).remaining(), keywords, watch["max_results"])
+        if not plan.keywords:
+            log.warning("[%s] 配額不足，略過本次", name)
+            return 0
+        results = trends.fetch_trending_shorts(
+            api_key, plan.keywords, watch["days"], watch["min_views"], plan.max_results,
+            watch["min_viral_score"], watch["max_duration"], min_subs=watch["min_subs"],
+            video_duration=watch.get("video_duration"), incremental=watch.get("incremental", False))
+    saved = results_store.save(name, results)
+    log.info("[%s] 完成：%d 筆，%.1f 秒", name, saved, time.perf_counter() - start)
+    return saved
+
+
+def run_schedule(api_key, watchlists, workers=DEFAULT_WORKERS, once=False, stop_event=None, metrics_path=None):
+    """
+    到期的 watchlist 丟進固定大小的執行緒池；同一個 watchlist 上一輪沒跑完不會重複執行
+    metrics_path：每個 watchlist 跑完就匯出一次各階段耗時（見 perf_metrics）
+    """
+    stop_event = stop_event or threading.Event()
+    results_store = WatchResults()
+    next_run = {w["name"]: 0.0 for w in watchlists}
+    running = {}
+
+    def safe_run(watch):
+        try:
+            return run_watchlist(api_key, watch, results_store)
+        except Exception:
+            log.exception("[%s] 執行失敗", watch["name"])
+            return 0
+        finally:
+            if metrics_path:
+                try:
+                    perf_metrics.get_default_metrics().export(metrics_path)
+                except OSError:
+                    log.exception("效能統計匯出失敗：%s", metrics_path)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while not stop_event.is_set():
+            now = time.time()
+            for watch in watchlists:
+                name = watch["name"]
+                if name in running and not running[name].done():
+                    continue
+                if now >= next_run[name]:
+                    running[name] = pool.submit(safe_run, watch)
+                    next_run[name] = now + watch["interval_minutes"] * 60
+            if once:
+                break
+            wait = min(next_run.values()) - time.time()
+            stop_event.wait(min(max(wait, 1), 60))
+    return {name: future.result() for name, future in running.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ShortsAI 背景趨勢排程")
+    parser.add_argument("--config", default=os.path.join(storage.get_base_path(), "config.json"))
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--once", action="store_true", help="每個 watchlist 執行一次就結束")
+    parser.add_argument("--metrics", help="各階段耗時輸出檔：.prom（Prometheus 文字格式）或 .jsonl")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    api_key = os.environ.get("YOUTUBE_API_KEY") or cfg.get("api_key", "")
+    if not api_key:
+        parser.error("缺少 YouTube API Key（config.json 的 api_key 或環境變數 YOUTUBE_API_KEY）")
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+    watchlists = load_watchlists(cfg)
+    log.info("啟動排程：%d 個 watchlist，%d 個 worker", len(watchlists), args.workers)
+    run_schedule(api_key, watchlists, args.workers, once=args.once, stop_event=stop_event,
+                 metrics_path=args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+YouTube API 回應的本機 SQLite 快取（網頁版與桌面版共用）
+- 以「正規化後的查詢參數」為 key，與 API Key 無關
+- search / videos / channels 各自有 TTL
+- 依總大小（LRU）與存放時間淘汰
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+
+import storage
+
+DEFAULT_TTL = {
+    "search": 3600,      # 搜尋結果變動慢：1 小時
+    "videos": 600,       # 觀看數變動快：10 分鐘
+    # 訂閱數平常由 channel_store 逐頻道保存（只查缺的頻道）；這裡只在 fetch_channels 明確傳入 cache 時使用，與它同為 24 小時
+    "channels": 24 * 3600,
+}
+MAX_AGE = 7 * 86400           # 超過 7 天一律刪除
+MAX_BYTES = 50 * 1024 * 1024  # 快取總大小上限 50MB
+
+
+def normalize_params(endpoint, params):
+    """ 查詢參數正規化：關鍵字轉小寫去多餘空白、publishedAfter 取整點、id 排序 """
+    params = {k: v for k, v in params.items() if k != "key" and v is not None}
+    if isinstance(params.get("q"), str):
+        params["q"] = re.sub(r"\s+", " ", params["q"]).strip().lower()
+    if isinstance(params.get("publishedAfter"), str):
+        # 2025-01-01T12:34:56Z → 2025-01-01T12:00:00Z，一小時內的重複搜尋可共用
+        params["publishedAfter"] = params["publishedAfter"][:13] + ":00:00Z"
+    return params
+
+
+def cache_key(endpoint, params):
+    if endpoint in ("videos", "channels") and "id" in params:
+        params = dict(params, id=",".join(sorted(params["id"].split(","))))
+    raw = json.dumps([endpoint, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ApiCache:
+    def __init__(self, path=None, ttl=None, max_age=MAX_AGE, max_bytes=MAX_BYTES):
+        self.path = path or storage.data_path(storage.DB_FILE)
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with storage.connect(self.path) as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS api_cache (
+                key TEXT PRIMARY KEY, endpoint TEXT, payload TEXT,
+                created REAL, accessed REAL, size INTEGER)""")
+
+    def get(self, endpoint, params):
+        key = cache_key(endpoint, normalize_params(endpoint, params))
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            row = conn.execute("SELECT payload, created FROM api_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl.get(endpoint, 0):
+                conn.execute("UPDATE api_cache SET accessed = ? WHERE key = ?", (now, key))
+                self._count(hit=True)
+                return json.loads(row[0])
+        self._count(hit=False)
+        return None
+
+    def put(self, endpoint, params, payload):
+        key = cache_key(endpoint, normalize_params(endpoint, params))
+        data = json.dumps(payload, ensure_ascii=False)
+        now = time.time()
+        with storage.connect(self.path) as conn:
+            conn.execute("INSERT OR REPLACE INTO api_cache VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, endpoint, data, now, now, len(data)))
+        self.evict()
+
+    def fetch(self, endpoint, params, fetcher):
+        """ 有快取就回傳快取，否則呼叫 fetcher(正規化參數) 並寫入快取 """
+        params = normalize_params(endpoint, params)
+        payload = self.get(endpoint, params)
+        if payload is None:
+            payload = fetcher(params)
+            self.put(endpoint, params, payload)
+        return payload
+
+    def evict(self):
+        """ 刪除過舊項目，總大小超過上限時從最久沒用的開始刪 """
+        with storage.connect(self.path) as conn:
+            conn.execute("DELETE FROM api_cache WHERE created < ?", (time.time() - self.max_age,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM api_cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, size in conn.execute("SELECT key, size FROM api_cache ORDER BY accessed").fetchall():
+                conn.execute("DELETE FROM api_cache WHERE key = ?", (key,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with storage.connect(self.path) as conn:
+            conn.execute("DELETE FROM api_cache")
+
+    def stats(self):
+        with storage.connect(self.path) as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM api_cache").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """ 整個行程共用一個快取物件 """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ApiCache()
+    return _default_cache
@@ -0,0 +1,122 @@
+"""
+YouTube API client 共用
+- 每個 API Key 只 build 一次（使用套件內建的 discovery 文件，不連網下載），之後的搜尋直接重用
+- httplib2.Http 不是執行緒安全的：放在連線池裡，一次借給一條執行緒，用完歸還；
+  連線保持 keep-alive，下一次搜尋（即使是新的執行緒）也能沿用，不必重新 TLS 握手
+- 記錄 build 花的時間與重用次數，估算每次搜尋省下的時間
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import perf_metrics
+from quota import key_id
+
+HTTP_POOL_SIZE = 8
+HTTP_TIMEOUT = 30
+
+
+class HttpPool:
+    def __init__(self, size=HTTP_POOL_SIZE, timeout=HTTP_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self.reused = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """ 借一個 httplib2.Http；池子空了就新建，歸還時超過上限的丟掉，執行出錯的不歸還 """
+        with self._lock:
+            http = self._idle.pop() if self._idle else None
+            if http is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if http is None:
+            import httplib2  # googleapiclient 的相依套件，用到時才載入
+            http = httplib2.Http(timeout=self.timeout)
+        # 只有成功時才歸還：出錯的連線可能停在讀到一半的回應，直接丟掉，下次借用時新建
+        yield http
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(http)
+
+
+class NullPool:
+    """ 不提供連線（request.execute(http=None)），給不需要 httplib2 的假 client 用（benchmark、趨勢服務 --stub） """
+    created = 0
+    reused = 0
+
+    @contextmanager
+    def connection(self):
+        yield None
+
+
+class ClientFactory:
+    def __init__(self, http_pool=None, builder=None):
+        self.http_pool = http_pool or HttpPool()
+        self.builder = builder or build_client   # 趨勢服務的 --stub 模式換成假 client
+        self.clients = {}
+        self.build_seconds = 0.0
+        self.builds = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+
+    def get(self, api_key):
+        """ 同一個 Key 重用同一個 client（Resource 物件可以跨執行緒共用，HTTP 連線另外由連線池提供） """
+        cache_key = key_id(api_key)
+        with self._lock:
+            client = self.clients.get(cache_key)
+            if client is not None:
+                self.reused += 1
+                return client
+            start = time.perf_counter()
+            client = self.clients[cache_key] = self.builder(api_key)
+            elapsed = time.perf_counter() - start
+            self.build_seconds += elapsed
+            perf_metrics.observe("yt.build", elapsed)
+            self.builds += 1
+            return client
+
+    def execute(self, request):
+        """ 用連線池裡的連線執行 googleapiclient 的 request """
+        with self.http_pool.connection() as http:
+            return request.execute(http=http)
+
+    def stats(self):
+        avg_build = self.build_seconds / self.builds if self.builds else 0.0
+        return {"clients": len(self.clients), "builds": self.builds, "reused": self.reused,
+                "avg_build_s": round(avg_build, 4), "saved_s": round(avg_build * self.reused, 3),
+                "http_created": self.http_pool.created, "http_reused": self.http_pool.reused}
+
+
+def build_client(api_key):
+    """ 用套件內建的 discovery 文件 build，不連網；舊版 googleapiclient 沒有 static_discovery 參數 """
+    from googleapiclient.discovery import build
+
+    try:
+        return build("youtube", "v3", developerKey=api_key, static_discovery=True, cache_discovery=False)
+    except TypeError:
+        return build("youtube", "v3", developerKey=api_key)
+
+
+_default_factory = None
+_default_lock = threading.Lock()
+
+
+def get_default_factory():
+    global _default_factory
+    with _default_lock:
+        if _default_factory is None:
+            _default_factory = ClientFactory()
+        return _default_factory
+
+
+def get_youtube(api_key):
+    return get_default_factory().get(api_key)
+
+
+def execute(request):
+    return get_default_factory().execute(request)
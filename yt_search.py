@@ -0,0 +1,170 @@
+"""
+YouTube 搜尋引擎（app.py 與 ShortWithGeminiPrompt.py 共用）
+- search().list 依 nextPageToken 翻頁，直到湊滿目標數量
+- videos().list 以 50 個 id 為一批，多批並行查詢
+- 多關鍵字並行搜尋，合併去重後才查詳細資料
+- channels().list 同樣 50 個 id 一批（頻道訂閱數，見 channel_store）
+- HTTP 連線由 yt_client 的連線池提供（執行緒安全、keep-alive）
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import perf_metrics
+import quota
+import resilience
+import yt_client
+
+SEARCH_PAGE_SIZE = 50    # search().list 單頁上限
+VIDEOS_BATCH_SIZE = 50   # videos().list 單次最多 50 個 id
+DETAIL_WORKERS = 4       # 詳細資料並行批次數
+KEYWORD_WORKERS = 4      # 關鍵字並行搜尋數
+CHANNELS_BATCH_SIZE = 50  # channels().list 單次最多 50 個 id
+VIDEO_PARTS = "snippet,statistics,contentDetails"
+
+def chunked(seq, size):
+    """ 將清單切成每段 size 個 """
+    return [seq[i:i + size] for i in range(0, len(seq), size)]
+
+
+def _execute(cache, endpoint, params, fetcher, ledger=None):
+    """
+    有傳入 cache（yt_cache.ApiCache）時先查快取；真正打到 API 才記入 ledger（quota.QuotaLedger）與耗時統計
+    暫時性錯誤（5xx、逾時）抖動退避重試；同一個 Key 的配額用完就斷路到配額重置（見 resilience）
+    """
+    breaker = resilience.get_breaker(f"youtube:{ledger.key}" if ledger is not None else "youtube")
+
+    def call(p):
+        try:
+            with perf_metrics.span(f"yt.{endpoint}"):
+                response = resilience.call(lambda: fetcher(p), f"yt.{endpoint}", breaker=breaker,
+                                           deadline=resilience.DEADLINES["youtube"], **resilience.YOUTUBE_RETRY)
+        except Exception as e:
+            if quota.is_quota_error(e):
+                breaker.trip(quota.next_reset().timestamp())
+                if ledger is not None:
+                    ledger.mark_exhausted()
+            raise
+        if ledger is not None:
+            ledger.record(endpoint)
+        return response
+
+    if cache is None:
+        return call(params)
+    return cache.fetch(endpoint, params, call)
+
+
+def search_video_ids(youtube, target_results, cache=None, ledger=None, cancel=None, **search_params):
+    """
+    依 nextPageToken 翻頁搜尋，回傳最多 target_results 個不重複的影片 id
+    cancel（threading.Event）被設定時不再翻下一頁
+    """
+    video_ids = []
+    seen = set()
+    page_token = None
+    page_size = max(1, min(SEARCH_PAGE_SIZE, target_results))
+
+    while len(video_ids) < target_results and not (cancel and cancel.is_set()):
+        params = dict(search_params, maxResults=page_size)
+        if page_token:
+            params["pageToken"] = page_token
+        response = _execute(cache, "search", params, lambda p: yt_client.execute(youtube.search().list(**p)), ledger)
+
+        for item in response.get("items", []):
+            video_id = item.get("id", {}).get("videoId")
+            if video_id and video_id not in seen:
+                seen.add(video_id)
+                video_ids.append(video_id)
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+
+    return video_ids[:target_results]
+
+
+def fetch_video_details(youtube, video_ids, part=VIDEO_PARTS, max_workers=DETAIL_WORKERS, cache=None,
+                        ledger=None, on_batch=None, cancel=None):
+    """
+    以 50 個 id 一批查詢 videos().list，多批時並行執行，回傳順序與 video_ids 一致
+    on_batch(items) 在每批完成時呼叫（背景執行緒）；cancel 被設定後還沒開始的批次直接略過
+    """
+    batches = chunked(list(video_ids), VIDEOS_BATCH_SIZE)
+    if not batches:
+        return []
+
+    def fetch(batch):
+        if cancel and cancel.is_set():
+            return []
+        params = {"part": part, "id": ",".join(batch)}
+        response = _execute(cache, "videos", params,
+                            lambda p: yt_client.execute(youtube.videos().list(**p)), ledger)
+        items = response.get("items", [])
+        if on_batch:
+            on_batch(items)
+        return items
+
+    if len(batches) == 1:
+        return fetch(batches[0])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        pages = list(pool.map(fetch, batches))
+    return [item for items in pages for item in items]
+
+
+def fetch_channels(youtube, channel_ids, part="statistics", max_workers=DETAIL_WORKERS, cache=None, ledger=None):
+    """ 以 50 個 id 一批查詢 channels().list（每批 1 單位），多批時並行執行 """
+    batches = chunked(list(channel_ids), CHANNELS_BATCH_SIZE)
+    if not batches:
+        return []
+
+    def fetch(batch):
+        params = {"part": part, "id": ",".join(batch)}
+        response = _execute(cache, "channels", params,
+                            lambda p: yt_client.execute(youtube.channels().list(**p)), ledger)
+        return response.get("items", [])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+        pages = list(pool.map(fetch, batches))
+    return [item for items in pages for item in items]
+
+
+def parse_keywords(text):
+    """ "cat, dog、cooking，dance" → ["cat", "dog", "cooking", "dance"]（去除重複與空白） """
+    if isinstance(text, (list, tuple)):
+        parts = text
+    else:
+        parts = re.split(r"[,，、;\n]", text or "")
+    keywords = []
+    for part in parts:
+        part = part.strip()
+        if part and part.lower() not in (k.lower() for k in keywords):
+            keywords.append(part)
+    return keywords
+
+
+def search_keywords(youtube, keywords, target_results, query_format="{}", max_workers=KEYWORD_WORKERS,
+                    cache=None, ledger=None, cancel=None, **search_params):
+    """
+    多關鍵字並行搜尋，每個關鍵字最多 target_results 筆
+    回傳 (去重後的影片 id 清單, {影片 id: [命中的關鍵字]})
+    """
+    keywords = parse_keywords(keywords)
+    if not keywords:
+        return [], {}
+
+    def search(keyword):
+        return search_video_ids(youtube, target_results, cache=cache, ledger=ledger, cancel=cancel,
+                                q=query_format.format(keyword), **search_params)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(keywords)))) as pool:
+        id_lists = list(pool.map(search, keywords))
+
+    video_ids = []
+    matched = {}
+    for keyword, ids in zip(keywords, id_lists):
+        for video_id in ids:
+            if video_id not in matched:
+                matched[video_id] = []
+                video_ids.append(video_id)
+            matched[video_id].append(keyword)
+    return video_ids, matched